@@ -1,14 +1,16 @@
 # coding=utf-8
 
 from django.contrib import admin
-from djangovirtualpos.models import VirtualPointOfSale, VPOSRefundOperation, VPOSCeca, VPOSRedsys, VPOSSantanderElavon, VPOSPaypal, VPOSBitpay
+from djangovirtualpos.models import VirtualPointOfSale, VPOSRefundOperation, VPOSCeca, VPOSRedsys, VPOSSantanderElavon, VPOSPaypal, VPOSPaypalRest, VPOSBitpay, is_enabled_vpos_type
 
 admin.site.register(VirtualPointOfSale)
 admin.site.register(VPOSRefundOperation)
-admin.site.register(VPOSCeca)
-admin.site.register(VPOSRedsys)
-admin.site.register(VPOSPaypal)
-admin.site.register(VPOSSantanderElavon)
-admin.site.register(VPOSBitpay)
+
+# Sólo se administran las pasarelas habilitadas (VPOS_ENABLED_TYPES)
+for virtualpos_type, delegated_class in (("ceca", VPOSCeca), ("redsys", VPOSRedsys), ("paypal", VPOSPaypal),
+                                         ("paypalrest", VPOSPaypalRest), ("santanderelavon", VPOSSantanderElavon),
+                                         ("bitpay", VPOSBitpay)):
+    if is_enabled_vpos_type(virtualpos_type):
+        admin.site.register(delegated_class)
 
 
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.apps import AppConfig
+
+
+class DjangoVirtualPOSConfig(AppConfig):
+    name = "djangovirtualpos"
+    verbose_name = "Django Virtual POS"
+
+    def ready(self):
+        # Registros precalculados (tipo de TPV -> clase delegada) que usan las búsquedas de cada petición
+        from djangovirtualpos.models import build_registries
+        build_registries()
+        # Redes IP permitidas en la URL de confirmación, compiladas para búsquedas binarias
+        from djangovirtualpos.ipfilter import build_ip_filters
+        build_ip_filters()
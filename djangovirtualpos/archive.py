@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import gzip
+import os
+import zlib
+
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSPaymentOperation, VPOSRefundOperation, VPOSPaymentPayload, \
+    VPOSArchivedOperation
+
+########################################################################################################################
+########################################################################################################################
+############################################ Archivado de operaciones de pago ##########################################
+########################################################################################################################
+########################################################################################################################
+
+# Antigüedad (en días) a partir de la cual se archivan las operaciones finalizadas
+ARCHIVE_AFTER_DAYS = getattr(settings, "VPOS_ARCHIVE_AFTER_DAYS", 365)
+
+# Número de operaciones que se archivan en cada transacción
+ARCHIVE_BATCH_SIZE = getattr(settings, "VPOS_ARCHIVE_BATCH_SIZE", 500)
+
+# Directorio en el que se escriben los ficheros JSONL comprimidos.
+# Si es None, las operaciones se guardan comprimidas en la tabla VPOSArchivedOperation.
+ARCHIVE_PATH = getattr(settings, "VPOS_ARCHIVE_PATH", None)
+
+# Estados finales: las operaciones en estos estados ya no van a cambiar
+ARCHIVABLE_STATUSES = ("completed", "failed", "completely_refunded", "expired", "released")
+
+
+####################################################################
+## Serialización de una operación
+def _serialize_operation(operation, refunds, payloads):
+    """
+    Serializa la operación, sus devoluciones y sus mensajes de pasarela en una única línea JSON
+    (formato de serialización de Django, que luego permite reconstruir los objetos).
+    """
+    return serializers.serialize("json", [operation] + refunds + payloads)
+
+
+def _archive_file_path(archive_path, first_operation_id):
+    file_name = "vpos-archive-{0}-{1}.jsonl.gz".format(timezone.now().strftime("%Y%m%d%H%M%S"), first_operation_id)
+    return os.path.join(archive_path, file_name)
+
+
+####################################################################
+## Archivado de un lote de operaciones
+def archive_batch(operation_ids, archive_path=None):
+    """
+    Archiva un lote de operaciones: crea sus índices en VPOSArchivedOperation y elimina
+    de las tablas de operaciones la operación, sus devoluciones y sus mensajes de pasarela.
+    Todo el lote se procesa en una única transacción, con las operaciones y sus devoluciones bloqueadas
+    desde que se leen hasta que se eliminan. Las operaciones que ya no están en un estado final se saltan.
+    :param operation_ids: identificadores de las operaciones a archivar.
+    :param archive_path: directorio de los ficheros JSONL. Si es None se archivan en BD.
+    :return: número de operaciones archivadas
+    """
+    with transaction.atomic():
+        # Las operaciones bloqueadas no pueden cambiar de estado ni recibir devoluciones o mensajes nuevos
+        # hasta que termine la transacción
+        operations = list(VPOSPaymentOperation.objects.select_for_update().filter(
+            id__in=operation_ids, status__in=ARCHIVABLE_STATUSES).order_by("id"))
+        if not operations:
+            return 0
+        locked_operation_ids = [operation.id for operation in operations]
+
+        # Devoluciones y mensajes de todo el lote con una consulta para cada tipo
+        refunds_by_operation = {}
+        for refund in VPOSRefundOperation.objects.select_for_update().filter(
+                payment_id__in=locked_operation_ids).order_by("id"):
+            refunds_by_operation.setdefault(refund.payment_id, []).append(refund)
+        payloads_by_operation = {}
+        for payload in VPOSPaymentPayload.objects.filter(operation_id__in=locked_operation_ids).order_by("id"):
+            payloads_by_operation.setdefault(payload.operation_id, []).append(payload)
+
+        archived_datetime = timezone.now()
+        file_path = None
+        if archive_path:
+            file_path = _archive_file_path(archive_path, operations[0].id)
+            archive_file = gzip.open(file_path, "wb")
+
+        archived_operations = []
+        try:
+            for file_line, operation in enumerate(operations):
+                serialized_objects = _serialize_operation(
+                    operation,
+                    refunds_by_operation.get(operation.id, []),
+                    payloads_by_operation.get(operation.id, [])
+                ).encode("utf-8")
+
+                archived_operation = VPOSArchivedOperation(
+                    operation_id=operation.id,
+                    operation_number=operation.operation_number,
+                    sale_code=operation.sale_code,
+                    confirmation_code=operation.confirmation_code,
+                    type=operation.type,
+                    status=operation.status,
+                    amount=operation.amount,
+                    creation_datetime=operation.creation_datetime,
+                    archived_datetime=archived_datetime,
+                )
+                if file_path:
+                    archive_file.write(serialized_objects + b"\n")
+                    archived_operation.file_path = file_path
+                    archived_operation.file_line = file_line
+                else:
+                    archived_operation.data = zlib.compress(serialized_objects)
+                archived_operations.append(archived_operation)
+        finally:
+            if file_path:
+                archive_file.close()
+
+        # Si falla la transacción las operaciones siguen en su tabla
+        # y el fichero, que no está referenciado, se puede eliminar
+        VPOSArchivedOperation.objects.bulk_create(archived_operations)
+        VPOSPaymentPayload.objects.filter(operation_id__in=locked_operation_ids).delete()
+        VPOSRefundOperation.objects.filter(payment_id__in=locked_operation_ids).delete()
+        VPOSPaymentOperation.objects.filter(id__in=locked_operation_ids).delete()
+
+    dlprint(u"Archivadas {0} operaciones{1}".format(len(operations), u" en {0}".format(file_path) if file_path else u""))
+    return len(operations)
+
+
+####################################################################
+## Archivado de todas las operaciones antiguas
+def archive_operations(before=None, batch_size=None, archive_path=None, limit=None):
+    """
+    Archiva por lotes las operaciones en estado final creadas antes de "before".
+    :param before: datetime. Por defecto, hace ARCHIVE_AFTER_DAYS días.
+    :param batch_size: operaciones por lote (y por fichero, si se archiva en disco).
+    :param archive_path: directorio de los ficheros JSONL. Por defecto ARCHIVE_PATH (None archiva en BD).
+    :param limit: número máximo de operaciones a archivar en esta ejecución.
+    :return: número de operaciones archivadas
+    """
+    if before is None:
+        before = timezone.now() - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    if batch_size is None:
+        batch_size = ARCHIVE_BATCH_SIZE
+    if archive_path is None:
+        archive_path = ARCHIVE_PATH
+
+    archivable_operations = VPOSPaymentOperation.objects.filter(
+        status__in=ARCHIVABLE_STATUSES,
+        creation_datetime__lt=before
+    ).order_by("id")
+
+    archived = 0
+    last_id = 0
+    while limit is None or archived < limit:
+        size = batch_size if limit is None else min(batch_size, limit - archived)
+        operation_ids = list(archivable_operations.filter(id__gt=last_id).values_list("id", flat=True)[:size])
+        if not operation_ids:
+            break
+        archived += archive_batch(operation_ids, archive_path=archive_path)
+        last_id = operation_ids[-1]
+
+    return archived
+
+
+####################################################################
+## Consultas sobre operaciones activas y archivadas
+def find_operations(operation_number=None, sale_code=None, vpos_type=None):
+    """
+    Busca operaciones de pago tanto en la tabla de operaciones como en el archivo.
+    Las operaciones archivadas se devuelven reconstruidas (ver VPOSArchivedOperation.operation),
+    con el atributo is_archived a True.
+    :return: lista de VPOSPaymentOperation
+    """
+    if operation_number is None and sale_code is None:
+        raise ValueError(u"Hay que indicar el número de operación o el código de la venta")
+
+    filters = {}
+    if operation_number is not None:
+        filters["operation_number"] = operation_number
+    if sale_code is not None:
+        filters["sale_code"] = sale_code
+    if vpos_type is not None:
+        filters["type"] = vpos_type
+
+    operations = list(VPOSPaymentOperation.objects.filter(**filters).order_by("id"))
+
+    for archived_operation in VPOSArchivedOperation.objects.filter(**filters).order_by("operation_id"):
+        operations.append(archived_operation.operation)
+
+    return operations
+
+
+def find_operation(operation_number=None, sale_code=None, vpos_type=None):
+    """
+    Devuelve la última operación (activa o archivada) que cumple los criterios o None si no hay ninguna.
+    """
+    operations = find_operations(operation_number=operation_number, sale_code=sale_code, vpos_type=vpos_type)
+    if not operations:
+        return None
+    return max(operations, key=lambda operation: operation.id)
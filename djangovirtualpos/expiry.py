@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSPaymentOperation, VPOS_TYPES, get_pending_ttl
+
+########################################################################################################################
+########################################################################################################################
+######################################## Caducidad de operaciones pendientes ###########################################
+########################################################################################################################
+########################################################################################################################
+
+# Número máximo de operaciones que se actualizan en cada sentencia UPDATE.
+# Cada lote se actualiza en su propia sentencia para no bloquear la tabla durante mucho tiempo.
+EXPIRY_BATCH_SIZE = getattr(settings, "VPOS_EXPIRY_BATCH_SIZE", 1000)
+
+# Minutos de margen tras la fecha de caducidad propia de la operación (invoices de Bitpay) antes de marcarla
+# como caducada: la notificación de un pago hecho justo antes de esa fecha puede llegar un poco después.
+EXPIRATION_GRACE = datetime.timedelta(minutes=getattr(settings, "VPOS_EXPIRATION_GRACE", 60))
+
+
+def _expire_in_batches(pending_operations, order_field, batch_size, now):
+    """
+    Marca como caducadas las operaciones pendientes del queryset en lotes de batch_size.
+    Los identificadores de cada lote se obtienen recorriendo el índice (status, order_field).
+    :return: número de operaciones caducadas
+    """
+    expired = 0
+    while True:
+        operation_ids = list(pending_operations.order_by(order_field).values_list("id", flat=True)[:batch_size])
+        if not operation_ids:
+            break
+        # Se vuelve a comprobar el estado por si alguna se ha confirmado entre la consulta y la actualización
+        expired += VPOSPaymentOperation.bulk_update_status(operation_ids, "pending", "expired", now=now)
+        if len(operation_ids) < batch_size:
+            break
+    return expired
+
+
+####################################################################
+## Caducidad de operaciones pendientes
+def expire_pending_operations(virtualpos_types=None, batch_size=None, now=None):
+    """
+    Marca como caducadas ("expired") las operaciones que siguen pendientes pasado su tiempo de vida.
+    - Las operaciones con fecha de caducidad propia (invoices de Bitpay) caducan EXPIRATION_GRACE después
+      de esa fecha.
+    - El resto, cuando han pasado más minutos que los indicados para su tipo de TPV en VPOS_PENDING_TTL.
+    Pensada para ejecutarse periódicamente (ver el comando vpos_expire_pending).
+    :param virtualpos_types: tipos de TPV a tratar. Por defecto todos.
+    :param batch_size: número máximo de operaciones por UPDATE.
+    :return: dict tipo de TPV -> número de operaciones caducadas
+    """
+    if virtualpos_types is None:
+        virtualpos_types = [virtualpos_type for virtualpos_type, _name in VPOS_TYPES]
+    if batch_size is None:
+        batch_size = EXPIRY_BATCH_SIZE
+    if now is None:
+        now = timezone.now()
+
+    expired = {}
+    for virtualpos_type in virtualpos_types:
+        pending_operations = VPOSPaymentOperation.objects.filter(status="pending", type=virtualpos_type)
+
+        # Operaciones con fecha de caducidad propia, pasado el margen para las notificaciones que llegan tarde
+        expired[virtualpos_type] = _expire_in_batches(
+            pending_operations.filter(expiration_datetime__lt=now - EXPIRATION_GRACE), "expiration_datetime",
+            batch_size, now
+        )
+
+        # Operaciones sin fecha de caducidad cuyo tiempo de vida ha pasado
+        expired[virtualpos_type] += _expire_in_batches(
+            pending_operations.filter(expiration_datetime__isnull=True,
+                                      creation_datetime__lt=now - get_pending_ttl(virtualpos_type)),
+            "creation_datetime", batch_size, now
+        )
+
+        if expired[virtualpos_type]:
+            dlprint(u"Caducadas {0} operaciones pendientes de {1}".format(expired[virtualpos_type], virtualpos_type))
+
+    return expired
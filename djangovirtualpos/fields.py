@@ -39,5 +39,5 @@ class VPOSField(ModelMultipleChoiceField):
                 "-type__count")
             if count[0]["type__count"] > 1:
                 raise forms.ValidationError("Asegúrese de no seleccionar más de un TPV del tipo '{0}'".format(
-                    dict(models.VPOS_TYPES)[count[0]["type"]]))
+                    models.VPOS_TYPE_LABELS[count[0]["type"]]))
         return super(VPOSField, self).clean(value)
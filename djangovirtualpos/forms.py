@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from django import forms
-from models import VPOSCeca, VPOSRedsys, VPOSPaypal, VPOSSantanderElavon
+from models import VPOSCeca, VPOSRedsys, VPOSPaypal, VPOSPaypalRest, VPOSSantanderElavon
 
 from django.conf import settings
 from models import VPOS_TYPES
@@ -49,6 +49,14 @@ class VPOSPaypalForm(TrimForm):
         exclude = ("type", "is_erased")
 
 
+class VPOSPaypalRestForm(TrimForm):
+    """Formulario para el modelo TpvPaypalRest."""
+
+    class Meta:
+        model = VPOSPaypalRest
+        exclude = ("type", "is_erased")
+
+
 class VPOSSantanderElavonForm(TrimForm):
     """Formulario para el modelo TpvSantanderElavon."""
 
@@ -63,6 +71,7 @@ VPOS_FORMS = {
     "ceca": VPOSCecaForm,
     "redsys": VPOSRedsysForm,
     "paypal": VPOSPaypalForm,
+    "paypalrest": VPOSPaypalRestForm,
     "santanderelavon": VPOSSantanderElavonForm
 }
 
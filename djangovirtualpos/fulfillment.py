@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import traceback
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSFulfillmentJob
+
+########################################################################################################################
+########################################################################################################################
+############################################ Confirmación diferida de ventas ###########################################
+########################################################################################################################
+########################################################################################################################
+
+# Número máximo de intentos de cada trabajo antes de marcarlo como fallido
+FULFILLMENT_MAX_ATTEMPTS = getattr(settings, "VPOS_FULFILLMENT_MAX_ATTEMPTS", 10)
+
+# Espera (en segundos) antes del primer reintento. Se duplica en cada intento.
+FULFILLMENT_RETRY_DELAY = getattr(settings, "VPOS_FULFILLMENT_RETRY_DELAY", 60)
+
+
+def _claim_job(now, job_ids=None):
+    """
+    Bloquea y devuelve el siguiente trabajo pendiente. Los trabajos bloqueados por otros procesos
+    se saltan (SKIP LOCKED) si la BD lo permite, así varios procesos pueden ejecutar trabajos a la vez.
+    Hay que llamarla dentro de una transacción.
+    """
+    pending_jobs = VPOSFulfillmentJob.objects.filter(status="pending", next_attempt_datetime__lte=now)
+    if job_ids is not None:
+        pending_jobs = pending_jobs.filter(id__in=job_ids)
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    return pending_jobs.select_for_update(skip_locked=skip_locked).order_by("next_attempt_datetime", "id").first()
+
+
+####################################################################
+## Ejecución de los trabajos pendientes
+def run_fulfillment_jobs(limit=None, job_ids=None):
+    """
+    Ejecuta los trabajos pendientes de confirmación de ventas (ver VPOSFulfillmentJob).
+    Cada trabajo se ejecuta en su propia transacción con la fila bloqueada. Si falla se deshacen sus cambios
+    y se reintenta más adelante, esperando cada vez el doble, hasta FULFILLMENT_MAX_ATTEMPTS intentos.
+    :param limit: número máximo de trabajos a ejecutar.
+    :param job_ids: si se indica, sólo se ejecutan estos trabajos (p.ej. los que se acaban de crear).
+    :return: dict con el número de trabajos terminados ("done"), a reintentar ("retried") y fallidos ("failed")
+    """
+    result = {"done": 0, "retried": 0, "failed": 0}
+    while limit is None or sum(result.values()) < limit:
+        with transaction.atomic():
+            now = timezone.now()
+            job = _claim_job(now, job_ids)
+            if job is None:
+                break
+
+            job.attempts += 1
+            try:
+                with transaction.atomic():
+                    job.run()
+            except Exception:
+                job.last_error = traceback.format_exc()
+                if job.attempts >= FULFILLMENT_MAX_ATTEMPTS:
+                    job.status = "failed"
+                else:
+                    delay = FULFILLMENT_RETRY_DELAY * 2 ** (job.attempts - 1)
+                    job.next_attempt_datetime = now + datetime.timedelta(seconds=delay)
+                dlprint(u"Error confirmando la venta con operación {0} (intento {1}): {2}".format(
+                    job.operation_number, job.attempts, job.last_error))
+            else:
+                job.status = "done"
+                job.last_error = None
+            job.save()
+
+        result[job.status if job.status != "pending" else "retried"] += 1
+
+    return result
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import binascii
+import bisect
+import socket
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+########################################################################################################################
+########################################################################################################################
+################################### Filtro de IPs de origen de las notificaciones ######################################
+########################################################################################################################
+########################################################################################################################
+
+# Redes (notación CIDR o IPs sueltas) desde las que cada pasarela envía sus notificaciones, por tipo de TPV,
+# p.ej. {"redsys": ["195.76.9.0/24"]}. Las notificaciones de los tipos de TPV que no aparecen no se filtran.
+CONFIRMATION_ALLOWED_IPS = getattr(settings, "VPOS_CONFIRMATION_ALLOWED_IPS", {})
+
+# Proxies inversos de confianza (notación CIDR o IPs sueltas). La cabecera X-Forwarded-For sólo se tiene en cuenta
+# si la petición llega desde uno de ellos, y sólo las entradas añadidas por ellos.
+TRUSTED_PROXIES = getattr(settings, "VPOS_TRUSTED_PROXIES", ())
+
+## Conjuntos de redes ya compilados. Se construyen una única vez al arrancar la aplicación (ver build_ip_filters).
+ALLOWED_NETWORKS = {}
+TRUSTED_PROXY_NETWORKS = None
+
+_ADDRESS_BITS = {4: 32, 6: 128}
+
+
+####################################################################
+## Conversión de direcciones IP a enteros
+def parse_ip(address):
+    """
+    Convierte una dirección IPv4 o IPv6 en una tupla (versión, entero).
+    Las direcciones IPv4 mapeadas en IPv6 (::ffff:a.b.c.d) se tratan como IPv4.
+    :return: (int, long) | None si la dirección no es válida
+    """
+    if not address:
+        return None
+    address = address.strip()
+    for version, family in ((4, socket.AF_INET), (6, socket.AF_INET6)):
+        try:
+            packed = socket.inet_pton(family, address)
+        except (socket.error, ValueError, TypeError, UnicodeError):
+            continue
+        value = int(binascii.hexlify(packed), 16)
+        if version == 6 and value >> 32 == 0xffff:
+            return 4, value & 0xffffffff
+        return version, value
+    return None
+
+
+class IPNetworkSet(object):
+    """
+    Conjunto de redes IP compilado en rangos [inicio, fin] enteros, ordenados y sin solapamientos,
+    para comprobar si contiene una dirección con una búsqueda binaria (O(log n)).
+    """
+    __slots__ = ("_starts", "_ends")
+
+    def __init__(self, networks):
+        ranges = {4: [], 6: []}
+        for network in networks:
+            address, _separator, prefix_length = network.partition("/")
+            parsed_address = parse_ip(address)
+            if parsed_address is None:
+                raise ImproperlyConfigured(u"Red IP no válida: {0}".format(network))
+            version, value = parsed_address
+            bits = _ADDRESS_BITS[version]
+            try:
+                prefix_length = int(prefix_length) if prefix_length else bits
+            except ValueError:
+                raise ImproperlyConfigured(u"Red IP no válida: {0}".format(network))
+            if not 0 <= prefix_length <= bits:
+                raise ImproperlyConfigured(u"Red IP no válida: {0}".format(network))
+            host_mask = (1 << (bits - prefix_length)) - 1
+            start = value & ~host_mask
+            ranges[version].append((start, start | host_mask))
+
+        self._starts = {}
+        self._ends = {}
+        for version, version_ranges in ranges.items():
+            starts = []
+            ends = []
+            # Se unen los rangos solapados o contiguos
+            for start, end in sorted(version_ranges):
+                if ends and start <= ends[-1] + 1:
+                    ends[-1] = max(ends[-1], end)
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self._starts[version] = starts
+            self._ends[version] = ends
+
+    def __contains__(self, address):
+        parsed_address = parse_ip(address)
+        if parsed_address is None:
+            return False
+        version, value = parsed_address
+        index = bisect.bisect_right(self._starts[version], value) - 1
+        return index >= 0 and value <= self._ends[version][index]
+
+    def __len__(self):
+        return sum(len(starts) for starts in self._starts.values())
+
+
+########################################################################
+## Compila las redes configuradas.
+## Se llama desde DjangoVirtualPOSConfig.ready, de forma que un error de configuración se detecta al arrancar.
+def build_ip_filters():
+    global TRUSTED_PROXY_NETWORKS
+    ALLOWED_NETWORKS.clear()
+    for virtualpos_type, networks in CONFIRMATION_ALLOWED_IPS.items():
+        ALLOWED_NETWORKS[virtualpos_type] = IPNetworkSet(networks)
+    TRUSTED_PROXY_NETWORKS = IPNetworkSet(TRUSTED_PROXIES)
+
+
+####################################################################
+## Dirección IP de origen de la petición
+def get_remote_address(request):
+    """
+    Dirección del cliente que ha enviado la petición.
+    X-Forwarded-For sólo se usa si REMOTE_ADDR es un proxy de confianza. En ese caso se recorre de derecha
+    a izquierda y se devuelve la primera dirección que no es un proxy de confianza: las entradas de la izquierda
+    las puede haber escrito el propio cliente.
+    """
+    remote_address = request.META.get("REMOTE_ADDR")
+    if TRUSTED_PROXY_NETWORKS is None:
+        build_ip_filters()
+    if not TRUSTED_PROXY_NETWORKS or remote_address not in TRUSTED_PROXY_NETWORKS:
+        return remote_address
+
+    forwarded_for = [address.strip() for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+    for address in reversed(forwarded_for):
+        if address and address not in TRUSTED_PROXY_NETWORKS:
+            return address
+    return remote_address
+
+
+####################################################################
+## Comprueba si la notificación llega desde una red permitida para la pasarela
+def is_allowed_source(request, virtualpos_type):
+    """
+    :return: True si la pasarela no tiene redes configuradas o si la dirección de origen está en alguna de ellas.
+    """
+    if TRUSTED_PROXY_NETWORKS is None:
+        build_ip_filters()
+    allowed_networks = ALLOWED_NETWORKS.get(virtualpos_type)
+    if allowed_networks is None:
+        return True
+    return get_remote_address(request) in allowed_networks
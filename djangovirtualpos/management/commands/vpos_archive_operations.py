@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djangovirtualpos.archive import archive_operations, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_PATH
+
+
+class Command(BaseCommand):
+    help = u"Archiva por lotes las operaciones de pago finalizadas más antiguas que el periodo indicado."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", dest="days", type=int, default=ARCHIVE_AFTER_DAYS,
+                            help=u"Antigüedad mínima (en días) de las operaciones a archivar")
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=ARCHIVE_BATCH_SIZE,
+                            help=u"Número de operaciones archivadas en cada transacción")
+        parser.add_argument("--path", dest="archive_path", default=ARCHIVE_PATH,
+                            help=u"Directorio en el que se escriben los ficheros JSONL comprimidos. "
+                                 u"Si no se indica, las operaciones se archivan en BD.")
+        parser.add_argument("--limit", dest="limit", type=int, default=None,
+                            help=u"Número máximo de operaciones a archivar en esta ejecución")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError(u"El tamaño de lote debe ser positivo")
+        if options["archive_path"] and not os.path.isdir(options["archive_path"]):
+            raise CommandError(u"No existe el directorio {0}".format(options["archive_path"]))
+
+        before = timezone.now() - datetime.timedelta(days=options["days"])
+        archived = archive_operations(before=before, batch_size=options["batch_size"],
+                                      archive_path=options["archive_path"], limit=options["limit"])
+        self.stdout.write(u"{0} operations archived (created before {1})".format(archived, before.isoformat()))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import csv
+import sys
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from djangovirtualpos.models import VirtualPointOfSale
+from djangovirtualpos.referencepayment import charge_references, REFERENCE_PAYMENT_WORKERS, REFERENCE_PAYMENT_RATE, \
+    REFERENCE_PAYMENT_BATCH_SIZE
+
+
+def _read_items(items_file):
+    for row in csv.reader(items_file):
+        if row and row[0].strip():
+            yield [cell.strip().decode("utf-8") for cell in row]
+
+
+class Command(BaseCommand):
+    help = u"Cobra en bloque pagos por referencia (MIT) de Redsys a partir de un fichero CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vpos_id", type=int, help=u"Identificador del TPV Redsys")
+        parser.add_argument("items_file",
+                            help=u"Fichero CSV con una fila por cobro: código de venta, referencia, importe "
+                                 u"y, opcionalmente, descripción")
+        parser.add_argument("--output", dest="output", default=None,
+                            help=u"Fichero CSV en el que se añade el resultado de cada cobro según se guarda "
+                                 u"cada lote. Por defecto la salida estándar.")
+        parser.add_argument("--sale-model", dest="sale_model", default=None,
+                            help=u"Modelo de venta (app_label.Model) cuyas ventas se confirman con online_confirm "
+                                 u"cuando se cobran")
+        parser.add_argument("--workers", dest="workers", type=int, default=REFERENCE_PAYMENT_WORKERS,
+                            help=u"Número máximo de peticiones simultáneas")
+        parser.add_argument("--rate", dest="rate", type=float, default=REFERENCE_PAYMENT_RATE,
+                            help=u"Número máximo de peticiones por segundo del terminal")
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=REFERENCE_PAYMENT_BATCH_SIZE,
+                            help=u"Número de cobros enviados antes de guardar los resultados")
+
+    def handle(self, *args, **options):
+        try:
+            vpos = VirtualPointOfSale.get(id=options["vpos_id"], is_erased=False)
+        except VirtualPointOfSale.DoesNotExist:
+            raise CommandError(u"No existe el TPV {0}".format(options["vpos_id"]))
+
+        sale_model = None
+        if options["sale_model"]:
+            try:
+                sale_model = apps.get_model(options["sale_model"])
+            except (LookupError, ValueError):
+                raise CommandError(u"No existe el modelo {0}".format(options["sale_model"]))
+
+        output_file = open(options["output"], "ab") if options["output"] else sys.stdout
+        totals = {"completed": 0, "failed": 0, "pending": 0, "skipped": 0}
+        try:
+            writer = csv.writer(output_file)
+            with open(options["items_file"], "rb") as items_file:
+                for result in charge_references(vpos, _read_items(items_file), sale_model=sale_model,
+                                                 workers=options["workers"], rate=options["rate"],
+                                                 batch_size=options["batch_size"]):
+                    totals[result["status"]] += 1
+                    writer.writerow([(value or "").encode("utf-8") for value in (
+                        result["sale_code"], result["operation_number"], result["status"], result["response_code"])])
+                    output_file.flush()
+        finally:
+            if output_file is not sys.stdout:
+                output_file.close()
+
+        self.stderr.write(u"{completed} completed, {failed} failed, {pending} pending (see vpos_query_status), "
+                          u"{skipped} skipped".format(**totals))
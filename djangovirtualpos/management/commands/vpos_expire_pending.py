@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangovirtualpos.expiry import expire_pending_operations, EXPIRY_BATCH_SIZE
+from djangovirtualpos.models import VPOS_TYPES
+
+
+class Command(BaseCommand):
+    help = u"Marca como caducadas las operaciones de pago pendientes que han superado su tiempo de vida."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", dest="vpos_types", action="append",
+                            choices=[virtualpos_type for virtualpos_type, _name in VPOS_TYPES],
+                            help=u"Tipo de TPV a tratar (se puede repetir). Por defecto todos.")
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=EXPIRY_BATCH_SIZE,
+                            help=u"Número máximo de operaciones actualizadas en cada sentencia")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError(u"El tamaño de lote debe ser positivo")
+
+        expired = expire_pending_operations(virtualpos_types=options["vpos_types"], batch_size=options["batch_size"])
+        for virtualpos_type in sorted(expired):
+            self.stdout.write(u"{0}: {1} operations expired".format(virtualpos_type, expired[virtualpos_type]))
+        self.stdout.write(u"{0} operations expired".format(sum(expired.values())))
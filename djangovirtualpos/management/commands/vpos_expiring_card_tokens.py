@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import csv
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djangovirtualpos.models import VPOSCardToken
+
+
+class Command(BaseCommand):
+    help = u"Lista en CSV las referencias de tarjeta que caducan en un mes (por defecto el mes que viene)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", dest="month", default=None,
+                            help=u"Mes de caducidad (AAAA-MM). Por defecto el mes que viene.")
+        parser.add_argument("--vpos-id", dest="vpos_id", type=int, default=None,
+                            help=u"Sólo las referencias de este TPV")
+
+    def handle(self, *args, **options):
+        if options["month"]:
+            try:
+                month = datetime.datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError(u"Mes no válido: {0}".format(options["month"]))
+        else:
+            month = (timezone.localdate().replace(day=1) + datetime.timedelta(days=31)).replace(day=1)
+
+        tokens = VPOSCardToken.expiring_in_month(month.year, month.month)
+        if options["vpos_id"]:
+            tokens = tokens.filter(virtual_point_of_sale_id=options["vpos_id"])
+
+        writer = csv.writer(self.stdout)
+        for token in tokens.order_by("id").values_list("virtual_point_of_sale_id", "customer_code", "reference",
+                                                       "expiration_date").iterator():
+            writer.writerow([u"{0}".format(value if value is not None else "").encode("utf-8") for value in token])
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Dependencias de las pasarelas que sólo se deben importar cuando se usan
+GATEWAY_DEPENDENCIES = ("bs4", "lxml", "requests", "Crypto", "urllib2")
+
+# Código que se ejecuta en un proceso nuevo: arranca Django e informa del tiempo, la memoria
+# y las dependencias de las pasarelas que se han cargado
+BENCHMARK_CODE = """
+import json, resource, sys, time
+start = time.time()
+import django
+django.setup()
+import djangovirtualpos.models
+elapsed = time.time() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (GATEWAY_DEPENDENCIES,)
+
+
+class Command(BaseCommand):
+    help = u"Mide el tiempo y la memoria de arranque de Django con djangovirtualpos en procesos nuevos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", dest="runs", type=int, default=5,
+                            help=u"Número de procesos que se lanzan (se muestra la mediana)")
+
+    def handle(self, *args, **options):
+        if options["runs"] < 1:
+            raise CommandError(u"Hay que lanzar al menos un proceso")
+
+        results = []
+        for _run in range(options["runs"]):
+            # El proceso hijo usa el mismo intérprete, el mismo sys.path y la misma configuración
+            environment = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+            output = subprocess.check_output([sys.executable, "-c", BENCHMARK_CODE], env=environment)
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+        results.sort(key=lambda result: result["seconds"])
+        median = results[len(results) // 2]
+        self.stdout.write(u"django.setup(): {0:.3f}s (median of {1}), max RSS {2} KB, {3} modules".format(
+            median["seconds"], len(results), median["max_rss_kb"], median["modules"]))
+        self.stdout.write(u"Gateway dependencies loaded at startup: {0}".format(
+            u", ".join(median["loaded"]) or u"none"))
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from djangovirtualpos.spool import drain_spool
+
+
+class Command(BaseCommand):
+    help = u"Procesa las notificaciones guardadas de las pasarelas (VPOS_SPOOLED_NOTIFICATION_TYPES)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", dest="workers", type=int, default=1,
+                            help=u"Número de procesos que vacían la cola en paralelo")
+        parser.add_argument("--limit", dest="limit", type=int, default=None,
+                            help=u"Número máximo de notificaciones a procesar por cada proceso")
+        parser.add_argument("--loop", dest="loop", action="store_true", default=False,
+                            help=u"No termina: sigue esperando notificaciones nuevas")
+        parser.add_argument("--sleep", dest="sleep", type=float, default=1.0,
+                            help=u"Segundos de espera cuando no hay notificaciones pendientes (con --loop)")
+
+    def handle(self, *args, **options):
+        while True:
+            result = drain_spool(workers=options["workers"], limit=options["limit"])
+            if sum(result.values()) or not options["loop"]:
+                self.stdout.write(u"{done} done, {retried} retried, {failed} failed".format(**result))
+            if not options["loop"]:
+                break
+            if not sum(result.values()):
+                time.sleep(options["sleep"])
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djangovirtualpos.models import VPOSNotification
+
+
+class Command(BaseCommand):
+    help = u"Elimina en bloque, mes a mes, las notificaciones de pasarela anteriores al periodo de retención."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", dest="months", type=int, default=12,
+                            help=u"Número de meses (incluido el actual) que se conservan")
+
+    def handle(self, *args, **options):
+        months = options["months"]
+        if months < 1:
+            raise CommandError(u"Hay que conservar al menos el mes actual")
+
+        # Primer periodo (AAAAMM) que se conserva
+        now = timezone.now()
+        month_index = now.year * 12 + (now.month - 1) - (months - 1)
+        before_period = "{0:04d}{1:02d}".format(month_index // 12, month_index % 12 + 1)
+
+        deleted = VPOSNotification.purge(before_period)
+        for period in sorted(deleted):
+            self.stdout.write(u"{0}: {1} notifications deleted".format(period, deleted[period]))
+        self.stdout.write(u"{0} notifications deleted before {1}".format(sum(deleted.values()), before_period))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djangovirtualpos.polling import query_pending_operations, POLLABLE_VPOS_TYPES, POLL_AFTER_MINUTES
+
+
+class Command(BaseCommand):
+    help = u"Consulta en la pasarela el estado de las operaciones de pago pendientes y actualiza las que han cambiado."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", dest="vpos_types", action="append", choices=POLLABLE_VPOS_TYPES,
+                            help=u"Tipo de TPV a consultar (se puede repetir). Por defecto todos los que lo permiten.")
+        parser.add_argument("--minutes", dest="minutes", type=int, default=POLL_AFTER_MINUTES,
+                            help=u"Antigüedad mínima (en minutos) de las operaciones a consultar")
+        parser.add_argument("--limit", dest="limit", type=int, default=None,
+                            help=u"Número máximo de operaciones a consultar")
+        parser.add_argument("--sale-model", dest="sale_model", required=True,
+                            help=u"Modelo de venta (app_label.Model) cuyas ventas se confirman con online_confirm "
+                                 u"cuando su operación se ha completado")
+
+    def handle(self, *args, **options):
+        try:
+            sale_model = apps.get_model(options["sale_model"])
+        except (LookupError, ValueError):
+            raise CommandError(u"No existe el modelo {0}".format(options["sale_model"]))
+
+        older_than = timezone.now() - datetime.timedelta(minutes=options["minutes"])
+        updated = query_pending_operations(sale_model, virtualpos_types=options["vpos_types"], older_than=older_than,
+                                           limit=options["limit"])
+        for status in sorted(updated):
+            self.stdout.write(u"{0}: {1} operations".format(status, updated[status]))
+        self.stdout.write(u"{0} operations updated".format(sum(updated.values())))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangovirtualpos.reconciliation import reconcile_files, SETTLEMENT_FORMATS
+from djangovirtualpos.util import localize_datetime
+
+
+class Command(BaseCommand):
+    help = u"Concilia uno o varios ficheros de liquidación (CSV) del banco con las operaciones de pago."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help=u"Ficheros CSV de liquidación")
+        parser.add_argument("--type", dest="vpos_type", required=True, choices=sorted(SETTLEMENT_FORMATS.keys()),
+                            help=u"Tipo de TPV que ha generado los ficheros")
+        parser.add_argument("--date-from", dest="date_from", default=None,
+                            help=u"Inicio del periodo liquidado (AAAA-MM-DD). Necesario para informar de operaciones ausentes.")
+        parser.add_argument("--date-to", dest="date_to", default=None,
+                            help=u"Fin del periodo liquidado, no incluido (AAAA-MM-DD).")
+        parser.add_argument("--workers", dest="workers", type=int, default=None,
+                            help=u"Número de procesos que conciliarán ficheros en paralelo")
+
+    def handle(self, *args, **options):
+        date_from = date_to = None
+        if options["date_from"] or options["date_to"]:
+            if not (options["date_from"] and options["date_to"]):
+                raise CommandError(u"Hay que indicar tanto --date-from como --date-to")
+            date_from = localize_datetime(datetime.datetime.strptime(options["date_from"], "%Y-%m-%d"))
+            date_to = localize_datetime(datetime.datetime.strptime(options["date_to"], "%Y-%m-%d"))
+
+        report = reconcile_files(options["paths"], options["vpos_type"], date_from=date_from, date_to=date_to,
+                                 workers=options["workers"])
+
+        for path, line_number, key in report.unmatched:
+            self.stdout.write(u"UNMATCHED {0}:{1} {2}".format(path, line_number, key))
+        for path, line_number, operation_number, file_amount, stored_amount in report.amount_mismatches:
+            self.stdout.write(u"AMOUNT_MISMATCH {0}:{1} {2} file={3} stored={4}".format(
+                path, line_number, operation_number, file_amount, stored_amount))
+        for path, line_number, operation_number in report.duplicates:
+            self.stdout.write(u"DUPLICATE {0}:{1} {2}".format(path, line_number, operation_number))
+        for operation_number in report.missing:
+            self.stdout.write(u"MISSING {0}".format(operation_number))
+
+        self.stdout.write(u"{lines} lines, {matched} matched, {unmatched} unmatched, {mismatches} amount mismatches, "
+                          u"{duplicates} duplicates, {missing} missing".format(
+                              lines=report.lines, matched=report.matched, unmatched=len(report.unmatched),
+                              mismatches=len(report.amount_mismatches), duplicates=len(report.duplicates),
+                              missing=len(report.missing)))
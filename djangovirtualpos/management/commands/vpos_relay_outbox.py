@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from djangovirtualpos.outbox import relay_events, get_sink, purge_relayed_events
+
+# Segundos entre dos borrados de los eventos enviados (con --loop)
+PURGE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = u"Envía a su destino (fichero, webhook, cola) los eventos de cambio de estado del outbox."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sink", dest="sink", default=None,
+                            help=u"Destino: file, webhook, queue o ruta de una clase. Por defecto VPOS_OUTBOX_SINK")
+        parser.add_argument("--path", dest="path", default=None,
+                            help=u"Fichero de destino (con --sink file)")
+        parser.add_argument("--url", dest="url", default=None,
+                            help=u"URL de destino (con --sink webhook)")
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=None,
+                            help=u"Eventos por lote")
+        parser.add_argument("--limit", dest="limit", type=int, default=None,
+                            help=u"Número máximo de eventos a enviar")
+        parser.add_argument("--loop", dest="loop", action="store_true", default=False,
+                            help=u"No termina: sigue esperando eventos nuevos")
+        parser.add_argument("--sleep", dest="sleep", type=float, default=1.0,
+                            help=u"Segundos de espera cuando no hay eventos pendientes (con --loop)")
+        parser.add_argument("--retention-days", dest="retention_days", type=int, default=None,
+                            help=u"Días que se conservan los eventos enviados. Por defecto VPOS_OUTBOX_RETENTION_DAYS")
+
+    def handle(self, *args, **options):
+        sink_options = {}
+        if options["path"]:
+            sink_options["path"] = options["path"]
+        if options["url"]:
+            sink_options["url"] = options["url"]
+        sink = get_sink(options["sink"], **sink_options)
+
+        last_purge = None
+        while True:
+            relayed = relay_events(sink, batch_size=options["batch_size"], limit=options["limit"])
+            if relayed or not options["loop"]:
+                self.stdout.write(u"{0} events relayed".format(relayed))
+            # Los eventos enviados antiguos se eliminan en cada ejecución y, con --loop, cada PURGE_INTERVAL segundos
+            if last_purge is None or time.time() - last_purge >= PURGE_INTERVAL:
+                purged = purge_relayed_events(options["retention_days"])
+                if purged:
+                    self.stdout.write(u"{0} relayed events purged".format(purged))
+                last_purge = time.time()
+            if not options["loop"]:
+                break
+            if not relayed:
+                time.sleep(options["sleep"])
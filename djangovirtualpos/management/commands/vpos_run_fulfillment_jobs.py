@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from djangovirtualpos.fulfillment import run_fulfillment_jobs
+
+
+class Command(BaseCommand):
+    help = u"Ejecuta los trabajos pendientes de confirmación de ventas (VPOS_ASYNC_FULFILLMENT)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", dest="limit", type=int, default=None,
+                            help=u"Número máximo de trabajos a ejecutar")
+        parser.add_argument("--loop", dest="loop", action="store_true", default=False,
+                            help=u"No termina: sigue esperando trabajos nuevos")
+        parser.add_argument("--sleep", dest="sleep", type=float, default=1.0,
+                            help=u"Segundos de espera cuando no hay trabajos pendientes (con --loop)")
+
+    def handle(self, *args, **options):
+        while True:
+            result = run_fulfillment_jobs(limit=options["limit"])
+            if sum(result.values()) or not options["loop"]:
+                self.stdout.write(u"{done} done, {retried} retried, {failed} failed".format(**result))
+            if not options["loop"]:
+                break
+            if not sum(result.values()):
+                time.sleep(options["sleep"])
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from djangovirtualpos.models import VPOSPaymentOperation
+from djangovirtualpos.preauthorization import capture_preauthorizations, release_preauthorizations, \
+    PREAUTHORIZATION_WORKERS, PREAUTHORIZATION_RATE, PREAUTHORIZATION_BATCH_SIZE
+from djangovirtualpos.util import localize_datetime
+
+
+class Command(BaseCommand):
+    help = u"Confirma (captura) o anula (libera) en bloque pre-autorizaciones retenidas de Redsys " \
+           u"y autorizaciones de Santander Elavon con liquidación diferida."
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=("capture", "release"), help=u"Confirmar o anular las pre-autorizaciones")
+        parser.add_argument("--sale-code", dest="sale_codes", action="append", default=[],
+                            help=u"Código de venta cuya pre-autorización se trata (se puede repetir)")
+        parser.add_argument("--sale-codes-file", dest="sale_codes_file", default=None,
+                            help=u"Fichero con un código de venta por línea")
+        parser.add_argument("--created-before", dest="created_before", default=None,
+                            help=u"Trata las pre-autorizaciones creadas antes de esta fecha (AAAA-MM-DD)")
+        parser.add_argument("--workers", dest="workers", type=int, default=PREAUTHORIZATION_WORKERS,
+                            help=u"Número máximo de peticiones simultáneas")
+        parser.add_argument("--rate", dest="rate", type=float, default=PREAUTHORIZATION_RATE,
+                            help=u"Número máximo de peticiones por segundo")
+        parser.add_argument("--batch-size", dest="batch_size", type=int, default=PREAUTHORIZATION_BATCH_SIZE,
+                            help=u"Número de operaciones enviadas antes de guardar los resultados")
+
+    def handle(self, *args, **options):
+        sale_codes = list(options["sale_codes"])
+        if options["sale_codes_file"]:
+            with open(options["sale_codes_file"], "r") as sale_codes_file:
+                sale_codes += [line.strip().decode("utf-8") for line in sale_codes_file if line.strip()]
+
+        if not sale_codes and not options["created_before"]:
+            raise CommandError(u"Hay que indicar los códigos de venta o --created-before")
+
+        operations = VPOSPaymentOperation.objects.all()
+        if sale_codes:
+            operations = operations.filter(sale_code__in=sale_codes)
+        if options["created_before"]:
+            created_before = localize_datetime(datetime.datetime.strptime(options["created_before"], "%Y-%m-%d"))
+            operations = operations.filter(creation_datetime__lt=created_before)
+
+        settle = capture_preauthorizations if options["action"] == "capture" else release_preauthorizations
+        result = settle(operations, workers=options["workers"], rate=options["rate"],
+                        batch_size=options["batch_size"])
+        self.stdout.write(u"{accepted} accepted, {rejected} rejected, {errors} errors (will be retried)".format(**result))
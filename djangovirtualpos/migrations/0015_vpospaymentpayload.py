@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:24
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0014_auto_20180403_1057'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSPaymentPayload',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=32, verbose_name='Tipo de mensaje')),
+                ('body', models.BinaryField(verbose_name='Contenido comprimido (zlib) del mensaje')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Tama\xf1o sin comprimir del mensaje')),
+                ('creation_datetime', models.DateTimeField(verbose_name='Fecha de creaci\xf3n del objeto')),
+                ('operation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payloads', to='djangovirtualpos.VPOSPaymentOperation')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
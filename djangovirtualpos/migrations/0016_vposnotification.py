@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:25
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0015_vpospaymentpayload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV')),
+                ('operation_number', models.CharField(blank=True, db_index=True, max_length=255, null=True, verbose_name='N\xfamero de operaci\xf3n')),
+                ('body_hash', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256 del cuerpo de la notificaci\xf3n')),
+                ('body_size', models.PositiveIntegerField(default=0, verbose_name='Tama\xf1o del cuerpo de la notificaci\xf3n')),
+                ('remote_address', models.GenericIPAddressField(blank=True, null=True, verbose_name='Direcci\xf3n IP de origen')),
+                ('verified', models.NullBooleanField(default=None, help_text='Vac\xedo si la notificaci\xf3n no se pudo asociar a ninguna operaci\xf3n.', verbose_name='Resultado de la verificaci\xf3n')),
+                ('latency', models.PositiveIntegerField(default=0, verbose_name='Tiempo de procesamiento (ms)')),
+                ('received_datetime', models.DateTimeField(db_index=True, verbose_name='Fecha de recepci\xf3n')),
+                ('period', models.CharField(db_index=True, max_length=6, verbose_name='Periodo (AAAAMM) de recepci\xf3n')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0016_vposnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSArchivedOperation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation_id', models.PositiveIntegerField(unique=True, verbose_name='Identificador original de la operaci\xf3n')),
+                ('operation_number', models.CharField(db_index=True, max_length=255, verbose_name='N\xfamero de operaci\xf3n')),
+                ('sale_code', models.CharField(db_index=True, max_length=512, verbose_name='C\xf3digo de la venta')),
+                ('confirmation_code', models.CharField(blank=True, max_length=255, null=True, verbose_name='C\xf3digo de confirmaci\xf3n enviado por el banco.')),
+                ('type', models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('partially_refunded', 'Partially Refunded'), ('completely_refunded', 'Completely Refunded')], max_length=64, verbose_name='Estado del pago')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='Coste de la operaci\xf3n')),
+                ('creation_datetime', models.DateTimeField(verbose_name='Fecha de creaci\xf3n de la operaci\xf3n')),
+                ('archived_datetime', models.DateTimeField(verbose_name='Fecha de archivado de la operaci\xf3n')),
+                ('data', models.BinaryField(null=True, verbose_name='Operaci\xf3n serializada y comprimida (zlib)')),
+                ('file_path', models.CharField(blank=True, max_length=512, null=True, verbose_name='Fichero JSONL (gzip) en el que se ha archivado la operaci\xf3n')),
+                ('file_line', models.PositiveIntegerField(blank=True, null=True, verbose_name='L\xednea del fichero (empezando en 0)')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
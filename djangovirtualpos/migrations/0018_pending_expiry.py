@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0017_vposarchivedoperation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vpospaymentoperation',
+            name='expiration_datetime',
+            field=models.DateTimeField(blank=True, help_text='Fecha de caducidad indicada por la pasarela (p.ej. la del invoice de Bitpay).', null=True, verbose_name='Fecha de caducidad del pago'),
+        ),
+        migrations.AlterField(
+            model_name='vposarchivedoperation',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('partially_refunded', 'Partially Refunded'), ('completely_refunded', 'Completely Refunded'), ('expired', 'Expired')], max_length=64, verbose_name='Estado del pago'),
+        ),
+        migrations.AlterField(
+            model_name='vpospaymentoperation',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('partially_refunded', 'Partially Refunded'), ('completely_refunded', 'Completely Refunded'), ('expired', 'Expired')], max_length=64, verbose_name='Estado del pago'),
+        ),
+        migrations.AlterIndexTogether(
+            name='vpospaymentoperation',
+            index_together=set([('status', 'expiration_datetime'), ('status', 'creation_datetime')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0018_pending_expiry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vposarchivedoperation',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('partially_refunded', 'Partially Refunded'), ('completely_refunded', 'Completely Refunded'), ('expired', 'Expired'), ('authorized', 'Authorized (pending capture)'), ('released', 'Released')], max_length=64, verbose_name='Estado del pago'),
+        ),
+        migrations.AlterField(
+            model_name='vpospaymentoperation',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed'), ('partially_refunded', 'Partially Refunded'), ('completely_refunded', 'Completely Refunded'), ('expired', 'Expired'), ('authorized', 'Authorized (pending capture)'), ('released', 'Released')], max_length=64, verbose_name='Estado del pago'),
+        ),
+        migrations.AlterField(
+            model_name='vposredsys',
+            name='operative_type',
+            field=models.CharField(choices=[('authorization', 'autorizaci\xf3n'), ('pre-authorization', 'pre-autorizaci\xf3n'), ('deferred-pre-authorization', 'pre-autorizaci\xf3n con confirmaci\xf3n diferida')], default='authorization', max_length=512, verbose_name='Tipo de operativa'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0019_preauthorization_capture'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSFulfillmentJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_model', models.CharField(max_length=255, verbose_name='Modelo de la venta (app_label.Model)')),
+                ('operation_number', models.CharField(db_index=True, max_length=255, verbose_name='N\xfamero de operaci\xf3n')),
+                ('parameters', models.TextField(default='{}', verbose_name='Par\xe1metros (JSON) de la llamada a online_confirm')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='Estado del trabajo')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='N\xfamero de intentos')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='\xdaltimo error')),
+                ('next_attempt_datetime', models.DateTimeField(verbose_name='Fecha del siguiente intento')),
+                ('creation_datetime', models.DateTimeField(verbose_name='Fecha de creaci\xf3n del objeto')),
+                ('last_update_datetime', models.DateTimeField(verbose_name='Fecha de \xfaltima actualizaci\xf3n del objeto')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='vposfulfillmentjob',
+            index_together=set([('status', 'next_attempt_datetime')]),
+        ),
+    ]
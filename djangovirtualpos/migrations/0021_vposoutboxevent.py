@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:39
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0020_vposfulfillmentjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSOutboxEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('operation_type', models.CharField(choices=[('payment', 'Payment'), ('refund', 'Refund')], max_length=16, verbose_name='Tipo de operaci\xf3n')),
+                ('operation_id', models.PositiveIntegerField(verbose_name='Identificador de la operaci\xf3n')),
+                ('operation_number', models.CharField(max_length=255, verbose_name='N\xfamero de operaci\xf3n')),
+                ('sale_code', models.CharField(blank=True, max_length=512, null=True, verbose_name='C\xf3digo de la venta')),
+                ('type', models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=6, verbose_name='Importe de la operaci\xf3n')),
+                ('from_status', models.CharField(blank=True, max_length=64, null=True, verbose_name='Estado anterior')),
+                ('to_status', models.CharField(max_length=64, verbose_name='Estado nuevo')),
+                ('creation_datetime', models.DateTimeField(verbose_name='Fecha del cambio de estado')),
+                ('relayed', models.BooleanField(db_index=True, default=False, verbose_name='Indica si ya se ha enviado')),
+                ('relayed_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de env\xedo')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0021_vposoutboxevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vposceca',
+            name='currency',
+            field=models.CharField(choices=[('ARS', 'ARS'), ('AUD', 'AUD'), ('BGN', 'BGN'), ('BHD', 'BHD'), ('BRL', 'BRL'), ('CAD', 'CAD'), ('CHF', 'CHF'), ('CLP', 'CLP'), ('CNY', 'CNY'), ('COP', 'COP'), ('CZK', 'CZK'), ('DKK', 'DKK'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('HUF', 'HUF'), ('JPY', 'JPY'), ('KWD', 'KWD'), ('MAD', 'MAD'), ('MXN', 'MXN'), ('NOK', 'NOK'), ('PLN', 'PLN'), ('RON', 'RON'), ('SEK', 'SEK'), ('USD', 'USD')], default='EUR', max_length=3, verbose_name='Moneda'),
+        ),
+        migrations.AddField(
+            model_name='vposredsys',
+            name='currency',
+            field=models.CharField(choices=[('ARS', 'ARS'), ('AUD', 'AUD'), ('BGN', 'BGN'), ('BHD', 'BHD'), ('BRL', 'BRL'), ('CAD', 'CAD'), ('CHF', 'CHF'), ('CLP', 'CLP'), ('CNY', 'CNY'), ('COP', 'COP'), ('CZK', 'CZK'), ('DKK', 'DKK'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('HUF', 'HUF'), ('JPY', 'JPY'), ('KWD', 'KWD'), ('MAD', 'MAD'), ('MXN', 'MXN'), ('NOK', 'NOK'), ('PLN', 'PLN'), ('RON', 'RON'), ('SEK', 'SEK'), ('USD', 'USD')], default='EUR', max_length=3, verbose_name='Moneda'),
+        ),
+        migrations.AddField(
+            model_name='vpossantanderelavon',
+            name='currency',
+            field=models.CharField(choices=[('ARS', 'ARS'), ('AUD', 'AUD'), ('BGN', 'BGN'), ('BHD', 'BHD'), ('BRL', 'BRL'), ('CAD', 'CAD'), ('CHF', 'CHF'), ('CLP', 'CLP'), ('CNY', 'CNY'), ('COP', 'COP'), ('CZK', 'CZK'), ('DKK', 'DKK'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('HUF', 'HUF'), ('JPY', 'JPY'), ('KWD', 'KWD'), ('MAD', 'MAD'), ('MXN', 'MXN'), ('NOK', 'NOK'), ('PLN', 'PLN'), ('RON', 'RON'), ('SEK', 'SEK'), ('USD', 'USD')], default='EUR', max_length=3, verbose_name='Moneda'),
+        ),
+    ]
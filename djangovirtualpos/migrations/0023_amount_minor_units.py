@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 17:52
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def fill_amount_minor(apps, schema_editor):
+    """
+    Calcula el importe en unidades mínimas de las operaciones y devoluciones existentes.
+    Hasta ahora todas las operaciones eran en euros (dos decimales), así que basta un UPDATE por tabla.
+    """
+    amount_minor = models.ExpressionWrapper(models.F("amount") * 100, output_field=models.BigIntegerField())
+    for model_name in ("VPOSPaymentOperation", "VPOSRefundOperation"):
+        apps.get_model("djangovirtualpos", model_name).objects.update(amount_minor=amount_minor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0022_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vpospaymentoperation',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Importe en unidades m\xednimas de la moneda'),
+        ),
+        migrations.AddField(
+            model_name='vpospaymentoperation',
+            name='currency',
+            field=models.CharField(choices=[('ARS', 'ARS'), ('AUD', 'AUD'), ('BGN', 'BGN'), ('BHD', 'BHD'), ('BRL', 'BRL'), ('CAD', 'CAD'), ('CHF', 'CHF'), ('CLP', 'CLP'), ('CNY', 'CNY'), ('COP', 'COP'), ('CZK', 'CZK'), ('DKK', 'DKK'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('HUF', 'HUF'), ('JPY', 'JPY'), ('KWD', 'KWD'), ('MAD', 'MAD'), ('MXN', 'MXN'), ('NOK', 'NOK'), ('PLN', 'PLN'), ('RON', 'RON'), ('SEK', 'SEK'), ('USD', 'USD')], default='EUR', max_length=3, verbose_name='Moneda (c\xf3digo ISO 4217)'),
+        ),
+        migrations.AddField(
+            model_name='vposrefundoperation',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Cantidad en unidades m\xednimas de la moneda'),
+        ),
+        migrations.AlterField(
+            model_name='vposarchivedoperation',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Coste de la operaci\xf3n'),
+        ),
+        migrations.AlterField(
+            model_name='vposoutboxevent',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Importe de la operaci\xf3n'),
+        ),
+        migrations.AlterField(
+            model_name='vpospaymentoperation',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Coste de la operaci\xf3n'),
+        ),
+        migrations.AlterField(
+            model_name='vposrefundoperation',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Cantidad de la devoluci\xf3n'),
+        ),
+        migrations.AlterIndexTogether(
+            name='vposrefundoperation',
+            index_together=set([('payment', 'status')]),
+        ),
+        migrations.RunPython(fill_amount_minor, migrations.RunPython.noop),
+    ]
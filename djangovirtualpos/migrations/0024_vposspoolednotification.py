@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0023_amount_minor_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSSpooledNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV')),
+                ('sale_model', models.CharField(max_length=255, verbose_name='Modelo de la venta (app_label.Model)')),
+                ('body', models.BinaryField(verbose_name='Cuerpo de la notificaci\xf3n')),
+                ('content_type', models.CharField(blank=True, default='', max_length=255, verbose_name='Content-Type')),
+                ('query_string', models.TextField(blank=True, default='', verbose_name='Par\xe1metros GET')),
+                ('remote_address', models.GenericIPAddressField(blank=True, null=True, verbose_name='Direcci\xf3n IP de origen')),
+                ('received_datetime', models.DateTimeField(verbose_name='Fecha de recepci\xf3n')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='Estado de la notificaci\xf3n')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='N\xfamero de intentos')),
+                ('last_error', models.TextField(blank=True, null=True, verbose_name='\xdaltimo error')),
+                ('next_attempt_datetime', models.DateTimeField(verbose_name='Fecha del siguiente intento')),
+                ('processed_datetime', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de procesamiento')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='vposspoolednotification',
+            index_together=set([('status', 'next_attempt_datetime')]),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0024_vposspoolednotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSCardToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV')),
+                ('customer_code', models.CharField(blank=True, max_length=255, null=True, verbose_name='C\xf3digo del cliente')),
+                ('reference', models.CharField(max_length=255, verbose_name='Referencia de la tarjeta')),
+                ('expiration_date', models.DateField(db_index=True, verbose_name='Fecha de caducidad de la tarjeta')),
+                ('sale_code', models.CharField(blank=True, max_length=512, null=True, verbose_name='C\xf3digo de la venta en la que se obtuvo')),
+                ('operation_number', models.CharField(blank=True, max_length=255, null=True, verbose_name='N\xfamero de operaci\xf3n en la que se obtuvo')),
+                ('is_revoked', models.BooleanField(default=False, verbose_name='Anulada')),
+                ('creation_datetime', models.DateTimeField(verbose_name='Fecha de creaci\xf3n')),
+                ('last_update_datetime', models.DateTimeField(verbose_name='Fecha de \xfaltima actualizaci\xf3n')),
+                ('virtual_point_of_sale', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='card_tokens', to='djangovirtualpos.VirtualPointOfSale', verbose_name='TPV')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='vposcardtoken',
+            unique_together=set([('virtual_point_of_sale', 'reference')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='vposcardtoken',
+            index_together=set([('customer_code', 'is_revoked', 'expiration_date'), ('virtual_point_of_sale', 'is_revoked', 'expiration_date')]),
+        ),
+    ]
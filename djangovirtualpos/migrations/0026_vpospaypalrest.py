@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0025_vposcardtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VPOSPaypalRest',
+            fields=[
+                ('parent', models.OneToOneField(db_column='vpos_id', on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, related_name='+', serialize=False, to='djangovirtualpos.VirtualPointOfSale')),
+                ('testing_client_id', models.CharField(blank=True, max_length=128, null=True, verbose_name='Client ID de PayPal para entorno de test')),
+                ('testing_client_secret', models.CharField(blank=True, max_length=128, null=True, verbose_name='Secret de PayPal para entorno de test')),
+                ('production_client_id', models.CharField(max_length=128, verbose_name='Client ID de PayPal para entorno de producci\xf3n')),
+                ('production_client_secret', models.CharField(max_length=128, verbose_name='Secret de PayPal para entorno de producci\xf3n')),
+                ('currency', models.CharField(choices=[('ARS', 'ARS'), ('AUD', 'AUD'), ('BGN', 'BGN'), ('BHD', 'BHD'), ('BRL', 'BRL'), ('CAD', 'CAD'), ('CHF', 'CHF'), ('CLP', 'CLP'), ('CNY', 'CNY'), ('COP', 'COP'), ('CZK', 'CZK'), ('DKK', 'DKK'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('HUF', 'HUF'), ('JPY', 'JPY'), ('KWD', 'KWD'), ('MAD', 'MAD'), ('MXN', 'MXN'), ('NOK', 'NOK'), ('PLN', 'PLN'), ('RON', 'RON'), ('SEK', 'SEK'), ('USD', 'USD')], default='EUR', max_length=3, verbose_name='Moneda')),
+                ('return_url', models.URLField(verbose_name='Url de retorno tras aprobar el pago (p.ej. https://.../payment/confirm/paypalrest)')),
+            ],
+            bases=('djangovirtualpos.virtualpointofsale',),
+        ),
+        migrations.AlterField(
+            model_name='virtualpointofsale',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+        migrations.AlterField(
+            model_name='vposarchivedoperation',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+        migrations.AlterField(
+            model_name='vposcardtoken',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+        migrations.AlterField(
+            model_name='vposnotification',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+        migrations.AlterField(
+            model_name='vposoutboxevent',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+        migrations.AlterField(
+            model_name='vpospaymentoperation',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+        migrations.AlterField(
+            model_name='vposspoolednotification',
+            name='type',
+            field=models.CharField(choices=[('ceca', 'TPV Virtual - Confederaci\xf3n Espa\xf1ola de Cajas de Ahorros (CECA)'), ('paypal', 'Paypal'), ('paypalrest', 'Paypal (REST)'), ('redsys', 'TPV Redsys'), ('santanderelavon', 'TPV Santander Elavon'), ('bitpay', 'TPV Bitpay')], default='', max_length=16, verbose_name='Tipo de TPV'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0026_vpospaypalrest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vpossantanderelavon',
+            name='deferred_settlement',
+            field=models.BooleanField(default=False, help_text='Las autorizaciones se liquidan m\xe1s tarde en bloque (comando vpos_settle_preauthorizations)', verbose_name='Liquidaci\xf3n diferida'),
+        ),
+    ]
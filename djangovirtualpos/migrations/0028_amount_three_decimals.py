@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0027_vpossantanderelavon_deferred_settlement'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='vposarchivedoperation',
+            name='amount',
+            field=models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Coste de la operaci\xf3n'),
+        ),
+        migrations.AlterField(
+            model_name='vposoutboxevent',
+            name='amount',
+            field=models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Importe de la operaci\xf3n'),
+        ),
+        migrations.AlterField(
+            model_name='vpospaymentoperation',
+            name='amount',
+            field=models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Coste de la operaci\xf3n'),
+        ),
+        migrations.AlterField(
+            model_name='vposrefundoperation',
+            name='amount',
+            field=models.DecimalField(decimal_places=3, max_digits=12, verbose_name='Cantidad de la devoluci\xf3n'),
+        ),
+    ]
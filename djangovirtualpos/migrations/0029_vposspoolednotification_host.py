@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0028_amount_three_decimals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vposspoolednotification',
+            name='host',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Host'),
+        ),
+        migrations.AddField(
+            model_name='vposspoolednotification',
+            name='scheme',
+            field=models.CharField(default='http', max_length=5, verbose_name='Esquema (http o https)'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-19 18:37
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from djangovirtualpos.money import MINOR_UNIT_FACTORS
+
+
+def fill_currency_and_amount_minor(apps, schema_editor):
+    """
+    Copia a los eventos existentes la moneda de su operación (la de su pago en las devoluciones)
+    y calcula su importe en unidades mínimas. Un UPDATE por moneda y tipo de operación.
+    Los eventos de operaciones archivadas se quedan con la moneda por defecto (EUR).
+    """
+    VPOSOutboxEvent = apps.get_model("djangovirtualpos", "VPOSOutboxEvent")
+    VPOSPaymentOperation = apps.get_model("djangovirtualpos", "VPOSPaymentOperation")
+    VPOSRefundOperation = apps.get_model("djangovirtualpos", "VPOSRefundOperation")
+    currencies = VPOSPaymentOperation.objects.exclude(currency="EUR").values_list("currency", flat=True).distinct()
+    for currency in list(currencies):
+        VPOSOutboxEvent.objects.filter(
+            operation_type="payment",
+            operation_id__in=VPOSPaymentOperation.objects.filter(currency=currency).values("id")
+        ).update(currency=currency)
+        VPOSOutboxEvent.objects.filter(
+            operation_type="refund",
+            operation_id__in=VPOSRefundOperation.objects.filter(payment__currency=currency).values("id")
+        ).update(currency=currency)
+
+    for currency in list(VPOSOutboxEvent.objects.values_list("currency", flat=True).distinct()):
+        amount_minor = models.ExpressionWrapper(models.F("amount") * MINOR_UNIT_FACTORS[currency],
+                                                output_field=models.BigIntegerField())
+        VPOSOutboxEvent.objects.filter(currency=currency).update(amount_minor=amount_minor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('djangovirtualpos', '0029_vposspoolednotification_host'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vposoutboxevent',
+            name='amount_minor',
+            field=models.BigIntegerField(default=0, verbose_name='Importe en unidades m\xednimas de la moneda'),
+        ),
+        migrations.AddField(
+            model_name='vposoutboxevent',
+            name='currency',
+            field=models.CharField(choices=[('ARS', 'ARS'), ('AUD', 'AUD'), ('BGN', 'BGN'), ('BHD', 'BHD'), ('BRL', 'BRL'), ('CAD', 'CAD'), ('CHF', 'CHF'), ('CLP', 'CLP'), ('CNY', 'CNY'), ('COP', 'COP'), ('CZK', 'CZK'), ('DKK', 'DKK'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('HUF', 'HUF'), ('JPY', 'JPY'), ('KWD', 'KWD'), ('MAD', 'MAD'), ('MXN', 'MXN'), ('NOK', 'NOK'), ('PLN', 'PLN'), ('RON', 'RON'), ('SEK', 'SEK'), ('USD', 'USD')], default='EUR', max_length=3, verbose_name='Moneda (c\xf3digo ISO 4217)'),
+        ),
+        migrations.RunPython(fill_currency_and_amount_minor, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+########################################################################################################################
+## Modelos de djangovirtualpos.
+## - base: operaciones de pago, TPV genérico (VirtualPointOfSale) y registro de pasarelas.
+## - Un módulo por pasarela con su clase delegada. Las dependencias propias de cada pasarela
+##   (bs4, lxml, requests, Crypto, urllib2) se importan en los métodos que las usan, no al arrancar.
+## Todos los modelos se siguen importando desde djangovirtualpos.models.
+########################################################################################################################
+
+from djangovirtualpos.models.base import VPOS_TYPES, VPOS_TYPE_LABELS, VPOS_GATEWAYS, ENABLED_VPOS_TYPES, \
+    DELEGATED_CLASSES, register_gateway, is_enabled_vpos_type, build_registries, get_delegated_class, \
+    VPOS_STATUS_CHOICES, PENDING_TTL, get_pending_ttl, VPOS_REFUND_STATUS_CHOICES, VIRTUALPOS_STATE_TYPES, \
+    VPOSPaymentOperation, VPOSPaymentPayload, VPOSCantCharge, VPOSOperationNotImplemented, VPOSOperationException, \
+    VPOSOperationAlreadyConfirmed, VPOSNotificationIgnored, VirtualPointOfSale, VPOSRefundOperation, VPOSNotification, VPOSArchivedOperation, \
+    VPOS_FULFILLMENT_JOB_STATUS_CHOICES, VPOSFulfillmentJob, VPOSSpooledNotification, VPOSCardToken, VPOSOutboxEvent
+from djangovirtualpos.models.ceca import VPOSCeca
+from djangovirtualpos.models.redsys import AUTHORIZATION_TYPE, PREAUTHORIZATION_TYPE, DEFERRED_PREAUTHORIZATION_TYPE, \
+    OPERATIVE_TYPES, PREAUTHORIZATION_CONFIRMATION_TRANSACTION_TYPE, PREAUTHORIZATION_CANCELLATION_TRANSACTION_TYPE, \
+    redsys_hmac_sha256_signature, VPOSRedsys
+from djangovirtualpos.models.paypal import VPOSPaypal
+from djangovirtualpos.models.paypalrest import VPOSPaypalRest
+from djangovirtualpos.models.santanderelavon import VPOSSantanderElavon
+from djangovirtualpos.models.bitpay import VPOSBitpay
@@ -0,0 +1,1595 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals, print_function
+
+import calendar
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import zlib
+
+from decimal import Decimal
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.exceptions import ObjectDoesNotExist, ValidationError, DisallowedHost
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.validators import validate_ipv46_address
+from django.db import models, transaction, IntegrityError
+from django.db.models import Sum, Q
+from django.http.request import split_domain_port
+from django.utils import timezone, translation
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext_lazy as _
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.money import Money, CURRENCIES, CURRENCY_CHOICES
+from djangovirtualpos.util import localize_datetime, invalidate_form_data, get_form_data_cache, get_card_token_cache, \
+    card_token_cache_key, prefetched_operation_number_cache_key, CARD_TOKEN_CACHE_TTL, PREFETCH_VPOS_TYPES
+
+VPOS_TYPES = (
+    ("ceca", _("TPV Virtual - Confederación Española de Cajas de Ahorros (CECA)")),
+    ("paypal", _("Paypal")),
+    ("paypalrest", _("Paypal (REST)")),
+    ("redsys", _("TPV Redsys")),
+    ("santanderelavon", _("TPV Santander Elavon")),
+    ("bitpay", _("TPV Bitpay")),
+)
+
+## Relación entre tipos de TPVs y su nombre
+VPOS_TYPE_LABELS = dict(VPOS_TYPES)
+
+## Pasarelas disponibles: tipo de TPV -> ruta de la clase delegada.
+## Se pueden añadir pasarelas de otras aplicaciones con el setting VPOS_GATEWAYS (mismo formato)
+## o llamando a register_gateway desde el ready() de su AppConfig.
+VPOS_GATEWAYS = {
+    "ceca": "djangovirtualpos.models.ceca.VPOSCeca",
+    "redsys": "djangovirtualpos.models.redsys.VPOSRedsys",
+    "paypal": "djangovirtualpos.models.paypal.VPOSPaypal",
+    "paypalrest": "djangovirtualpos.models.paypalrest.VPOSPaypalRest",
+    "santanderelavon": "djangovirtualpos.models.santanderelavon.VPOSSantanderElavon",
+    "bitpay": "djangovirtualpos.models.bitpay.VPOSBitpay",
+}
+VPOS_GATEWAYS.update(getattr(settings, "VPOS_GATEWAYS", {}))
+
+## Tipos de TPV habilitados (setting VPOS_ENABLED_TYPES). None habilita todas las pasarelas disponibles.
+ENABLED_VPOS_TYPES = getattr(settings, "VPOS_ENABLED_TYPES", None)
+
+## Relación entre tipos de TPVs y clases delegadas ya resueltas.
+## Se construye una única vez al arrancar la aplicación (ver build_registries).
+DELEGATED_CLASSES = {}
+
+
+########################################################################
+## Registra (o sustituye) la clase delegada de un tipo de TPV
+def register_gateway(virtualpos_type, class_path):
+    VPOS_GATEWAYS[virtualpos_type] = class_path
+    DELEGATED_CLASSES.pop(virtualpos_type, None)
+
+
+########################################################################
+## Indica si el tipo de TPV tiene pasarela y está habilitado
+def is_enabled_vpos_type(virtualpos_type):
+    return virtualpos_type in VPOS_GATEWAYS and (ENABLED_VPOS_TYPES is None or
+                                                 virtualpos_type in ENABLED_VPOS_TYPES)
+
+
+########################################################################
+## Construye los registros de clases delegadas de las pasarelas habilitadas.
+## Se llama desde DjangoVirtualPOSConfig.ready, cuando ya están definidas todas las clases.
+def build_registries():
+    for virtualpos_type, class_path in VPOS_GATEWAYS.items():
+        if is_enabled_vpos_type(virtualpos_type):
+            DELEGATED_CLASSES[virtualpos_type] = import_string(class_path)
+
+
+########################################################################
+## Obtiene la clase delegada a partir del tipo de TPV.
+## La pasarela ha de estar registrada en VPOS_GATEWAYS y habilitada.
+def get_delegated_class(virtualpos_type):
+    try:
+        return DELEGATED_CLASSES[virtualpos_type]
+    except KeyError:
+        pass
+    if not is_enabled_vpos_type(virtualpos_type):
+        raise ValueError(_(u"The virtual point of sale {0} does not exist").format(virtualpos_type))
+    delegated_class = DELEGATED_CLASSES[virtualpos_type] = import_string(VPOS_GATEWAYS[virtualpos_type])
+    return delegated_class
+
+
+####################################################################
+## Opciones del campo STATUS
+## STATUS: estado en el que se encuentra la operación de pago
+VPOS_STATUS_CHOICES = (
+    ("pending", _(u"Pending")),
+    ("completed", _(u"Completed")),
+    ("failed", _(u"Failed")),
+    ("partially_refunded", _(u"Partially Refunded")),
+    ("completely_refunded", _(u"Completely Refunded")),
+    ("expired", _(u"Expired")),
+    ("authorized", _(u"Authorized (pending capture)")),
+    ("released", _(u"Released")),
+)
+
+####################################################################
+## Tiempo de vida (en minutos) de las operaciones pendientes de cada tipo de TPV.
+## Pasado este tiempo la operación ya no se reutiliza para la misma venta y
+## se marca como caducada (ver djangovirtualpos.expiry).
+## Las operaciones con fecha de caducidad propia (invoices de Bitpay) caducan en esa fecha.
+PENDING_TTL = {
+    "default": 24 * 60,
+}
+PENDING_TTL.update(getattr(settings, "VPOS_PENDING_TTL", {}))
+
+
+def get_pending_ttl(virtualpos_type):
+    """
+    Tiempo de vida de las operaciones pendientes del tipo de TPV indicado.
+    :return: datetime.timedelta
+    """
+    return datetime.timedelta(minutes=PENDING_TTL.get(virtualpos_type, PENDING_TTL["default"]))
+
+VPOS_REFUND_STATUS_CHOICES = (
+    ("pending", _(u"Pending")),
+    ("completed", _(u"Completed")),
+    ("failed", _(u"Failed")),
+)
+
+####################################################################
+## Tipos de estado del TPV
+VIRTUALPOS_STATE_TYPES = (
+    ("testing", "Pruebas"),
+    ("production", "Producción")
+)
+
+
+####################################################################
+## Operación de pago de TPV
+class VPOSPaymentOperation(models.Model):
+    """
+    Configuratión del pago para un TPV
+    """
+    amount = models.DecimalField(max_digits=12, decimal_places=3, null=False, blank=False,
+                                 verbose_name=u"Coste de la operación")
+    # Importe exacto en unidades mínimas de la moneda (p.ej. céntimos). Es el importe de referencia: las pasarelas
+    # firman y envían éste (ver money) y las sumas de devoluciones se hacen sobre esta columna entera.
+    # amount tiene tres decimales para las monedas que los usan (BHD, KWD) y se redondea a los de la moneda al guardar.
+    amount_minor = models.BigIntegerField(default=0, editable=False,
+                                          verbose_name=u"Importe en unidades mínimas de la moneda")
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="EUR",
+                                verbose_name=u"Moneda (código ISO 4217)")
+    description = models.CharField(max_length=512, null=False, blank=False, verbose_name=u"Descripción de la venta")
+    url_ok = models.CharField(max_length=255, null=False, blank=False, verbose_name=u"URL de OK",
+                              help_text=u"URL a la que redirige la pasarela bancaria cuando la compra ha sido un éxito")
+    url_nok = models.CharField(max_length=255, null=False, blank=False, verbose_name=u"URL de NOK",
+                               help_text=u"URL a la que redirige la pasarela bancaria cuando la compra ha fallado")
+    operation_number = models.CharField(max_length=255, null=False, blank=False, verbose_name=u"Número de operación")
+    confirmation_code = models.CharField(max_length=255, null=True, blank=False,
+                                         verbose_name="Código de confirmación enviado por el banco.")
+    confirmation_data = models.TextField(null=True, blank=False,
+                                         verbose_name="POST enviado por la pasarela bancaria al confirmar la compra.")
+    sale_code = models.CharField(max_length=512, null=False, blank=False, verbose_name=u"Código de la venta",
+                                 help_text=u"Código de la venta según la aplicación.")
+    status = models.CharField(max_length=64, choices=VPOS_STATUS_CHOICES, null=False, blank=False,
+                              verbose_name=u"Estado del pago")
+
+    response_code = models.CharField(max_length=255, null=True, blank=False,
+                                     verbose_name=u"Código de respuesta con estado de aceptación o denegación de la operación.")
+
+    creation_datetime = models.DateTimeField(verbose_name="Fecha de creación del objeto")
+    last_update_datetime = models.DateTimeField(verbose_name="Fecha de última actualización del objeto")
+
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+    virtual_point_of_sale = models.ForeignKey("VirtualPointOfSale", parent_link=True, related_name="payment_operations",
+                                              null=False)
+    environment = models.CharField(max_length=255, choices=VIRTUALPOS_STATE_TYPES, default="", blank=True,
+                                   verbose_name="Entorno del TPV")
+    expiration_datetime = models.DateTimeField(null=True, blank=True, verbose_name="Fecha de caducidad del pago",
+                                               help_text=u"Fecha de caducidad indicada por la pasarela "
+                                                         u"(p.ej. la del invoice de Bitpay).")
+
+    class Meta:
+        # Búsqueda de operaciones pendientes caducadas (ver djangovirtualpos.expiry)
+        index_together = (
+            ("status", "creation_datetime"),
+            ("status", "expiration_datetime"),
+        )
+
+    # Las operaciones reconstruidas desde el archivo (ver VPOSArchivedOperation) lo tienen a True
+    is_archived = False
+
+    # Estado con el que se cargó la operación de BD, para detectar los cambios de estado al guardar
+    _loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(VPOSPaymentOperation, cls).from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    @property
+    def vpos(self):
+        return self.virtual_point_of_sale
+
+    ## Almacena los datos de la notificación del banco como JSON compacto
+    def set_confirmation_data(self, data):
+        """
+        Guarda los datos recibidos en la notificación de la pasarela como JSON compacto.
+        Las respuestas posteriores (settle, void...) no se concatenan aquí, se añaden con append_payload.
+        """
+        self.confirmation_data = json.dumps(data, separators=(",", ":"))
+
+    @property
+    def confirmation_payload(self):
+        """
+        Datos de la notificación del banco deserializados.
+        Las operaciones antiguas guardaban la representación Python del diccionario, en ese caso se devuelve el texto.
+        """
+        if self.confirmation_data is None:
+            return None
+        try:
+            return json.loads(self.confirmation_data)
+        except ValueError:
+            return self.confirmation_data
+
+    ## Añade una entrada al registro de comunicaciones con la pasarela de esta operación
+    def append_payload(self, kind, data):
+        return VPOSPaymentPayload.append(operation=self, kind=kind, data=data)
+
+    @property
+    def money(self):
+        """Importe exacto de la operación (ver djangovirtualpos.money.Money)."""
+        return Money(self.amount_minor, self.currency)
+
+    @property
+    def total_minor_units_refunded(self):
+        """Suma (entera, en unidades mínimas de la moneda) de las devoluciones completadas."""
+        return self.refund_operations.filter(status='completed')\
+            .aggregate(Sum('amount_minor'))['amount_minor__sum'] or 0
+
+    @property
+    def total_amount_refunded(self):
+        total_minor_units = self.total_minor_units_refunded
+        if not total_minor_units:
+            return None
+        return Money(total_minor_units, self.currency).amount
+
+    # Comprueba si un pago ha sido totalmente debuelto y cambia el estado en coherencias.
+    def compute_payment_refunded_status(self):
+        total_minor_units_refunded = self.total_minor_units_refunded
+
+        if total_minor_units_refunded == self.amount_minor:
+            self.status = "completely_refunded"
+
+        elif total_minor_units_refunded < self.amount_minor:
+            dlprint('Devolución parcial de pago.')
+            self.status = "partially_refunded"
+
+        elif total_minor_units_refunded > self.amount_minor:
+            raise ValueError(u'ERROR. Este caso es imposible, no se puede reembolsar una cantidad superior al pago.')
+
+        self.save()
+
+    ## Guarda el objeto en BD, en realidad lo único que hace es actualizar los datetimes
+    def save(self, *args, **kwargs):
+        """
+        Guarda el objeto en BD, en realidad lo único que hace es actualizar los datetimes.
+        El datetime de actualización se actualiza siempre, el de creación sólo al guardar de nuevas.
+        """
+        # Datetime con el momento actual en UTC
+        now_datetime = datetime.datetime.now()
+        # Si no se ha guardado aún, el datetime de creación es la fecha actual
+        if not self.id:
+            self.creation_datetime = localize_datetime(now_datetime)
+        # El datetime de actualización es la fecha actual
+        self.last_update_datetime = localize_datetime(now_datetime)
+        # Importe en unidades mínimas de la moneda, amount queda con los decimales de la moneda
+        money = Money.from_amount(self.amount, self.currency)
+        self.amount_minor = money.minor_units
+        self.amount = money.amount
+        # El cambio de estado se registra en el outbox en la misma transacción
+        with transaction.atomic():
+            # Llamada al constructor del padre
+            super(VPOSPaymentOperation, self).save(*args, **kwargs)
+            if self.status != self._loaded_status:
+                VPOSOutboxEvent.record(self, from_status=self._loaded_status, to_status=self.status)
+                # El formulario de pago cacheado sólo es válido mientras la operación está pendiente
+                if self._loaded_status == "pending":
+                    form_data_key = [(self.virtual_point_of_sale_id, self.sale_code)]
+                    transaction.on_commit(lambda: invalidate_form_data(form_data_key))
+        self._loaded_status = self.status
+
+    ## Guarda los datos de la notificación de la pasarela, una vez verificada
+    def save_confirmation(self):
+        self.save(update_fields=("confirmation_data", "confirmation_code", "response_code", "last_update_datetime"))
+        dlprint(u"Operation {0} actualizada con los datos de la notificación".format(self.operation_number))
+
+    ## Números de operación ya usados
+    @staticmethod
+    def taken_operation_numbers(operation_numbers):
+        """
+        Devuelve los números de operación de la lista que ya están usados, también por operaciones archivadas
+        (VPOSArchivedOperation): la pasarela los conoce y se siguen buscando por número de operación.
+        Una consulta por tabla.
+        """
+        taken = set(VPOSPaymentOperation.objects.filter(operation_number__in=operation_numbers)
+                    .values_list("operation_number", flat=True))
+        taken.update(VPOSArchivedOperation.objects.filter(operation_number__in=operation_numbers)
+                     .values_list("operation_number", flat=True))
+        return taken
+
+    ## Cambia en bloque el estado de varias operaciones
+    @staticmethod
+    def bulk_update_status(operation_ids, from_status, to_status, now=None, sale_model=None):
+        """
+        Cambia de from_status a to_status el estado de las operaciones indicadas que sigan en from_status,
+        con un único UPDATE, y registra los cambios en el outbox en la misma transacción.
+        :param sale_model: modelo de venta de la aplicación. Si se indica y las operaciones pasan a "completed"
+                           (o a "authorized", cobro retenido), en la misma transacción se crea el trabajo de confirmación (VPOSFulfillmentJob)
+                           de la venta de cada operación actualizada.
+        :return: número de operaciones actualizadas
+        """
+        return len(VPOSPaymentOperation._bulk_update_status(operation_ids, from_status, to_status, now=now,
+                                                            sale_model=sale_model)[0])
+
+    @staticmethod
+    def _bulk_update_status(operation_ids, from_status, to_status, now=None, sale_model=None):
+        """
+        Igual que bulk_update_status.
+        :return: tupla (lista de operaciones actualizadas, lista de trabajos de confirmación creados)
+        """
+        if now is None:
+            now = timezone.now()
+        with transaction.atomic():
+            operations = list(VPOSPaymentOperation.objects.select_for_update().filter(
+                id__in=operation_ids, status=from_status).only("id", "operation_number", "sale_code", "type",
+                                                               "amount", "amount_minor", "currency",
+                                                               "virtual_point_of_sale_id"))
+            if not operations:
+                return [], []
+            VPOSPaymentOperation.objects.filter(id__in=[operation.id for operation in operations])\
+                .update(status=to_status, last_update_datetime=now)
+            VPOSOutboxEvent.objects.bulk_create([
+                VPOSOutboxEvent.build(operation, from_status=from_status, to_status=to_status)
+                for operation in operations
+            ])
+            if from_status == "pending":
+                form_data_keys = [(operation.virtual_point_of_sale_id, operation.sale_code) for operation in operations]
+                transaction.on_commit(lambda: invalidate_form_data(form_data_keys))
+            jobs = []
+            # Igual que en confirm_payment, la venta se confirma también cuando el importe queda retenido
+            if sale_model is not None and to_status in ("completed", "authorized"):
+                jobs = [VPOSFulfillmentJob.enqueue(sale_model, operation.operation_number) for operation in operations]
+        return operations, jobs
+
+
+####################################################################
+## Registro de comunicaciones con la pasarela de una operación
+class VPOSPaymentPayload(models.Model):
+    """
+    Registro de sólo inserción con los mensajes intercambiados con la pasarela para una operación
+    (respuestas settle/void, respuestas REST...).
+    Los cuerpos se guardan comprimidos y fuera de la tabla de operaciones, de forma que las filas
+    de VPOSPaymentOperation no crecen con cada comunicación y sólo se leen cuando se necesitan.
+    """
+    operation = models.ForeignKey(VPOSPaymentOperation, on_delete=models.CASCADE, related_name="payloads")
+    kind = models.CharField(max_length=32, null=False, blank=False, verbose_name=u"Tipo de mensaje")
+    body = models.BinaryField(verbose_name=u"Contenido comprimido (zlib) del mensaje")
+    size = models.PositiveIntegerField(default=0, verbose_name=u"Tamaño sin comprimir del mensaje")
+    creation_datetime = models.DateTimeField(verbose_name="Fecha de creación del objeto")
+
+    class Meta:
+        ordering = ["id"]
+
+    ## Inserta un nuevo mensaje (una única sentencia INSERT)
+    @staticmethod
+    def append(operation, kind, data):
+        if not isinstance(data, basestring):
+            data = json.dumps(data, separators=(",", ":"))
+        raw_data = data.encode("utf-8") if isinstance(data, unicode) else data
+        return VPOSPaymentPayload.objects.create(
+            operation=operation, kind=kind, body=zlib.compress(raw_data), size=len(raw_data),
+            creation_datetime=localize_datetime(datetime.datetime.now())
+        )
+
+    @property
+    def data(self):
+        return zlib.decompress(bytes(self.body)).decode("utf-8")
+
+
+####################################################################
+####################################################################
+
+# Excepción para indicar que la operación charge ha devuelto una respuesta incorrecta o de fallo
+class VPOSCantCharge(Exception): pass
+
+
+# Excepción para indicar que no se ha implementado una operación para un tipo de TPV en particular.
+class VPOSOperationNotImplemented(Exception): pass
+
+
+# Cuando se produce un error al realizar una operación en concreto.
+class VPOSOperationException(Exception): pass
+
+
+# La operacióm ya fue confirmada anteriormente mediante otra notificación recibida
+class VPOSOperationAlreadyConfirmed(Exception): pass
+
+
+# Notificación repetida, superada por otra o irrelevante, que se descarta sin tocar la BD.
+# Lleva la respuesta que espera la pasarela.
+class VPOSNotificationIgnored(Exception):
+    def __init__(self, message, response):
+        super(VPOSNotificationIgnored, self).__init__(message)
+        self.response = response
+
+
+####################################################################
+## Clase que contiene las operaciones de pago de forma genérica
+## actúa de fachada de forma que el resto del software no conozca
+##
+class VirtualPointOfSale(models.Model):
+    """
+    Clases que actúa como clase base para la relación de especialización.
+
+    Cada clase especializada estará relacionada con ésta en una relación
+    uno a uno.
+
+    Esta clase no podrá tener un campo para mantener las relaciones con
+    las clases especializadas ya que cada una estará en tablas diferentes.
+
+    Para este modelo se crea la tabla de forma automática con syncdb.
+    """
+
+    ## Nombre único del TPV
+    name = models.CharField(max_length=128, null=False, blank=False, verbose_name="Nombre")
+
+    ## Nombre único del banco que tiene asociado el TPV
+    bank_name = models.CharField(max_length=128, null=False, blank=False, verbose_name="Nombre de la entidad bancaria")
+
+    ## Tipo de TPV. Indica la naturaleza del TPV.
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+
+    ## Nombre del distribuidor del plan
+    distributor_name = models.CharField(null=False, blank=True, max_length=512,
+                                        verbose_name="Razón social del distribuidor",
+                                        help_text="Razón social del distribuidor.")
+
+    ## CIF del organizador del plan
+    distributor_cif = models.CharField(null=False, blank=True, max_length=150,
+                                       verbose_name="CIF del distribuidor",
+                                       help_text="C.I.F. del distribuidor.")
+
+    ## Estado del TPV: por si es de pruebas o de producción
+    environment = models.CharField(max_length=16, null=False, blank=False, choices=VIRTUALPOS_STATE_TYPES,
+                                   default="testing",
+                                   verbose_name="Entorno de ejecución del TPV",
+                                   help_text="Entorno de ejecución en el que se encuentra el TPV. Una vez que el TPV esté en entorno de 'producción' no cambie a entorno de 'pruebas' a no ser que esté seguro de lo que hace.")
+
+    ## Permite realizar devoluciones parciales
+    has_partial_refunds = models.BooleanField(default=False, verbose_name="Indica si tiene devoluciones parciales.",
+                                              help_text="Indica si se pueden realizar devoluciones por un importe menor que el total de la venta (por ejemplo, para devolver tickets individuales).")
+
+    ## Permite realizar devoluciones totales
+    has_total_refunds = models.BooleanField(default=False, verbose_name="Indica si tiene devoluciones totales.",
+                                            help_text="Indica si se pueden realizar devoluciones por un importe igual al total de la venta.")
+
+    ## Borrados lógicos
+    is_erased = models.BooleanField(default=False, verbose_name="Indica si el TPV está eliminado.",
+                                    help_text="Indica si el TPV está eliminado de forma lógica.")
+
+    ## Configuración de la operación de pago (actúa también como registro de la operación de pago)
+    operation = None
+
+    ## Objeto en el que se delegan las llamadas específicas de la pasarela de pagos dependiente del tipo de TPV
+    delegated = None
+
+    ## Estado en el que queda la operación tras un cobro correcto.
+    ## Los delegados lo cambian a "authorized" cuando el importe sólo queda retenido y se captura más adelante.
+    charged_status = "completed"
+
+    ## Los delegados cuyo formulario de pago sólo depende de la operación y de su configuración
+    ## (sin marcas de tiempo) lo ponen a True para reutilizar el formulario firmado (ver getPaymentFormData)
+    memoize_payment_form_data = False
+
+    ## Los delegados que obtienen el número de operación de la pasarela (una petición en setupPayment) lo ponen a True
+    ## para poder crearlo de antemano en segundo plano (ver djangovirtualpos.prefetch)
+    prefetch_operation_number = False
+
+    ## Los delegados lo ponen a True en verifyConfirmation cuando la firma de la notificación es correcta,
+    ## aunque el pago no se haya autorizado (p.ej. tarjeta denegada). Sólo entonces se guardan sus datos.
+    notification_authenticated = False
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "virtual point of sale"
+        verbose_name_plural = "virtual points of sale"
+        permissions = (
+            ("view_virtualpointofsale", "View Virtual Points of Sale"),
+        )
+
+    def __unicode__(self):
+        return self.name
+
+    def meta(self):
+        """Obtiene la metainformación de objetos de este modelo."""
+        return self._meta
+
+    @property
+    def operation_prefix(self):
+        """
+        Prefijo de operación asociado a este TPV.
+        Se consulta al delegado para obtenerlo.
+        :return: string | None
+        """
+        self._init_delegated()
+        # Algunos tipos de TPV no tienen este atributo (PayPal)
+        if hasattr(self.delegated, "operation_number_prefix"):
+            prefix = getattr(self.delegated, "operation_number_prefix")
+        else:
+            prefix = "n/a"
+
+        return prefix
+
+    ####################################################################
+    ## Elimina de forma lógica el objeto
+    def erase(self):
+        self.is_erased = True
+        self.save()
+
+    ####################################################################
+    ## Obtiene el texto de ayuda del tipo del TPV
+    def get_type_help(self):
+        return VPOS_TYPE_LABELS.get(self.type, self.type)
+
+    ####################################################################
+    ## Obtiene el código de idioma de la pasarela (diccionario IDIOMAS del delegado)
+    ## a partir del idioma actual. Por defecto es español.
+    def get_gateway_language(self):
+        return self.IDIOMAS.get(translation.get_language(), self.IDIOMAS["es"])
+
+    ####################################################################
+    ## Devuelve el TPV específico
+    @property
+    def specific_vpos(self):
+        delegated_class = get_delegated_class(self.type)
+        try:
+            return delegated_class.objects.get(parent_id=self.id)
+        except delegated_class.DoesNotExist as e:
+            raise ValueError(u" No existe ningún vpos del tipo {0} con el identificador {1}".format(self.type, self.id))
+
+    ####################################################################
+    ## Constructor: Inicializa el objeto TPV
+    def _init_delegated(self):
+        """
+        Devuelve la configuración del TPV como una instancia del
+        modelo hijo asociado.
+
+        Como, en función del TPV, la configuración se almacena en tablas
+        diferentes y, por lo tanto, cada una tiene su propio modelo,
+        el resultado devuelto por esta función será una instancia del
+        modelo correspondiente.
+
+        Este método habrá que actualizarlo cada vez que se añada un
+        TPV nuevo.
+        """
+
+        self.delegated = None
+        delegated_class = get_delegated_class(self.type)
+
+        try:
+            self.delegated = delegated_class.objects.get(parent_id=self.id)
+        except delegated_class.DoesNotExist as e:
+            raise ValueError(
+                unicode(e) + u" No existe ningún vpos del tipo {0} con el identificador {1}".format(self.type, self.id))
+
+        # Necesito los datos dinámicos de mi padre, que es un objeto de
+        # la clase Tpv, si usásemos directamente desde el delegated
+        # self.parent, se traería de la BD los datos de ese objeto
+        # y nosotros queremos sus datos y además, sus atributos dinámicos
+        self.delegated.parent = self
+
+        return self.delegated
+
+    ####################################################################
+    ## Obtiene un objeto TPV a partir de una serie de filtros
+    @staticmethod
+    def get(**kwargs):
+        vpos = VirtualPointOfSale.objects.get(**kwargs)
+        vpos._init_delegated()
+        return vpos
+
+    ####################################################################
+    ## Paso 1.1. Configuración del pago
+    def configurePayment(self, amount, description, url_ok, url_nok, sale_code):
+        """
+        Configura el pago por TPV.
+        Prepara el objeto TPV para
+        - Pagar una cantidad concreta
+        - Establecera una descripción al pago
+        - Establecer las URLs de OK y NOK
+        - Alamacenar el código de venta de la operación
+        """
+        # El importe se guarda como Decimal exacto (nunca como float)
+        if isinstance(amount, Money):
+            amount = amount.amount
+        elif isinstance(amount, float):
+            amount = Decimal(repr(amount))
+        elif isinstance(amount, (int, long)):
+            amount = Decimal(amount)
+        if not isinstance(amount, Decimal) or amount < 0:
+            raise ValueError(u"La cantidad debe ser un número positivo")
+        if sale_code is None or sale_code == "":
+            raise ValueError(u"El código de venta no puede estar vacío")
+        if description is None or description == "":
+            raise ValueError(u"La descripción de la venta no puede estar vacía")
+        # Estas dos condiciones se han de eliminar
+        # si algún TPV no utiliza url_ok y url_nok
+        if url_ok is None or type(url_ok) != str or url_ok == "":
+            raise ValueError(u"La url_ok no puede estar vacía. Ha de ser un str.")
+        if url_nok is None or type(url_nok) != str or url_nok == "":
+            raise ValueError(u"La url_nok no puede estar vacía. Ha de ser un str.")
+
+        # Creación de la operación
+        # (se guarda cuando se tenga el número de operación)
+        # Las monedas que no son ISO 4217 (p.ej. BTC en Bitpay) se guardan con la moneda por defecto
+        currency = getattr(self.delegated, "currency", None)
+        if currency not in CURRENCIES:
+            currency = "EUR"
+        money = Money.from_amount(amount, currency)
+        self.operation = VPOSPaymentOperation(
+            amount=money.amount, amount_minor=money.minor_units, currency=currency, description=description, url_ok=url_ok, url_nok=url_nok,
+            sale_code=sale_code, status="pending",
+            virtual_point_of_sale=self, type=self.type, environment=self.environment
+        )
+
+        # Configuración específica (requiere que exista self.operation)
+        self.delegated.configurePayment()
+
+    ####################################################################
+    ## Paso 1.2. Preparación del TPV y Generación del número de operación
+    def setupPayment(self):
+        """
+        Prepara el TPV.
+        Genera el número de operación y prepara el proceso de pago.
+        """
+        if self.operation is None:
+            raise Exception(u"No se ha configurado la operación, ¿ha llamado a vpos.configurePayment antes?")
+
+        # Comprobamos que no se tenga ya un segundo código de operación
+        # de TPV para el mismo código de venta
+        # Si existe, devolvemos el número de operación existente
+        # Las operaciones pendientes caducadas no se reutilizan aunque aún no se hayan marcado como caducadas
+        now = timezone.now()
+        stored_operation = VPOSPaymentOperation.objects.defer("confirmation_data").filter(
+            Q(expiration_datetime__isnull=True) | Q(expiration_datetime__gt=now),
+            sale_code=self.operation.sale_code,
+            status="pending",
+            virtual_point_of_sale_id=self.operation.virtual_point_of_sale_id,
+            creation_datetime__gte=now - get_pending_ttl(self.type)
+        ).first()
+        if stored_operation is not None:
+            self.operation = stored_operation
+            return self.delegated.setupPayment(operation_number=self.operation.operation_number)
+
+        # Número de operación creado de antemano en segundo plano para este mismo pago (ver djangovirtualpos.prefetch)
+        prefetched = self._take_prefetched_operation_number()
+        if prefetched is not None:
+            operation_number, expiration_datetime = prefetched
+            # Igual que los números nuevos, tiene que ser único (también entre las operaciones archivadas)
+            if VPOSPaymentOperation.taken_operation_numbers([operation_number]):
+                dlprint("El número de operación obtenido de antemano {0} ya está usado".format(operation_number))
+            else:
+                self.operation.operation_number = self.delegated.setupPayment(operation_number=operation_number)
+                if expiration_datetime is not None:
+                    self.operation.expiration_datetime = expiration_datetime
+                self.operation.save()
+                dlprint("Operation {0} creada en BD con el número de operación obtenido de antemano".format(
+                    operation_number))
+                return self.operation.operation_number
+
+        # No existe un código de operación de TPV anterior para
+        # este código de venta, por lo que generamos un número de operación nuevo
+        # Comprobamos que el número de operación generado por el delegado
+        # es único en la tabla de TpvPaymentOperation y en la de operaciones archivadas
+        operation_number = None
+        while operation_number is None or VPOSPaymentOperation.taken_operation_numbers([operation_number]):
+            operation_number = self.delegated.setupPayment()
+            dlprint("entra al delegado para configurar el operation number:{0}".format(operation_number))
+
+        # Asignamos el número de operación único
+        self.operation.operation_number = operation_number
+        self.operation.save()
+        dlprint("Operation {0} creada en BD".format(operation_number))
+        return self.operation.operation_number
+
+    ## Clave de caché del número de operación creado de antemano para el pago configurado
+    def _prefetched_operation_number_cache_key(self):
+        operation = self.operation
+        return prefetched_operation_number_cache_key(self.id, [
+            self.environment, operation.sale_code, operation.amount_minor, operation.currency,
+            operation.description, operation.url_ok, operation.url_nok
+        ])
+
+    ## Obtiene (y retira de la caché) el número de operación creado de antemano para el pago configurado
+    def _take_prefetched_operation_number(self):
+        """
+        :return: tupla (número de operación, fecha de caducidad o None) | None si no se ha creado de antemano
+        """
+        cache = get_form_data_cache()
+        if cache is None or self.type not in PREFETCH_VPOS_TYPES or not self.delegated.prefetch_operation_number:
+            return None
+        from djangovirtualpos.prefetch import PREFETCH_TTL
+        cache_key = self._prefetched_operation_number_cache_key()
+        prefetched = cache.get(cache_key)
+        if prefetched is None:
+            return None
+        # Cada token sólo se usa una vez: de varias peticiones simultáneas, sólo la que lo reserva
+        # (un único add en la caché) lo usa. El resto crean un número de operación nuevo.
+        if not cache.add(u"{0}:taken:{1}".format(cache_key, prefetched[0]), 1, PREFETCH_TTL):
+            return None
+        cache.delete(cache_key)
+        return prefetched
+
+    ####################################################################
+    ## Paso 1.3. Obtiene los datos de pago
+    ## Este método será el que genere los campos del formulario de pago
+    ## que se rellenarán desde el cliente (por Javascript)
+    def getPaymentFormData(self, *args, **kwargs):
+        if self.operation.operation_number is None:
+            raise Exception(u"No se ha generado el número de operación, ¿ha llamado a vpos.setupPayment antes?")
+
+        # Si se reutiliza una operación pendiente sin cambios, se devuelve el formulario ya firmado
+        cache = get_form_data_cache() if self.delegated.memoize_payment_form_data else None
+        if cache is not None:
+            cache_key = "djangovirtualpos:signed_form:{0}".format(self._payment_form_data_digest(args, kwargs))
+            data = cache.get(cache_key)
+            if data is not None:
+                return data
+
+        data = self.delegated.getPaymentFormData(*args, **kwargs)
+        data["type"] = self.type
+
+        if cache is not None:
+            cache.set(cache_key, data, int(get_pending_ttl(self.type).total_seconds()))
+        return data
+
+    def _payment_form_data_digest(self, args, kwargs):
+        """
+        Resumen de los datos de los que depende el formulario firmado: configuración guardada del TPV,
+        operación (número, importe en unidades mínimas, moneda, descripción y URLs), idioma actual
+        y parámetros de getPaymentFormData. El resto del estado del delegado (importe formateado, código
+        numérico de la moneda, idioma de la pasarela...) se calcula a partir de éstos en configurePayment.
+        Si cambia cualquiera de ellos, cambia el resumen y el formulario se vuelve a generar.
+        """
+        delegated = self.delegated
+        operation = self.operation
+        configuration = [getattr(delegated, field.attname) for field in delegated._meta.concrete_fields]
+        inputs = [delegated._meta.label, self.environment, configuration, operation.operation_number,
+                  operation.amount_minor, operation.currency, operation.description, operation.url_ok,
+                  operation.url_nok, operation.sale_code, translation.get_language(), args, sorted(kwargs.items())]
+        return hashlib.sha256(json.dumps(inputs, default=unicode).encode("utf-8")).hexdigest()
+
+    ####################################################################
+    ## Paso 2. Envío de los datos de la transacción (incluyendo "amount")
+    ## a la pasarela bancaria, a partir del número de operación.
+    ## TODO: no se implementa hasta que sea necesario.
+    def getPaymentDetails(self):
+        pass
+
+    ####################################################################
+    ## Paso 3.1. Obtiene el número de operación y los datos que nos
+    ## envíe la pasarela de pago para luego realizar la verificación.
+    @staticmethod
+    def receiveConfirmation(request, virtualpos_type):
+
+        delegated_class = get_delegated_class(virtualpos_type)
+        delegated = delegated_class.receiveConfirmation(request)
+
+        if delegated:
+            vpos = delegated.parent
+            return vpos
+
+        return False
+
+    ####################################################################
+    ## Paso 3.2. Realiza la verificación de los datos enviados por
+    ## la pasarela de pago, para comprobar si el pago ha de marcarse
+    ## como pagado
+    def verifyConfirmation(self):
+        """
+        Verifica la notificación y, sólo si es auténtica, guarda en una única escritura los datos recibidos,
+        que receiveConfirmation deja en la operación sin guardar.
+        Las notificaciones falsas o corruptas no escriben en la tabla de operaciones.
+        """
+        dlprint("vpos.verifyConfirmation")
+        verified = self.delegated.verifyConfirmation()
+        if (verified or self.delegated.notification_authenticated) and \
+                isinstance(self.operation, VPOSPaymentOperation):
+            self.operation.save_confirmation()
+        return verified
+
+    ####################################################################
+    ## Paso 3.3 Enviar respuesta al TPV,
+    ## la respuesta pueden ser la siguientes:
+
+    ####################################################################
+    ## Paso 3.3a Completar el pago.
+    ## Última comunicación con el TPV.
+    ## La comunicación real sólo se realiza en PayPal y Santander Elavon, dado que en CECA
+    ## y otros tienen una verificación y una respuesta con "OK".
+    ## En cualquier caso, es necesario que la aplicación llame a este
+    ## método para terminar correctamente el proceso.
+    def charge(self, **kwargs):
+        # Bloquear otras transacciones
+        VPOSPaymentOperation.objects.select_for_update().filter(id=self.operation.id)
+
+        # Realizamos el cargo
+        response = self.delegated.charge(**kwargs)
+
+        if response:
+            # Cambiamos el estado de la operación
+            self.operation.status = self.delegated.charged_status
+            dlprint("Operation {0} actualizada en charge()".format(self.operation.operation_number))
+        self.operation.save()
+
+        # Devolvemos el cargo
+        return response
+
+    ####################################################################
+    ## Paso 3.3b1. Error en verificación.
+    ## No se ha podido recuperar la instancia de TPV de la respuesta del
+    ## banco. Se devuelve una respuesta de Nok específica por tipo de TPV.
+    @staticmethod
+    def staticResponseNok(vpos_type):
+        dlprint("vpos.staticResponseNok")
+
+        delegated_class = get_delegated_class(vpos_type)
+        dummy_delegated = delegated_class()
+
+        return dummy_delegated.responseNok()
+
+    ####################################################################
+    ## Paso 3.3b2. Error en verificación.
+    ## Si ha habido un error en la veritificación, se ha de dar una
+    ## respuesta negativa a la pasarela bancaria.
+    def responseNok(self, extended_status=""):
+        dlprint("vpos.responseNok")
+        self.operation.status = "failed"
+
+        if extended_status:
+            self.operation.status = u"{0}. {1}".format(self.operation.status, extended_status)
+
+        self.operation.save()
+
+        return self.delegated.responseNok()
+
+    ####################################################################
+    ## Paso R1 (Refund) Configura el TPV en modo devolución y ejecuta la operación
+    ## TODO: Se implementa solo para Redsys
+    def refund(self, operation_sale_code, refund_amount, description):
+        """
+        1. Realiza las comprobaciones necesarias, para determinar si la operación es permitida,
+           (en caso contrario se lanzan las correspondientes excepciones).
+        2. Crea un objeto VPOSRefundOperation (con estado pendiente).
+        3. Llama al delegado, que implementa las particularidades para la comunicación con el TPV concreto.
+        4. Actualiza el estado del pago, según se encuentra 'parcialmente devuelto' o 'totalmente devuelto'.
+        5. Actualiza el estado de la devolución a 'completada' o 'fallada'.
+
+        @param operation_sale_code: Código del pago que pretendemos reembolsar.
+        @param refund_amount: Cantidad del pago que reembolsamos
+        @param description: Descripción del motivo por el cual se realiza la devolución.
+        """
+
+        try:
+            # Cargamos la operación sobre la que vamos a realizar la devolución.
+            payment_operation = VPOSPaymentOperation.objects.defer("confirmation_data").get(
+                sale_code=operation_sale_code, status='completed')
+        except ObjectDoesNotExist:
+            raise Exception(u"No se puede cargar una operación anterior completada con el código"
+                            u" {0}".format(operation_sale_code))
+
+        if (not self.has_total_refunds) and (not self.has_partial_refunds):
+            raise Exception(u"El TPV no admite devoluciones, ni totales, ni parciales")
+
+        if refund_amount > payment_operation.amount:
+            raise Exception(u"Imposible reembolsar una cantidad superior a la del pago")
+
+        if (refund_amount < payment_operation.amount) and (not self.has_partial_refunds):
+            raise Exception(u"Configuración del TPV no permite realizar devoluciones parciales")
+
+        if (refund_amount == payment_operation.amount) and (not self.has_total_refunds):
+            raise Exception(u"Configuración del TPV no permite realizar devoluciones totales")
+
+        # Creamos la operación, marcandola como pendiente.
+        self.operation = VPOSRefundOperation(amount=refund_amount,
+                                             description=description,
+                                             operation_number=payment_operation.operation_number,
+                                             status='pending',
+                                             payment=payment_operation)
+
+        self.operation.save()
+
+        # Llamamos al delegado que implementa la funcionalidad en particular.
+        refund_response = self.delegated.refund(operation_sale_code, refund_amount, description)
+
+        if refund_response:
+            refund_status = 'completed'
+        else:
+            refund_status = 'failed'
+
+        self.operation.status = refund_status
+        self.operation.save()
+
+        # Calcula el nuevo estado del pago, en función de la suma de las devoluciones,
+        # (pudiendolo marcas como "completely_refunded" o "partially_refunded").
+        payment_operation.compute_payment_refunded_status()
+
+        return refund_response
+
+    ####################################################################
+    ## Paso R2.a. Respuesta positiva a confirmación asíncrona de refund
+    def refund_response_ok(self, extended_status=""):
+        dlprint("vpos.refund_response_ok")
+        return self.delegated.refund_response_ok()
+
+    ####################################################################
+    ## Paso R2.b. Respuesta negativa a confirmación asíncrona de refund
+    def refund_response_nok(self, extended_status=""):
+        dlprint("vpos.refund_response_nok")
+        return self.delegated.refund_response_nok()
+
+    ####################################################################
+    ## Paso Q1 (Query) Consulta el estado de operaciones en la pasarela
+    def query_status(self, operations):
+        """
+        Consulta en la pasarela el estado de varias operaciones de este TPV (p.ej. cuando no ha llegado la notificación).
+        Cada delegado hace las consultas en paralelo usando la sesión HTTP compartida (util.get_http_session).
+        No modifica las operaciones, ver djangovirtualpos.polling.
+
+        @param operations: lista de VPOSPaymentOperation de este TPV.
+        @return: dict id de operación -> nuevo estado ("completed", "authorized", "failed", "expired")
+                 o None si sigue pendiente o no se ha podido consultar.
+        """
+        dlprint("vpos.query_status")
+        return self.delegated.query_status(operations)
+
+
+########################################################################################################################
+class VPOSRefundOperation(models.Model):
+    """
+    Entidad que gestiona las devoluciones de pagos realizados.
+    Las devoluciones pueden ser totales o parciales, por tanto un "pago" tiene una relación uno a muchos con "devoluciones".
+    """
+    amount = models.DecimalField(max_digits=12, decimal_places=3, null=False, blank=False,
+                                 verbose_name=u"Cantidad de la devolución")
+    # Importe exacto en unidades mínimas de la moneda del pago, se calcula al guardar
+    amount_minor = models.BigIntegerField(default=0, editable=False,
+                                          verbose_name=u"Cantidad en unidades mínimas de la moneda")
+    description = models.CharField(max_length=512, null=False, blank=False,
+                                   verbose_name=u"Descripción de la devolución")
+
+    operation_number = models.CharField(max_length=255, null=False, blank=False, verbose_name=u"Número de operación")
+    status = models.CharField(max_length=64, choices=VPOS_REFUND_STATUS_CHOICES, null=False, blank=False,
+                              verbose_name=u"Estado de la devolución")
+    creation_datetime = models.DateTimeField(verbose_name="Fecha de creación del objeto")
+    last_update_datetime = models.DateTimeField(verbose_name="Fecha de última actualización del objeto")
+    payment = models.ForeignKey(VPOSPaymentOperation, on_delete=models.PROTECT, related_name="refund_operations")
+
+    class Meta:
+        # Suma de las devoluciones completadas de un pago (ver VPOSPaymentOperation.total_minor_units_refunded)
+        index_together = (
+            ("payment", "status"),
+        )
+
+    # Estado con el que se cargó la devolución de BD, para detectar los cambios de estado al guardar
+    _loaded_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(VPOSRefundOperation, cls).from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    @property
+    def virtual_point_of_sale(self):
+        return self.payment.virtual_point_of_sale
+
+    ## Guarda el objeto en BD, en realidad lo único que hace es actualizar los datetimes
+    def save(self, *args, **kwargs):
+        """
+        Guarda el objeto en BD, en realidad lo único que hace es actualizar los datetimes.
+        El datetime de actualización se actualiza siempre, el de creación sólo al guardar de nuevas.
+        """
+        # Datetime con el momento actual en UTC
+        now_datetime = datetime.datetime.now()
+        # Si no se ha guardado aún, el datetime de creación es la fecha actual
+        if not self.id:
+            self.creation_datetime = localize_datetime(now_datetime)
+        # El datetime de actualización es la fecha actual
+        self.last_update_datetime = localize_datetime(now_datetime)
+        # Importe en unidades mínimas de la moneda del pago, amount queda con los decimales de la moneda
+        money = Money.from_amount(self.amount, self.payment.currency)
+        self.amount_minor = money.minor_units
+        self.amount = money.amount
+        # El cambio de estado se registra en el outbox en la misma transacción
+        with transaction.atomic():
+            # Llamada al constructor del padre
+            super(VPOSRefundOperation, self).save(*args, **kwargs)
+            if self.status != self._loaded_status:
+                VPOSOutboxEvent.record(self, from_status=self._loaded_status, to_status=self.status)
+        self._loaded_status = self.status
+
+
+########################################################################################################################
+class VPOSNotification(models.Model):
+    """
+    Registro de sólo inserción de cada notificación recibida de una pasarela de pago.
+    Cada entrega (incluidos reintentos y duplicados) genera una única fila con un único INSERT, nunca se modifica.
+    El campo "period" (AAAAMM) permite particionar la tabla por meses o archivar/borrar meses completos.
+    """
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+    operation_number = models.CharField(max_length=255, null=True, blank=True, db_index=True,
+                                        verbose_name=u"Número de operación")
+    body_hash = models.CharField(max_length=64, null=False, blank=False, db_index=True,
+                                 verbose_name=u"SHA-256 del cuerpo de la notificación")
+    body_size = models.PositiveIntegerField(default=0, verbose_name=u"Tamaño del cuerpo de la notificación")
+    remote_address = models.GenericIPAddressField(null=True, blank=True, verbose_name=u"Dirección IP de origen")
+    verified = models.NullBooleanField(default=None, verbose_name=u"Resultado de la verificación",
+                                       help_text=u"Vacío si la notificación no se pudo asociar a ninguna operación.")
+    latency = models.PositiveIntegerField(default=0, verbose_name=u"Tiempo de procesamiento (ms)")
+    received_datetime = models.DateTimeField(db_index=True, verbose_name=u"Fecha de recepción")
+    period = models.CharField(max_length=6, db_index=True, verbose_name=u"Periodo (AAAAMM) de recepción")
+
+    class Meta:
+        ordering = ["id"]
+
+    ## Registra una notificación (un único INSERT)
+    @staticmethod
+    def record(vpos_type, body, received_datetime, operation_number=None, verified=None, remote_address=None):
+        latency = timezone.now() - received_datetime
+        # La IP puede venir de la cabecera X-Forwarded-For, que la controla el cliente, o no venir
+        if remote_address is not None:
+            try:
+                validate_ipv46_address(remote_address)
+            except ValidationError:
+                remote_address = None
+        return VPOSNotification.objects.create(
+            type=vpos_type,
+            operation_number=operation_number,
+            body_hash=hashlib.sha256(body).hexdigest(),
+            body_size=len(body),
+            remote_address=remote_address,
+            verified=verified,
+            latency=int(latency.total_seconds() * 1000),
+            received_datetime=received_datetime,
+            period=received_datetime.strftime("%Y%m")
+        )
+
+    ## Borra en bloque los periodos (meses) anteriores al indicado
+    @staticmethod
+    def purge(before_period):
+        """
+        Elimina las notificaciones de los periodos anteriores a before_period (AAAAMM).
+        Se lanza un único DELETE por periodo en vez de borrar fila a fila.
+        :return: dict periodo -> número de notificaciones eliminadas
+        """
+        periods = VPOSNotification.objects.filter(period__lt=before_period).values_list("period", flat=True) \
+            .order_by("period").distinct()
+        deleted = {}
+        for period in list(periods):
+            deleted[period], _rows = VPOSNotification.objects.filter(period=period).delete()
+            dlprint(u"Eliminadas {0} notificaciones del periodo {1}".format(deleted[period], period))
+        return deleted
+
+
+########################################################################################################################
+class VPOSArchivedOperation(models.Model):
+    """
+    Índice de una operación de pago archivada (ver djangovirtualpos.archive).
+    Sólo se mantienen como columnas los campos por los que se busca en una auditoría. La operación completa,
+    con sus devoluciones y mensajes de pasarela, se guarda serializada y comprimida en el campo "data"
+    o, si se archivó en disco, en la línea "file_line" del fichero JSONL comprimido "file_path".
+    """
+    operation_id = models.PositiveIntegerField(unique=True, verbose_name=u"Identificador original de la operación")
+    operation_number = models.CharField(max_length=255, db_index=True, verbose_name=u"Número de operación")
+    sale_code = models.CharField(max_length=512, db_index=True, verbose_name=u"Código de la venta")
+    confirmation_code = models.CharField(max_length=255, null=True, blank=True,
+                                         verbose_name=u"Código de confirmación enviado por el banco.")
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+    status = models.CharField(max_length=64, choices=VPOS_STATUS_CHOICES, verbose_name=u"Estado del pago")
+    amount = models.DecimalField(max_digits=12, decimal_places=3, verbose_name=u"Coste de la operación")
+    creation_datetime = models.DateTimeField(verbose_name="Fecha de creación de la operación")
+    archived_datetime = models.DateTimeField(verbose_name="Fecha de archivado de la operación")
+    data = models.BinaryField(null=True, verbose_name=u"Operación serializada y comprimida (zlib)")
+    file_path = models.CharField(max_length=512, null=True, blank=True,
+                                 verbose_name=u"Fichero JSONL (gzip) en el que se ha archivado la operación")
+    file_line = models.PositiveIntegerField(null=True, blank=True, verbose_name=u"Línea del fichero (empezando en 0)")
+
+    class Meta:
+        ordering = ["id"]
+
+    ## Objetos serializados (operación, devoluciones y mensajes de pasarela) en formato JSON de Django
+    @property
+    def serialized_objects(self):
+        if self.data is not None:
+            return zlib.decompress(bytes(self.data)).decode("utf-8")
+        with gzip.open(self.file_path, "rb") as archive_file:
+            for line_number, line in enumerate(archive_file):
+                if line_number == self.file_line:
+                    return line.decode("utf-8")
+        raise ObjectDoesNotExist(u"La operación {0} no está en el fichero {1}".format(self.operation_id,
+                                                                                      self.file_path))
+
+    ## Reconstruye la operación archivada
+    @property
+    def operation(self):
+        """
+        Operación archivada reconstruida como un VPOSPaymentOperation no guardado en BD.
+        Sus devoluciones y mensajes de pasarela están en los atributos archived_refunds y archived_payloads.
+        """
+        operation = None
+        refunds = []
+        payloads = []
+        for deserialized_object in serializers.deserialize("json", self.serialized_objects):
+            instance = deserialized_object.object
+            if isinstance(instance, VPOSPaymentOperation):
+                operation = instance
+            elif isinstance(instance, VPOSRefundOperation):
+                refunds.append(instance)
+            elif isinstance(instance, VPOSPaymentPayload):
+                payloads.append(instance)
+        operation.archived_refunds = refunds
+        operation.archived_payloads = payloads
+        operation.is_archived = True
+        return operation
+
+
+####################################################################
+## Opciones del campo STATUS de los trabajos de cumplimiento de ventas
+VPOS_FULFILLMENT_JOB_STATUS_CHOICES = (
+    ("pending", _(u"Pending")),
+    ("done", _(u"Done")),
+    ("failed", _(u"Failed")),
+)
+
+
+########################################################################################################################
+class VPOSFulfillmentJob(models.Model):
+    """
+    Trabajo pendiente de confirmación de una venta de la aplicación (llamada a su método online_confirm).
+    Si está activado VPOS_ASYNC_FULFILLMENT, la vista confirm_payment responde al banco en cuanto verifica
+    y cobra la operación y deja aquí, en la misma transacción, la confirmación de la venta.
+    Los trabajos los ejecuta (con reintentos) el comando vpos_run_fulfillment_jobs (ver djangovirtualpos.fulfillment).
+    """
+    sale_model = models.CharField(max_length=255, verbose_name=u"Modelo de la venta (app_label.Model)")
+    operation_number = models.CharField(max_length=255, db_index=True, verbose_name=u"Número de operación")
+    parameters = models.TextField(default="{}", verbose_name=u"Parámetros (JSON) de la llamada a online_confirm")
+    status = models.CharField(max_length=16, choices=VPOS_FULFILLMENT_JOB_STATUS_CHOICES, default="pending",
+                              verbose_name=u"Estado del trabajo")
+    attempts = models.PositiveIntegerField(default=0, verbose_name=u"Número de intentos")
+    last_error = models.TextField(null=True, blank=True, verbose_name=u"Último error")
+    next_attempt_datetime = models.DateTimeField(verbose_name=u"Fecha del siguiente intento")
+    creation_datetime = models.DateTimeField(verbose_name="Fecha de creación del objeto")
+    last_update_datetime = models.DateTimeField(verbose_name="Fecha de última actualización del objeto")
+
+    class Meta:
+        ordering = ["id"]
+        index_together = (
+            ("status", "next_attempt_datetime"),
+        )
+
+    ## Crea el trabajo de confirmación de una venta (un único INSERT)
+    @staticmethod
+    def enqueue(sale_model, operation_number, **parameters):
+        """
+        :param sale_model: modelo de venta de la aplicación (clase).
+        :param operation_number: número de operación de la venta.
+        :param parameters: parámetros de la llamada a online_confirm.
+        """
+        now = timezone.now()
+        return VPOSFulfillmentJob.objects.create(
+            sale_model=sale_model._meta.label,
+            operation_number=operation_number,
+            parameters=json.dumps(parameters, separators=(",", ":")),
+            next_attempt_datetime=now
+        )
+
+    ## Ejecuta la confirmación de la venta
+    def run(self):
+        """
+        Llama a online_confirm de la venta pendiente con el número de operación del trabajo.
+        Si la venta ya no está pendiente (p.ej. por un reintento) no se hace nada.
+        """
+        sale_model = apps.get_model(self.sale_model)
+        try:
+            sale = sale_model.objects.get(operation_number=self.operation_number, status="pending")
+        except sale_model.DoesNotExist:
+            dlprint(u"La venta con operación {0} ya no está pendiente".format(self.operation_number))
+            return
+
+        # Igual que en la vista confirm_payment, la venta tiene acceso al TPV (el padre, con su delegado)
+        # y a la operación que se ha pagado
+        operation = VPOSPaymentOperation.objects.get(operation_number=self.operation_number)
+        vpos = VirtualPointOfSale.get(id=operation.virtual_point_of_sale_id)
+        vpos.operation = operation
+        sale.virtual_pos = vpos
+        sale.online_confirm(**json.loads(self.parameters))
+
+    ## Guarda el objeto en BD, en realidad lo único que hace es actualizar los datetimes
+    def save(self, *args, **kwargs):
+        """
+        Guarda el objeto en BD, en realidad lo único que hace es actualizar los datetimes.
+        El datetime de actualización se actualiza siempre, el de creación sólo al guardar de nuevas.
+        """
+        # Datetime con el momento actual en UTC
+        now_datetime = datetime.datetime.now()
+        # Si no se ha guardado aún, el datetime de creación es la fecha actual
+        if not self.id:
+            self.creation_datetime = localize_datetime(now_datetime)
+        # El datetime de actualización es la fecha actual
+        self.last_update_datetime = localize_datetime(now_datetime)
+        # Llamada al constructor del padre
+        super(VPOSFulfillmentJob, self).save(*args, **kwargs)
+
+
+########################################################################################################################
+class VPOSSpooledNotification(models.Model):
+    """
+    Notificación de una pasarela guardada tal cual llegó, pendiente de procesar.
+    Con VPOS_SPOOLED_NOTIFICATION_TYPES, la vista confirm_payment sólo inserta aquí la notificación y responde
+    a la pasarela. La verificación, el cobro y la confirmación de la venta los hacen después, en paralelo,
+    los procesos del comando vpos_process_spool (ver djangovirtualpos.spool).
+    """
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+    sale_model = models.CharField(max_length=255, verbose_name=u"Modelo de la venta (app_label.Model)")
+    body = models.BinaryField(verbose_name=u"Cuerpo de la notificación")
+    content_type = models.CharField(max_length=255, blank=True, default="", verbose_name=u"Content-Type")
+    query_string = models.TextField(blank=True, default="", verbose_name=u"Parámetros GET")
+    remote_address = models.GenericIPAddressField(null=True, blank=True, verbose_name=u"Dirección IP de origen")
+    # Host (cabecera Host) y esquema de la petición, para reconstruirla con la misma URL
+    host = models.CharField(max_length=255, blank=True, default="", verbose_name=u"Host")
+    scheme = models.CharField(max_length=5, default="http", verbose_name=u"Esquema (http o https)")
+    received_datetime = models.DateTimeField(verbose_name=u"Fecha de recepción")
+    status = models.CharField(max_length=16, choices=VPOS_FULFILLMENT_JOB_STATUS_CHOICES, default="pending",
+                              verbose_name=u"Estado de la notificación")
+    attempts = models.PositiveIntegerField(default=0, verbose_name=u"Número de intentos")
+    last_error = models.TextField(null=True, blank=True, verbose_name=u"Último error")
+    next_attempt_datetime = models.DateTimeField(verbose_name=u"Fecha del siguiente intento")
+    processed_datetime = models.DateTimeField(null=True, blank=True, verbose_name=u"Fecha de procesamiento")
+
+    class Meta:
+        ordering = ["id"]
+        index_together = (
+            ("status", "next_attempt_datetime"),
+        )
+
+    ## Guarda la notificación recibida (un único INSERT)
+    @staticmethod
+    def spool(vpos_type, sale_model, request, received_datetime, remote_address=None):
+        """
+        :param vpos_type: tipo de TPV de la notificación.
+        :param sale_model: modelo de venta de la aplicación (clase).
+        :param request: petición de la pasarela.
+        :param received_datetime: fecha de recepción.
+        :param remote_address: dirección IP de origen de la notificación.
+        """
+        if remote_address is not None:
+            try:
+                validate_ipv46_address(remote_address)
+            except ValidationError:
+                remote_address = None
+        # Host validado contra ALLOWED_HOSTS. Si no es válido se usará el del setting DOMAIN
+        try:
+            host = request.get_host()
+        except DisallowedHost:
+            host = ""
+        return VPOSSpooledNotification.objects.create(
+            type=vpos_type,
+            sale_model=sale_model._meta.label,
+            body=request.body,
+            content_type=request.META.get("CONTENT_TYPE", ""),
+            query_string=request.META.get("QUERY_STRING", ""),
+            remote_address=remote_address,
+            host=host,
+            scheme=request.scheme,
+            received_datetime=received_datetime,
+            next_attempt_datetime=received_datetime
+        )
+
+    ## Reconstruye la petición de la pasarela
+    def build_request(self):
+        """
+        Petición equivalente a la recibida, para procesarla con la misma lógica que la vista confirm_payment.
+        Las notificaciones guardadas sin host toman el del setting DOMAIN.
+        """
+        body = bytes(self.body)
+        host = self.host or settings.DOMAIN
+        server_name, server_port = split_domain_port(host)
+        if not server_port:
+            server_port = "443" if self.scheme == "https" else "80"
+        return WSGIRequest({
+            "REQUEST_METHOD": "POST",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": "/",
+            "REMOTE_ADDR": self.remote_address or "",
+            "HTTP_HOST": host,
+            "SERVER_NAME": server_name,
+            "SERVER_PORT": server_port,
+            "CONTENT_TYPE": self.content_type,
+            "CONTENT_LENGTH": str(len(body)),
+            "QUERY_STRING": self.query_string,
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.url_scheme": self.scheme,
+        })
+
+
+########################################################################################################################
+class VPOSCardToken(models.Model):
+    """
+    Referencia de una tarjeta guardada en la pasarela (Ds_Merchant_Identifier de Redsys) para cobrar
+    más adelante sin el titular presente. La vista confirm_payment la guarda al confirmar un pago que la ha pedido.
+    La fecha de caducidad es el último día del mes de caducidad de la tarjeta, así las consultas por caducidad
+    ("caducan el mes que viene", "válidas para cobrar hoy") son un rango sobre un índice.
+    """
+    virtual_point_of_sale = models.ForeignKey("VirtualPointOfSale", on_delete=models.CASCADE,
+                                              related_name="card_tokens", verbose_name=u"TPV")
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+    customer_code = models.CharField(max_length=255, null=True, blank=True, verbose_name=u"Código del cliente")
+    reference = models.CharField(max_length=255, verbose_name=u"Referencia de la tarjeta")
+    expiration_date = models.DateField(db_index=True, verbose_name=u"Fecha de caducidad de la tarjeta")
+    sale_code = models.CharField(max_length=512, null=True, blank=True,
+                                 verbose_name=u"Código de la venta en la que se obtuvo")
+    operation_number = models.CharField(max_length=255, null=True, blank=True,
+                                        verbose_name=u"Número de operación en la que se obtuvo")
+    is_revoked = models.BooleanField(default=False, verbose_name=u"Anulada")
+    creation_datetime = models.DateTimeField(verbose_name=u"Fecha de creación")
+    last_update_datetime = models.DateTimeField(verbose_name=u"Fecha de última actualización")
+
+    class Meta:
+        ordering = ["id"]
+        unique_together = (
+            ("virtual_point_of_sale", "reference"),
+        )
+        index_together = (
+            ("virtual_point_of_sale", "is_revoked", "expiration_date"),
+            ("customer_code", "is_revoked", "expiration_date"),
+        )
+
+    ## Convierte la fecha de caducidad de la pasarela (AAMM) en el último día de ese mes
+    @staticmethod
+    def parse_expiration_date(expiration_date):
+        """
+        :param expiration_date: caducidad con el formato AAMM de Ds_ExpiryDate (p.ej. "2812" para diciembre de 2028).
+        :return: date | None si no es válida
+        """
+        if not expiration_date or len(expiration_date) != 4 or not expiration_date.isdigit():
+            return None
+        year = 2000 + int(expiration_date[:2])
+        month = int(expiration_date[2:])
+        if not 1 <= month <= 12:
+            return None
+        return datetime.date(year, month, calendar.monthrange(year, month)[1])
+
+    ## Guarda (o actualiza) la referencia de una tarjeta
+    @staticmethod
+    def store(virtual_pos, reference, expiration_date, customer_code=None, sale_code=None, operation_number=None):
+        """
+        :param virtual_pos: VirtualPointOfSale en el que se ha obtenido la referencia.
+        :param reference: referencia de la tarjeta.
+        :param expiration_date: caducidad con el formato AAMM de la pasarela o date.
+        :return: VPOSCardToken | None si la caducidad no es válida
+        """
+        if not isinstance(expiration_date, datetime.date):
+            expiration_date = VPOSCardToken.parse_expiration_date(expiration_date)
+        if not reference or expiration_date is None:
+            dlprint(u"No se guarda la referencia {0}: caducidad no válida".format(reference))
+            return None
+        now = timezone.now()
+        fields = {"type": virtual_pos.type, "customer_code": customer_code, "expiration_date": expiration_date,
+                  "sale_code": sale_code, "operation_number": operation_number, "is_revoked": False,
+                  "last_update_datetime": now}
+        tokens = VPOSCardToken.objects.filter(virtual_point_of_sale_id=virtual_pos.id, reference=reference)
+        with transaction.atomic():
+            # Si la referencia ya estaba guardada para otro cliente, también se invalida la caché de ése
+            previous_customer_code = tokens.select_for_update().values_list("customer_code", flat=True).first()
+            if not tokens.update(**fields):
+                try:
+                    with transaction.atomic():
+                        VPOSCardToken.objects.create(virtual_point_of_sale_id=virtual_pos.id, reference=reference,
+                                                     creation_datetime=now, **fields)
+                except IntegrityError:
+                    # La ha guardado a la vez otra notificación
+                    previous_customer_code = tokens.select_for_update().values_list("customer_code",
+                                                                                    flat=True).first()
+                    tokens.update(**fields)
+            token = tokens.get()
+            token._invalidate_cache(previous_customer_code)
+        return token
+
+    ## Anula la referencia (p.ej. porque la pasarela la ha rechazado)
+    def revoke(self):
+        self.is_revoked = True
+        self.last_update_datetime = timezone.now()
+        self.save(update_fields=("is_revoked", "last_update_datetime"))
+        self._invalidate_cache()
+
+    def _invalidate_cache(self, previous_customer_code=None):
+        """
+        Invalida las referencias cacheadas del cliente y, si la referencia ha cambiado de cliente, las del anterior.
+        """
+        cache = get_card_token_cache()
+        if cache is None:
+            return
+        cache_keys = []
+        for customer_code in set((self.customer_code, previous_customer_code)):
+            if customer_code:
+                cache_keys += [card_token_cache_key(customer_code),
+                               card_token_cache_key(customer_code, self.virtual_point_of_sale_id)]
+        if cache_keys:
+            transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+    ## Referencias que se pueden usar en una fecha
+    @staticmethod
+    def valid_tokens(on_date=None):
+        """
+        Referencias no anuladas que no han caducado en on_date (hoy por defecto).
+        Filtrando además por TPV o por cliente se resuelve con un único rango sobre un índice.
+        :return: QuerySet
+        """
+        if on_date is None:
+            on_date = timezone.localdate()
+        return VPOSCardToken.objects.filter(is_revoked=False, expiration_date__gte=on_date)
+
+    ## Referencias que caducan en un intervalo
+    @staticmethod
+    def expiring_between(start_date, end_date):
+        """
+        Referencias no anuladas que caducan entre start_date y end_date (ambas incluidas).
+        :return: QuerySet
+        """
+        return VPOSCardToken.objects.filter(is_revoked=False, expiration_date__range=(start_date, end_date))
+
+    ## Referencias que caducan en un mes
+    @staticmethod
+    def expiring_in_month(year, month):
+        """
+        Referencias no anuladas que caducan en el mes indicado. Como la fecha de caducidad es siempre el último día
+        del mes, es una comparación de igualdad sobre el índice.
+        :return: QuerySet
+        """
+        return VPOSCardToken.objects.filter(
+            is_revoked=False, expiration_date=datetime.date(year, month, calendar.monthrange(year, month)[1]))
+
+    ## Última referencia válida de un cliente (cacheada)
+    @staticmethod
+    def get_latest_valid(customer_code, virtual_pos=None):
+        """
+        Referencia válida más reciente de un cliente, en un TPV concreto o en cualquiera.
+        El resultado (también su ausencia) se cachea VPOS_CARD_TOKEN_CACHE_TTL segundos
+        y se invalida al guardar o anular sus referencias.
+        :return: VPOSCardToken | None
+        """
+        vpos_id = virtual_pos.id if virtual_pos is not None else None
+        cache = get_card_token_cache()
+        if cache is not None:
+            cache_key = card_token_cache_key(customer_code, vpos_id)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached or None
+
+        tokens = VPOSCardToken.valid_tokens().filter(customer_code=customer_code)
+        if vpos_id is not None:
+            tokens = tokens.filter(virtual_point_of_sale_id=vpos_id)
+        token = tokens.order_by("-expiration_date", "-id").first()
+
+        if cache is not None:
+            # La ausencia de referencia se cachea como False
+            cache.set(cache_key, token or False, CARD_TOKEN_CACHE_TTL)
+        return token
+
+
+########################################################################################################################
+class VPOSOutboxEvent(models.Model):
+    """
+    Outbox transaccional: cada cambio de estado de una operación de pago o de una devolución
+    genera un evento en la misma transacción que el cambio.
+    El comando vpos_relay_outbox los envía por lotes a un destino (fichero, webhook, cola...),
+    así los sistemas externos no tienen que consultar la tabla de operaciones (ver djangovirtualpos.outbox).
+    """
+    OPERATION_TYPES = (
+        ("payment", _(u"Payment")),
+        ("refund", _(u"Refund")),
+    )
+
+    # No se usa una clave ajena para que los eventos se mantengan aunque se archive la operación
+    operation_type = models.CharField(max_length=16, choices=OPERATION_TYPES, verbose_name=u"Tipo de operación")
+    operation_id = models.PositiveIntegerField(verbose_name=u"Identificador de la operación")
+    operation_number = models.CharField(max_length=255, verbose_name=u"Número de operación")
+    sale_code = models.CharField(max_length=512, null=True, blank=True, verbose_name=u"Código de la venta")
+    type = models.CharField(max_length=16, choices=VPOS_TYPES, default="", verbose_name="Tipo de TPV")
+    amount = models.DecimalField(max_digits=12, decimal_places=3, verbose_name=u"Importe de la operación")
+    # Importe exacto en unidades mínimas de la moneda y moneda de la operación (las devoluciones, la de su pago)
+    amount_minor = models.BigIntegerField(default=0, verbose_name=u"Importe en unidades mínimas de la moneda")
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="EUR",
+                                verbose_name=u"Moneda (código ISO 4217)")
+    from_status = models.CharField(max_length=64, null=True, blank=True, verbose_name=u"Estado anterior")
+    to_status = models.CharField(max_length=64, verbose_name=u"Estado nuevo")
+    creation_datetime = models.DateTimeField(verbose_name="Fecha del cambio de estado")
+    relayed = models.BooleanField(default=False, db_index=True, verbose_name=u"Indica si ya se ha enviado")
+    relayed_datetime = models.DateTimeField(null=True, blank=True, verbose_name=u"Fecha de envío")
+
+    class Meta:
+        ordering = ["id"]
+
+    ## Construye (sin guardar) el evento de cambio de estado de una operación o una devolución
+    @staticmethod
+    def build(operation, from_status, to_status):
+        if isinstance(operation, VPOSRefundOperation):
+            operation_type = "refund"
+            sale_code = None
+            vpos_type = operation.payment.type
+            currency = operation.payment.currency
+        else:
+            operation_type = "payment"
+            sale_code = operation.sale_code
+            vpos_type = operation.type
+            currency = operation.currency
+        return VPOSOutboxEvent(
+            operation_type=operation_type,
+            operation_id=operation.id,
+            operation_number=operation.operation_number,
+            sale_code=sale_code,
+            type=vpos_type,
+            amount=operation.amount,
+            amount_minor=operation.amount_minor,
+            currency=currency,
+            from_status=from_status,
+            to_status=to_status,
+            creation_datetime=timezone.now()
+        )
+
+    ## Registra el evento de cambio de estado (un único INSERT)
+    @staticmethod
+    def record(operation, from_status, to_status):
+        event = VPOSOutboxEvent.build(operation, from_status=from_status, to_status=to_status)
+        event.save()
+        return event
+
+    ## Borra en bloque los eventos ya enviados
+    @staticmethod
+    def purge_relayed(before, batch_size=1000):
+        """
+        Elimina los eventos enviados antes de la fecha indicada, con un DELETE por lote de batch_size eventos.
+        Los eventos pendientes de enviar nunca se eliminan.
+        :return: número de eventos eliminados
+        """
+        deleted = 0
+        while True:
+            event_ids = list(VPOSOutboxEvent.objects.filter(relayed=True, relayed_datetime__lt=before)
+                             .order_by("id").values_list("id", flat=True)[:batch_size])
+            if not event_ids:
+                break
+            batch_deleted, _rows = VPOSOutboxEvent.objects.filter(id__in=event_ids).delete()
+            deleted += batch_deleted
+        if deleted:
+            dlprint(u"Eliminados {0} eventos del outbox enviados antes de {1}".format(deleted, before))
+        return deleted
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "operation_type": self.operation_type,
+            "operation_id": self.operation_id,
+            "operation_number": self.operation_number,
+            "sale_code": self.sale_code,
+            "type": self.type,
+            # Importe con los decimales de la moneda (p.ej. "12.50" EUR, "1200" JPY, "1.250" KWD)
+            "amount": Money(self.amount_minor, self.currency).format_amount(),
+            "amount_minor": self.amount_minor,
+            "currency": self.currency,
+            "from_status": self.from_status,
+            "to_status": self.to_status,
+            "datetime": self.creation_datetime.isoformat(),
+        }
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals, print_function
+
+import base64
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import models, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.util import get_http_session, thread_map, sniff_body_format, HTTP_TIMEOUT
+from djangovirtualpos.models.base import VPOSPaymentOperation, VPOSOperationNotImplemented, \
+    VPOSOperationAlreadyConfirmed, VPOSNotificationIgnored, VirtualPointOfSale
+
+
+########################################################################################################################
+########################################################################################################################
+###################################################### TPV Bitpay ######################################################
+########################################################################################################################
+########################################################################################################################
+
+# Alias (de settings.CACHES) de la caché del estado de los invoices, con la que se descartan las IPN repetidas
+# sin tocar la BD. None para no usarla.
+BITPAY_INVOICE_STATE_CACHE = getattr(settings, "VPOS_BITPAY_INVOICE_STATE_CACHE", "default")
+
+# Segundos durante los que se recuerda que la IPN de un invoice ya se ha tratado
+BITPAY_INVOICE_STATE_TTL = getattr(settings, "VPOS_BITPAY_INVOICE_STATE_TTL", 7 * 24 * 3600)
+
+# Segundos durante los que se descartan las IPN de un invoice mientras se trata la primera.
+# Si su tratamiento falla, pasado este tiempo se vuelve a tratar la siguiente IPN que llegue.
+BITPAY_INVOICE_PROCESSING_TTL = getattr(settings, "VPOS_BITPAY_INVOICE_PROCESSING_TTL", 60)
+
+# Estado de un invoice en la caché (un entero)
+INVOICE_STATE_PROCESSING = 0
+INVOICE_STATE_DONE = 1
+
+
+def _get_invoice_state_cache():
+    if BITPAY_INVOICE_STATE_CACHE is None:
+        return None
+    return caches[BITPAY_INVOICE_STATE_CACHE]
+
+
+def _invoice_state_cache_key(invoice_id):
+    # El id viene en el cuerpo de la IPN: se resume para que la clave sea válida en cualquier backend
+    invoice_id_hash = hashlib.sha1(u"{0}".format(invoice_id).encode("utf-8")).hexdigest()
+    return "djangovirtualpos:bitpay_invoice:{0}".format(invoice_id_hash)
+
+
+class VPOSBitpay(VirtualPointOfSale):
+    """
+    Pago con criptomoneda usando la plataforma bitpay.com
+    Siguiendo la documentación: https://bitpay.com/api
+    """
+
+    CURRENCIES = (
+        ('EUR', 'Euro'),
+        ('USD', 'Dolares'),
+        ('BTC', 'Bitcoin'),
+    )
+
+    # Velocidad de la operación en función de la fortaleza de la confirmación en blockchain.
+    TRANSACTION_SPEED = (
+        ('high', 'Alta'),  # Se supone confirma en el momento que se ejecuta.
+        ('medium', 'Media'),  # Se supone confirmada una vez se verifica 1 bloque. (~10 min)
+        ('low', 'Baja'),  # Se supone confirmada una vez se verifican 6 bloques (~1 hora)
+    )
+
+    # Relación con el padre (TPV).
+    # Al poner el signo "+" como "related_name" evitamos que desde el padre
+    # se pueda seguir la relación hasta aquí (ya que cada uno de las clases
+    # que heredan de ella estará en una tabla y sería un lío).
+    parent = models.OneToOneField(VirtualPointOfSale, parent_link=True, related_name="+", null=False,
+                                  db_column="vpos_id")
+    testing_api_key = models.CharField(max_length=512, null=True, blank=True,
+                                       verbose_name="API Key de Bitpay para entorno de test")
+    production_api_key = models.CharField(max_length=512, null=False, blank=False,
+                                          verbose_name="API Key de Bitpay para entorno de producción")
+    currency = models.CharField(max_length=3, choices=CURRENCIES, default='EUR', null=False, blank=False,
+                                verbose_name="Moneda (EUR, USD, BTC)")
+    transaction_speed = models.CharField(max_length=10, choices=TRANSACTION_SPEED, default='medium', null=False,
+                                         blank=False, verbose_name="Velocidad de la operación")
+    notification_url = models.URLField(verbose_name="Url notificaciones actualización estados (https)", null=False,
+                                       blank=False)
+
+    # Prefijo usado para identicar al servidor desde el que se realiza la petición, en caso de usar TPV-Proxy.
+    operation_number_prefix = models.CharField(max_length=20, null=True, blank=True,
+                                               verbose_name="Prefijo del número de operación")
+
+    # El invoice se puede crear de antemano (ver djangovirtualpos.prefetch)
+    prefetch_operation_number = True
+
+    # Estados del invoice cuyas IPN se tratan: "paid" completa la operación, "expired" e "invalid" la marcan
+    # como fallida. Las IPN "new", "confirmed" y "complete" no cambian nada y se descartan.
+    RELEVANT_IPN_STATUSES = ("paid", "expired", "invalid")
+
+    # Estados de la operación según el estado del invoice (el estado "new" sigue pendiente)
+    INVOICE_STATUSES = {
+        "paid": "completed",
+        "confirmed": "completed",
+        "complete": "completed",
+        "expired": "expired",
+        "invalid": "failed",
+    }
+
+    bitpay_url = {
+        "production": {
+            "api": "https://bitpay.com/api/",
+            "create_invoice": "https://bitpay.com/api/invoice",
+            "payment": "https://bitpay.com/invoice/"
+        },
+        "testing": {
+            "api": "https://test.bitpay.com/api/",
+            "create_invoice": "https://test.bitpay.com/api/invoice",
+            "payment": "https://test.bitpay.com/invoice/"
+        }
+    }
+
+    def configurePayment(self, **kwargs):
+
+        self.api_key = self.testing_api_key
+
+        if self.parent.environment == "production":
+            self.api_key = self.production_api_key
+
+        # Bitpay recibe el precio como número JSON
+        self.importe = float(self.parent.operation.amount)
+
+    def setupPayment(self, operation_number=None, code_len=40):
+        """
+        Inicializa el pago
+        Obtiene el número de operación, que para el caso de BitPay será el id dado
+        :param operation_number:
+        :param code_len:
+        :return:
+        """
+        import urllib2
+
+        dlprint("BitPay.setupPayment")
+        if operation_number:
+            self.bitpay_id = operation_number
+            dlprint("Rescato el operation number para esta venta {0}".format(self.bitpay_id))
+            return self.bitpay_id
+
+        params = {
+            'price': self.importe,
+            'currency': self.currency,
+            'redirectURL': self.parent.operation.url_ok,
+            'itemDesc': self.parent.operation.description,
+            'notificationURL': self.notification_url,
+            # Campos libres para el programador, puedes introducir cualquier información útil.
+            # En nuestro caso el prefijo de la operación, que ayuda a TPV proxy a identificar el servidor
+            # desde donde se ha ejecutado la operación.
+            'posData': '{"operation_number_prefix": "' + str(self.operation_number_prefix) + '"}',
+            'fullNotifications': True
+        }
+
+        # URL de pago según el entorno
+        url = self.bitpay_url[self.parent.environment]["create_invoice"]
+
+        post = json.dumps(params)
+        req = urllib2.Request(url)
+        base64string = base64.encodestring(self.api_key).replace('\n', '')
+        req.add_header("Authorization", "Basic %s" % base64string)
+        req.add_header("Content-Type", "application/json")
+        req.add_header("Content-Length", len(post))
+
+        json_response = urllib2.urlopen(req, post)
+        response = json.load(json_response)
+
+        dlprint(u"Parametros que enviamos a Bitpay para crear la operación")
+        dlprint(params)
+
+        dlprint(u"Respuesta de Bitpay")
+        dlprint(response)
+
+        if response.get("error"):
+            error = response.get("error")
+            message = error.get("message")
+            error_type = error.get("type")
+            raise ValueError(u"ERROR. {0} - {1}".format(message, error_type))
+
+        if not response.get("id"):
+            raise ValueError(u"ERROR. La respuesta no contiene id de invoice.")
+
+        self.bitpay_id = response.get("id")
+
+        # La operación caduca a la vez que el invoice (expirationTime en milisegundos desde epoch)
+        if response.get("expirationTime"):
+            self.parent.operation.expiration_datetime = datetime.datetime.fromtimestamp(
+                int(response.get("expirationTime")) / 1000.0, tz=timezone.utc)
+
+        return self.bitpay_id
+
+    def getPaymentFormData(self):
+        """
+        Generar formulario (en este caso prepara un submit a la página de bitpay).
+        """
+
+        url = self.bitpay_url[self.parent.environment]["payment"]
+        data = {"id": self.bitpay_id}
+
+        form_data = {
+            "data": data,
+            "action": url,
+            "method": "get"
+        }
+        return form_data
+
+    @staticmethod
+    def receiveConfirmation(request, **kwargs):
+
+        # Los cuerpos que no empiezan como JSON se descartan sin analizarlos
+        if sniff_body_format(request.body) != "json":
+            dlprint(u"Notificación de BitPay no válida")
+            return False
+        try:
+            confirmation_body_param = json.loads(request.body)
+        except ValueError:
+            dlprint(u"Notificación de BitPay no válida")
+            return False
+        if not isinstance(confirmation_body_param, dict):
+            dlprint(u"Notificación de BitPay no válida")
+            return False
+
+        invoice_id = confirmation_body_param.get("id")
+        status = confirmation_body_param.get("status")
+        if status not in VPOSBitpay.RELEVANT_IPN_STATUSES:
+            raise VPOSNotificationIgnored(u"IPN {0} del invoice {1} descartada".format(status, invoice_id),
+                                          HttpResponse("OK"))
+        # Todos los estados que se tratan son finales para la operación: las IPN que llegan después de la que
+        # la ha resuelto (repetidas o reintentos) se descartan con una única consulta a la caché
+        if VPOSBitpay._is_invoice_done(invoice_id):
+            raise VPOSNotificationIgnored(u"IPN {0} del invoice {1} ya tratada".format(status, invoice_id),
+                                          HttpResponse("OK"))
+
+        # Almacén de operaciones
+        try:
+            operation = VPOSPaymentOperation.objects.defer("confirmation_data").get(operation_number=invoice_id)
+
+            if operation.status != "pending":
+                VPOSBitpay._mark_invoice_done(invoice_id)
+                raise VPOSOperationAlreadyConfirmed(u"Operación ya confirmada")
+
+            operation.set_confirmation_data({"GET": request.GET.dict(), "POST": request.POST.dict(),
+                                             "BODY": confirmation_body_param})
+            # Los datos se guardan una vez verificada la operación (ver VirtualPointOfSale.verifyConfirmation)
+            vpos = operation.virtual_point_of_sale
+        except VPOSPaymentOperation.DoesNotExist:
+            # Si no existe la operación, están intentando
+            # cargar una operación inexistente
+            return False
+
+        # Iniciamos el delegado y la operación
+        vpos._init_delegated()
+        vpos.operation = operation
+
+        # Las IPN no van firmadas: el estado del invoice se comprueba en el API de Bitpay
+        invoice_status = vpos.delegated._invoice_status(invoice_id)
+        if invoice_status is None:
+            dlprint(u"No se ha podido comprobar el estado del invoice {0} en BitPay".format(invoice_id))
+            return False
+        if invoice_status not in VPOSBitpay.INVOICE_STATUSES:
+            raise VPOSNotificationIgnored(u"IPN {0} del invoice {1} en estado {2}".format(
+                status, invoice_id, invoice_status), HttpResponse("OK"))
+
+        # Sólo con el estado confirmado se reserva el invoice: las IPN que llegan mientras se trata
+        # (ráfagas simultáneas) se descartan
+        if not VPOSBitpay._claim_invoice(invoice_id):
+            raise VPOSNotificationIgnored(u"IPN {0} del invoice {1} ya tratada".format(status, invoice_id),
+                                          HttpResponse("OK"))
+
+        vpos.delegated.bitpay_id = invoice_id
+        vpos.delegated.status = invoice_status
+
+        dlprint(u"Lo que recibimos de BitPay: ")
+        dlprint(confirmation_body_param)
+        return vpos.delegated
+
+    ####################################################################
+    ## Estado de los invoices en la caché
+    @staticmethod
+    def _is_invoice_done(invoice_id):
+        """Indica si la IPN del invoice ya se ha tratado (una única consulta a la caché)."""
+        cache = _get_invoice_state_cache()
+        if cache is None:
+            return False
+        return cache.get(_invoice_state_cache_key(invoice_id)) == INVOICE_STATE_DONE
+
+    @staticmethod
+    def _claim_invoice(invoice_id):
+        """
+        Reserva el tratamiento de la IPN de un invoice (un único add en la caché).
+        :return: False si ya se ha tratado o se está tratando otra IPN del mismo invoice
+        """
+        cache = _get_invoice_state_cache()
+        if cache is None:
+            return True
+        return cache.add(_invoice_state_cache_key(invoice_id), INVOICE_STATE_PROCESSING, BITPAY_INVOICE_PROCESSING_TTL)
+
+    @staticmethod
+    def _mark_invoice_done(invoice_id):
+        """Recuerda que la IPN del invoice ya se ha tratado, cuando se confirme la transacción en curso."""
+        cache = _get_invoice_state_cache()
+        if cache is None:
+            return
+        key = _invoice_state_cache_key(invoice_id)
+        transaction.on_commit(lambda: cache.set(key, INVOICE_STATE_DONE, BITPAY_INVOICE_STATE_TTL))
+
+    def verifyConfirmation(self):
+        # receiveConfirmation ya ha comprobado que la operación existe y está pendiente, y ha tomado
+        # el estado del invoice del API de Bitpay.
+        # NOTA: Bitpay tiene los siguientes posibles estados:
+        # new, paid, confirmed, complete, expired, invalid.
+        self.notification_authenticated = self.status in self.INVOICE_STATUSES
+        if self.INVOICE_STATUSES.get(self.status) == "completed":
+            dlprint(u"La operación es confirmada")
+            return True
+
+        return False
+
+    def charge(self):
+        dlprint(u"Marca la operacion como pagada")
+        VPOSBitpay._mark_invoice_done(self.bitpay_id)
+        return HttpResponse("OK")
+
+    def responseNok(self, extended_status=""):
+        dlprint("responseNok")
+        # Sin invoice (p.ej. desde staticResponseNok) no hay nada que recordar
+        if getattr(self, "bitpay_id", None):
+            VPOSBitpay._mark_invoice_done(self.bitpay_id)
+        return HttpResponse("NOK")
+
+    ####################################################################
+    ## Paso R1 (Refund) Configura el TPV en modo devolución y ejecuta la operación
+    def refund(self, operation_sale_code, refund_amount, description):
+        raise VPOSOperationNotImplemented(u"No se ha implementado la operación de devolución particular para Bitpay.")
+
+    ####################################################################
+    ## Paso R2.a. Respuesta positiva a confirmación asíncrona de refund
+    def refund_response_ok(self, extended_status=""):
+        raise VPOSOperationNotImplemented(u"No se ha implementado la operación de devolución particular para Bitpay.")
+
+    ####################################################################
+    ## Paso R2.b. Respuesta negativa a confirmación asíncrona de refund
+    def refund_response_nok(self, extended_status=""):
+        raise VPOSOperationNotImplemented(u"No se ha implementado la operación de devolución particular para Bitpay.")
+
+    ####################################################################
+    ## Paso Q1 (Query) Consulta el estado de operaciones en la pasarela
+    def query_status(self, operations):
+        """
+        Consulta el estado de las operaciones obteniendo su invoice.
+        """
+        def query_operation_status(operation):
+            return self.INVOICE_STATUSES.get(self._invoice_status(operation.operation_number))
+
+        statuses = thread_map(query_operation_status, operations)
+        return dict(zip([operation.id for operation in operations], statuses))
+
+    def _invoice_status(self, invoice_id):
+        """
+        Estado del invoice según el API de Bitpay (new, paid, confirmed, complete, expired o invalid).
+        :return: str | None si no se ha podido consultar
+        """
+        import requests
+        api_key = self.production_api_key if self.parent.environment == "production" else self.testing_api_key
+        invoice_url = self.bitpay_url[self.parent.environment]["create_invoice"]
+        try:
+            response = get_http_session().get("{0}/{1}".format(invoice_url, invoice_id),
+                                              auth=(api_key, ""), timeout=HTTP_TIMEOUT)
+            invoice = response.json()
+        except (requests.RequestException, ValueError) as e:
+            dlprint(u"Error consultando el estado de {0} en Bitpay: {1}".format(invoice_id, e))
+            return None
+        if not isinstance(invoice, dict):
+            return None
+        # Según la versión del API, el invoice puede venir dentro de "data"
+        invoice = invoice.get("data", invoice)
+        # El invoice consultado tiene que ser el de la notificación
+        if invoice.get("id", invoice_id) != invoice_id:
+            return None
+        return invoice.get("status")
@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals, print_function
+
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import models
+from django.http import HttpResponse
+from django.shortcuts import redirect
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.money import Money, CURRENCY_CHOICES
+from djangovirtualpos.util import get_http_session, thread_map, HTTP_TIMEOUT
+from djangovirtualpos.models.base import VPOSPaymentOperation, VPOSPaymentPayload, VPOSCantCharge, \
+    VPOSOperationNotImplemented, VPOSOperationException, VirtualPointOfSale
+
+
+########################################################################################################################
+########################################################################################################################
+############################################### TPV PayPal (REST, Orders v2) ###########################################
+########################################################################################################################
+########################################################################################################################
+
+# Alias (de settings.CACHES) de la caché compartida entre procesos de los tokens OAuth de PayPal.
+# None para guardarlos sólo en la memoria de cada proceso.
+PAYPAL_OAUTH_TOKEN_CACHE = getattr(settings, "VPOS_PAYPAL_OAUTH_TOKEN_CACHE", "default")
+
+# Segundos antes de su caducidad en los que el token OAuth se deja de usar y se renueva
+PAYPAL_OAUTH_TOKEN_EXPIRY_MARGIN = getattr(settings, "VPOS_PAYPAL_OAUTH_TOKEN_EXPIRY_MARGIN", 60)
+
+# Segundos que un proceso espera a que otro renueve el token OAuth antes de pedirlo él mismo
+PAYPAL_OAUTH_TOKEN_REFRESH_WAIT = getattr(settings, "VPOS_PAYPAL_OAUTH_TOKEN_REFRESH_WAIT", 10)
+
+# Tokens OAuth de este proceso: clave -> (marca de tiempo de caducidad, token)
+_oauth_tokens = {}
+# Un cerrojo por clave: sólo un hilo de cada proceso renueva cada token
+_oauth_token_locks = {}
+_oauth_token_locks_lock = threading.Lock()
+
+
+def _get_oauth_token_cache():
+    if PAYPAL_OAUTH_TOKEN_CACHE is None:
+        return None
+    return caches[PAYPAL_OAUTH_TOKEN_CACHE]
+
+
+def _get_oauth_token_lock(key):
+    with _oauth_token_locks_lock:
+        if key not in _oauth_token_locks:
+            _oauth_token_locks[key] = threading.Lock()
+        return _oauth_token_locks[key]
+
+
+def _valid_oauth_token(cached_token):
+    """Devuelve el token de una tupla (caducidad, token) si no ha caducado o None."""
+    if cached_token and cached_token[0] > time.time():
+        return cached_token[1]
+    return None
+
+
+class VPOSPaypalRest(VirtualPointOfSale):
+    """
+    Información de configuración del TPV Virtual PayPal con la API REST (Orders v2).
+    Siguiendo la documentación: https://developer.paypal.com/docs/api/orders/v2/
+    """
+
+    # La orden se puede crear de antemano (ver djangovirtualpos.prefetch)
+    prefetch_operation_number = True
+
+    ## Todo TPV tiene una relación con los datos generales del TPV
+    parent = models.OneToOneField(VirtualPointOfSale, parent_link=True, related_name="+", null=False,
+                                  db_column="vpos_id")
+
+    # Credenciales de la aplicación REST de PayPal
+    testing_client_id = models.CharField(max_length=128, null=True, blank=True,
+                                         verbose_name="Client ID de PayPal para entorno de test")
+    testing_client_secret = models.CharField(max_length=128, null=True, blank=True,
+                                             verbose_name="Secret de PayPal para entorno de test")
+    production_client_id = models.CharField(max_length=128, null=False, blank=False,
+                                            verbose_name="Client ID de PayPal para entorno de producción")
+    production_client_secret = models.CharField(max_length=128, null=False, blank=False,
+                                                verbose_name="Secret de PayPal para entorno de producción")
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="EUR", verbose_name="Moneda")
+    # URL a la que PayPal redirige al comprador cuando aprueba el pago (vista confirm_payment)
+    return_url = models.URLField(null=False, blank=False,
+                                 verbose_name="Url de retorno tras aprobar el pago (p.ej. https://.../payment/confirm/paypalrest)")
+
+    paypal_url = {
+        "production": {
+            "api": "https://api-m.paypal.com",
+            "payment": "https://www.paypal.com/checkoutnow",
+        },
+        "testing": {
+            "api": "https://api-m.sandbox.paypal.com",
+            "payment": "https://www.sandbox.paypal.com/checkoutnow",
+        }
+    }
+
+    # Estados de la operación según el estado de la orden (CREATED, SAVED, APPROVED
+    # y PAYER_ACTION_REQUIRED siguen pendientes)
+    ORDER_STATUSES = {
+        "COMPLETED": "completed",
+        "VOIDED": "failed",
+    }
+
+    # Identificador de la orden de PayPal (número de operación)
+    order_id = None
+    # ID del comprador devuelto por PayPal
+    payer_id = None
+
+    def __unicode__(self):
+        return u"Client ID: {0}".format(self.production_client_id)
+
+    @classmethod
+    def form(cls):
+        from djangovirtualpos.forms import VPOSPaypalRestForm
+        return VPOSPaypalRestForm
+
+    ####################################################################
+    ## Token OAuth
+    def _credentials(self):
+        if self.parent.environment == "production":
+            return self.production_client_id, self.production_client_secret
+        return self.testing_client_id, self.testing_client_secret
+
+    def _oauth_token_cache_key(self):
+        """
+        Clave del token OAuth de las credenciales del TPV en su entorno.
+        Se resumen las credenciales completas: si cambia el secret no se usa el token anterior.
+        """
+        client_id, client_secret = self._credentials()
+        credentials_hash = hashlib.sha1(u"{0}|{1}|{2}".format(self.parent.environment, client_id, client_secret)
+                                        .encode("utf-8")).hexdigest()
+        return "djangovirtualpos:paypal_oauth_token:{0}".format(credentials_hash)
+
+    def _request_oauth_token(self):
+        """
+        Pide un nuevo token OAuth a PayPal.
+        :return: tupla (token, segundos de validez)
+        """
+        client_id, client_secret = self._credentials()
+        response = get_http_session().post(
+            self.paypal_url[self.parent.environment]["api"] + "/v1/oauth2/token",
+            data={"grant_type": "client_credentials"}, auth=(client_id, client_secret),
+            headers={"Accept": "application/json"}, timeout=HTTP_TIMEOUT)
+        response.raise_for_status()
+        response_data = response.json()
+        dlprint(u"Nuevo token OAuth de PayPal válido durante {0} segundos".format(response_data.get("expires_in")))
+        return response_data["access_token"], int(response_data.get("expires_in", 0))
+
+    def _store_oauth_token(self, key, token, expires_in, cache):
+        ttl = max(expires_in - PAYPAL_OAUTH_TOKEN_EXPIRY_MARGIN, 0)
+        cached_token = (time.time() + ttl, token)
+        _oauth_tokens[key] = cached_token
+        if cache is not None and ttl > 0:
+            cache.set(key, cached_token, ttl)
+        return token
+
+    def get_oauth_token(self):
+        """
+        Token OAuth de las credenciales del TPV.
+        Se pide una sola vez y se reutiliza hasta poco antes de que caduque: primero desde la memoria del proceso
+        y después desde la caché compartida (VPOS_PAYPAL_OAUTH_TOKEN_CACHE). La renovación es única: en cada proceso
+        sólo la hace un hilo y, entre procesos, el que consigue el cerrojo en la caché; el resto espera
+        a que el nuevo token aparezca en la caché.
+        """
+        key = self._oauth_token_cache_key()
+        token = _valid_oauth_token(_oauth_tokens.get(key))
+        if token:
+            return token
+
+        with _get_oauth_token_lock(key):
+            # Otro hilo puede haberlo renovado mientras esperábamos el cerrojo
+            token = _valid_oauth_token(_oauth_tokens.get(key))
+            if token:
+                return token
+
+            cache = _get_oauth_token_cache()
+            if cache is None:
+                return self._store_oauth_token(key, *self._request_oauth_token(), cache=None)
+
+            cached_token = cache.get(key)
+            if _valid_oauth_token(cached_token):
+                _oauth_tokens[key] = cached_token
+                return cached_token[1]
+
+            lock_key = key + ":lock"
+            if not cache.add(lock_key, 1, PAYPAL_OAUTH_TOKEN_REFRESH_WAIT):
+                # Otro proceso lo está renovando
+                deadline = time.time() + PAYPAL_OAUTH_TOKEN_REFRESH_WAIT
+                while time.time() < deadline:
+                    time.sleep(0.1)
+                    cached_token = cache.get(key)
+                    if _valid_oauth_token(cached_token):
+                        _oauth_tokens[key] = cached_token
+                        return cached_token[1]
+                dlprint(u"El token OAuth de PayPal no se ha renovado a tiempo en otro proceso, se pide de nuevo")
+
+            try:
+                return self._store_oauth_token(key, *self._request_oauth_token(), cache=cache)
+            finally:
+                cache.delete(lock_key)
+
+    def invalidate_oauth_token(self):
+        """Descarta el token OAuth (p.ej. si PayPal lo rechaza antes de su caducidad)."""
+        key = self._oauth_token_cache_key()
+        _oauth_tokens.pop(key, None)
+        cache = _get_oauth_token_cache()
+        if cache is not None:
+            cache.delete(key)
+
+    def _api_request(self, method, path, json_data=None, headers=None):
+        """
+        Petición a la API REST de PayPal por la sesión HTTP compartida (ver djangovirtualpos.util.get_http_session)
+        con el token OAuth. Si PayPal rechaza el token (401) se renueva y se repite la petición una vez.
+        :return: requests.Response
+        """
+        url = self.paypal_url[self.parent.environment]["api"] + path
+        for attempt in range(2):
+            request_headers = {"Authorization": "Bearer " + self.get_oauth_token(),
+                               "Content-Type": "application/json", "Accept": "application/json"}
+            request_headers.update(headers or {})
+            response = get_http_session().request(method, url, json=json_data, headers=request_headers,
+                                                  timeout=HTTP_TIMEOUT)
+            if response.status_code != 401 or attempt:
+                return response
+            dlprint(u"PayPal ha rechazado el token OAuth, se renueva")
+            self.invalidate_oauth_token()
+
+    ####################################################################
+    ## Paso 1.1. Configuración del pago
+    def configurePayment(self, **kwargs):
+        # PayPal recibe el importe como cadena con los decimales de la moneda
+        self.importe = self.parent.operation.money.format_amount()
+
+    ####################################################################
+    ## Paso 1.2. Preparación del TPV y Generación del número de operación (id de la orden)
+    def setupPayment(self, operation_number=None, code_len=17):
+        """
+        Crea la orden en PayPal. El número de operación es el id de la orden.
+        """
+        dlprint("PaypalRest.setupPayment")
+        if operation_number:
+            self.order_id = operation_number
+            dlprint("Rescato el operation number para esta venta {0}".format(self.order_id))
+            return self.order_id
+
+        operation = self.parent.operation
+        order = {
+            "intent": "CAPTURE",
+            "purchase_units": [{
+                "reference_id": operation.sale_code,
+                "description": operation.description[:127],
+                "amount": {"currency_code": operation.currency, "value": self.importe},
+            }],
+            "application_context": {
+                "return_url": self.return_url,
+                "cancel_url": operation.url_nok,
+                "user_action": "PAY_NOW",
+            },
+        }
+        dlprint(u"Orden que enviamos a PayPal")
+        dlprint(order)
+
+        response = self._api_request("POST", "/v2/checkout/orders", json_data=order)
+        response_data = response.json()
+        dlprint(u"Respuesta de PayPal")
+        dlprint(response_data)
+
+        if response.status_code not in (200, 201) or not response_data.get("id"):
+            raise ValueError(u"ERROR. PayPal no ha creado la orden: {0} - {1}".format(
+                response_data.get("name"), response_data.get("message")))
+
+        self.order_id = response_data["id"]
+        return self.order_id
+
+    ####################################################################
+    ## Paso 1.3. Obtiene los datos de pago
+    ## Este método enviará un formulario por GET con el id de la orden
+    def getPaymentFormData(self):
+        form_data = {
+            "data": {"token": self.order_id},
+            "action": self.paypal_url[self.parent.environment]["payment"],
+            "method": "get"
+        }
+        return form_data
+
+    ####################################################################
+    ## Paso 3.1. Obtiene el número de operación (id de la orden) y los datos que nos
+    ## envíe la pasarela de pago.
+    @staticmethod
+    def receiveConfirmation(request, **kwargs):
+
+        # Almacén de operaciones
+        try:
+            operation = VPOSPaymentOperation.objects.defer("confirmation_data").get(operation_number=request.GET.get("token"))
+            operation.set_confirmation_data({"GET": request.GET.dict(), "POST": request.POST.dict()})
+            operation.confirmation_code = request.GET.get("token")
+            # Los datos se guardan una vez verificada la operación (ver VirtualPointOfSale.verifyConfirmation)
+            vpos = operation.virtual_point_of_sale
+        except VPOSPaymentOperation.DoesNotExist:
+            # Si no existe la operación, están intentando
+            # cargar una operación inexistente
+            return False
+
+        # Iniciamos el delegado y la operación
+        vpos._init_delegated()
+        vpos.operation = operation
+
+        vpos.delegated.order_id = request.GET.get("token")
+        vpos.delegated.payer_id = request.GET.get("PayerID")
+
+        dlprint(u"Lo que recibimos de PayPal: ")
+        dlprint(request.GET)
+        return vpos.delegated
+
+    ####################################################################
+    ## Paso 3.2. Verifica que la orden está aprobada por el comprador y que su importe
+    ## es el de la operación. Los datos se consultan directamente a PayPal.
+    def verifyConfirmation(self):
+        response = self._api_request("GET", "/v2/checkout/orders/{0}".format(self.order_id))
+        if response.status_code != 200:
+            dlprint(u"PayPal no encuentra la orden {0}".format(self.order_id))
+            return False
+
+        order = response.json()
+        # Los datos de la orden vienen de PayPal con nuestras credenciales
+        self.notification_authenticated = True
+
+        operation = self.parent.operation
+        try:
+            amount = order["purchase_units"][0]["amount"]
+        except (KeyError, IndexError):
+            return False
+        if order.get("status") != "APPROVED" or amount.get("currency_code") != operation.currency or \
+                amount.get("value") != operation.money.format_amount():
+            dlprint(u"La orden {0} no está aprobada o su importe no coincide: {1}".format(self.order_id, order))
+            return False
+        return True
+
+    ####################################################################
+    ## Paso 3.3. Captura el pago de la orden aprobada
+    def charge(self):
+        response = self._api_request("POST", "/v2/checkout/orders/{0}/capture".format(self.order_id),
+                                     headers={"PayPal-Request-Id": self.order_id})
+        response_data = response.json()
+        dlprint(u"Respuesta de PayPal a la captura")
+        dlprint(response_data)
+        VPOSPaymentPayload.append(self.parent.operation, "capture", response_data)
+
+        if response.status_code not in (200, 201) or response_data.get("status") != "COMPLETED":
+            raise VPOSCantCharge(u"PayPal no ha capturado la orden {0}: {1} - {2}".format(
+                self.order_id, response_data.get("name"), response_data.get("message")))
+
+        # Si llegamos aquí, es que ha ido bien la operación, asi que redireccionamos a la url de payment_ok
+        return redirect(reverse("payment_ok_url", kwargs={"sale_code": self.parent.operation.sale_code}))
+
+    ####################################################################
+    ## Paso 3.3b. Si ha habido un error en el pago, redirigimos a la url correcta
+    def responseNok(self, **kwargs):
+        dlprint("responseNok")
+        # Sin operación (p.ej. desde staticResponseNok) no hay venta a la que redirigir
+        if not self.parent_id or self.parent.operation is None:
+            return HttpResponse("NOK", status=400)
+        return redirect(reverse("payment_cancel_url", kwargs={"sale_code": self.parent.operation.sale_code}))
+
+    ####################################################################
+    ## Paso R. (Refund) Devuelve (total o parcialmente) la captura del pago
+    def refund(self, operation_sale_code, refund_amount, description):
+        """
+        Devuelve el importe con POST /v2/payments/captures/{id}/refund. El id de la captura se toma
+        de la respuesta de la captura guardada en el registro de mensajes de la operación (ver charge).
+        La devolución es síncrona: no hay confirmación asíncrona (refund_response_ok/nok).
+        :return: True | False según PayPal acepte la devolución.
+        """
+        refund_operation = self.parent.operation
+        payment_operation = refund_operation.payment
+        capture_id = self._capture_id(payment_operation)
+        if capture_id is None:
+            raise VPOSOperationException(u"No se encuentra la captura de PayPal del pago {0}".format(
+                payment_operation.operation_number))
+
+        money = Money.from_amount(refund_amount, payment_operation.currency)
+        refund_data = {
+            "amount": {"currency_code": money.currency, "value": money.format_amount()},
+            "note_to_payer": description[:255],
+        }
+        # El id de la devolución hace la petición idempotente si se repite
+        response = self._api_request("POST", "/v2/payments/captures/{0}/refund".format(capture_id),
+                                     json_data=refund_data,
+                                     headers={"PayPal-Request-Id": "refund-{0}".format(refund_operation.id)})
+        response_data = response.json()
+        dlprint(u"Respuesta de PayPal a la devolución")
+        dlprint(response_data)
+        VPOSPaymentPayload.append(payment_operation, "refund", response_data)
+
+        # PENDING: PayPal ha aceptado la devolución y la abonará más adelante (p.ej. pagos con eCheck)
+        if response.status_code not in (200, 201) or response_data.get("status") not in ("COMPLETED", "PENDING"):
+            dlprint(u"PayPal no ha devuelto la captura {0}: {1} - {2}".format(
+                capture_id, response_data.get("name"), response_data.get("message")))
+            return False
+        return True
+
+    @staticmethod
+    def _capture_id(payment_operation):
+        """Id de la captura de PayPal de un pago, o None si no se ha capturado."""
+        for payload in payment_operation.payloads.filter(kind="capture").order_by("-id"):
+            try:
+                capture = json.loads(payload.data)["purchase_units"][0]["payments"]["captures"][0]
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            if capture.get("status") == "COMPLETED":
+                return capture["id"]
+        return None
+
+    ####################################################################
+    ## Paso R2.a. Respuesta positiva a confirmación asíncrona de refund
+    def refund_response_ok(self, extended_status=""):
+        raise VPOSOperationNotImplemented(u"No se ha implementado la operación de devolución particular para Paypal.")
+
+    ####################################################################
+    ## Paso R2.b. Respuesta negativa a confirmación asíncrona de refund
+    def refund_response_nok(self, extended_status=""):
+        raise VPOSOperationNotImplemented(u"No se ha implementado la operación de devolución particular para Paypal.")
+
+    ####################################################################
+    ## Paso Q1 (Query) Consulta el estado de operaciones en la pasarela
+    def query_status(self, operations):
+        """
+        Consulta el estado de las operaciones (órdenes) con GET /v2/checkout/orders/{id}.
+        Todas las consultas comparten el mismo token OAuth.
+        """
+        import requests
+
+        # Se obtiene antes de lanzar los hilos para que no lo pidan todos a la vez
+        self.get_oauth_token()
+
+        def query_operation_status(operation):
+            try:
+                response = self._api_request("GET", "/v2/checkout/orders/{0}".format(operation.operation_number))
+            except requests.RequestException as e:
+                dlprint(u"Error consultando el estado de {0} en PayPal: {1}".format(operation.operation_number, e))
+                return None
+            # Las órdenes no capturadas desaparecen cuando caducan
+            if response.status_code == 404:
+                return "expired"
+            if response.status_code != 200:
+                return None
+            return self.ORDER_STATUSES.get(response.json().get("status"))
+
+        statuses = thread_map(query_operation_status, operations)
+        return dict(zip([operation.id for operation in operations], statuses))
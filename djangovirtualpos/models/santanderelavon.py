@@ -0,0 +1,604 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals, print_function
+
+import hashlib
+import random
+import re
+
+from django.core.validators import MinLengthValidator, MaxLengthValidator, RegexValidator
+from django.db import models
+from django.http import HttpResponse
+from django.utils import timezone
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.money import CURRENCY_CHOICES
+from djangovirtualpos.util import get_http_session, thread_map, HTTP_TIMEOUT
+from djangovirtualpos.models.base import VPOSPaymentOperation, VPOSCantCharge, VPOSOperationNotImplemented, \
+    VirtualPointOfSale
+from djangovirtualpos.models.redsys import PREAUTHORIZATION_CONFIRMATION_TRANSACTION_TYPE, \
+    PREAUTHORIZATION_CANCELLATION_TRANSACTION_TYPE
+
+
+########################################################################################################################
+########################################################################################################################
+################################################# TPV Santander Elavon #################################################
+########################################################################################################################
+########################################################################################################################
+
+class VPOSSantanderElavon(VirtualPointOfSale):
+    """Información de configuración del TPV Virtual CECA"""
+
+    regex_clientid = re.compile("^[a-zA-Z0-9]*$")
+    regex_account = re.compile("^[a-zA-Z0-9.]*$")
+    regex_number = re.compile("^\d*$")
+    regex_operation_number_prefix = re.compile("^[A-Za-z0-9]*$")
+
+    # Relación con el padre (TPV).
+    # Al poner el signo "+" como "related_name" evitamos que desde el padre
+    # se pueda seguir la relación hasta aquí (ya que cada uno de las clases
+    # que heredan de ella estará en una tabla y sería un lío).
+    parent = models.OneToOneField(VirtualPointOfSale, parent_link=True, related_name="+", null=False,
+                                  db_column="vpos_id")
+
+    # Identifica al comercio, será facilitado por la caja en el proceso de alta
+    merchant_id = models.CharField(max_length=50, null=False, blank=False, verbose_name="MerchantID",
+                                   validators=[MinLengthValidator(1), MaxLengthValidator(50),
+                                               RegexValidator(regex=regex_clientid,
+                                                              message="Asegúrese de que todos los caracteres son alfanuméricos")])
+    # Confirmation URL that will be used by the virtual POS
+    merchant_response_url = models.URLField(max_length=64, null=False, blank=False, verbose_name="MerchantURL",
+                                            help_text=u"Confirmation URL that will be used by the virtual POS")
+
+    # Identifica la caja, será facilitado por la caja en el proceso de alta
+    account = models.CharField(max_length=30, null=False, blank=False, verbose_name="Account",
+                               validators=[MinLengthValidator(0), MaxLengthValidator(30),
+                                           RegexValidator(regex=regex_account,
+                                                          message="Asegúrese de que todos los caracteres son alfanuméricos")])
+    # Clave de cifrado
+    encryption_key = models.CharField(max_length=64, null=False, blank=False, verbose_name="Clave secreta de cifrado",
+                                      validators=[MinLengthValidator(8), MaxLengthValidator(10)])
+
+    # Prefijo del número de operación usado para identicar al servidor desde el que se realiza la petición
+    operation_number_prefix = models.CharField(max_length=20, null=False, blank=True,
+                                               verbose_name="Prefijo del número de operación",
+                                               validators=[MinLengthValidator(0), MaxLengthValidator(20),
+                                                           RegexValidator(regex=regex_operation_number_prefix,
+                                                                          message="Asegúrese de sólo use caracteres alfanuméricos")])
+
+    # Moneda en la que se cobran las operaciones (código ISO 4217)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES, default="EUR", verbose_name="Moneda")
+
+    # Si se activa, la confirmación sólo registra la autorización (estado "authorized") y responde en el acto.
+    # La operación "settle" se envía más adelante, en bloque (ver djangovirtualpos.preauthorization).
+    deferred_settlement = models.BooleanField(default=False, verbose_name="Liquidación diferida",
+                                              help_text=u"Las autorizaciones se liquidan más tarde en bloque "
+                                                        u"(comando vpos_settle_preauthorizations)")
+
+    # El TPV de Santander Elavon utiliza dos protocolos, "Redirect" y "Remote". Cada uno de ellos tiene dos entornos,
+    # uno para pruebas y otro para producción
+    REDIRECT_SERVICE_URL = {
+        "production": "https://hpp.santanderelavontpvvirtual.es/pay",
+        "testing": "https://hpp.prueba.santanderelavontpvvirtual.es/pay"
+    }
+
+    REMOTE_SERVICE_URL = {
+        "production": "https://remote.santanderelavontpvvirtual.es/remote",
+        "testing": "https://remote.prueba.santanderelavontpvvirtual.es/remote"
+    }
+
+    # URL de pago que variará según el entorno
+    url = None
+
+    # Identifica el importe de la venta, siempre será un número entero y donde los dos últimos dígitos representan los decimales
+    amount = None
+
+    # Timestamp requerido entre los datos POST enviados al servidor
+    timestamp = None
+
+    # Operación del protocolo "Remote" según el tipo de transacción de djangovirtualpos.preauthorization
+    SETTLEMENT_REQUEST_TYPES = {
+        PREAUTHORIZATION_CONFIRMATION_TRANSACTION_TYPE: "settle",
+        PREAUTHORIZATION_CANCELLATION_TRANSACTION_TYPE: "void",
+    }
+
+    ####################################################################
+    ## Inicia el valor de la clave de cifrado en función del entorno
+    def __init_encryption_key__(self):
+        # Este modelo de TPV utiliza una única clave de cifrado tanto para el entorno de pruebas como para el de
+        # producción, por lo que no es necesario hacer nada especial
+        pass
+
+    ####################################################################
+    ## Constructor del TPV Santader Elavon
+    def __init__(self, *args, **kwargs):
+        super(VPOSSantanderElavon, self).__init__(*args, **kwargs)
+
+    def __unicode__(self):
+        return self.name
+
+    @classmethod
+    def form(cls):
+        from djangovirtualpos.forms import VPOSSantanderElavonForm
+        return VPOSSantanderElavonForm
+
+    ####################################################################
+    ## Paso 1.1. Configuración del pago
+    def configurePayment(self, **kwargs):
+        # URL de pago según el entorno
+        self.url = {
+            "redirect": self.REDIRECT_SERVICE_URL[self.parent.environment],
+            "remote": self.REMOTE_SERVICE_URL[self.parent.environment]
+        }
+
+        # Formato para Importe: según las especificaciones, ha de tener un formato de entero positivo
+        # (unidades mínimas de la moneda)
+        self.amount = self.parent.operation.money.format_minor_units()
+
+        # Timestamp con la hora local requerido por el servidor en formato AAAAMMDDHHMMSS
+        self.timestamp = timezone.now().strftime("%Y%m%d%H%M%S")
+
+    ####################################################################
+    ## Paso 1.2. Preparación del TPV y Generación del número de operación
+    def setupPayment(self, operation_number=None, code_len=40):
+        """
+        Inicializa el número de operación si no se indica uno
+        explícitamente en los argumentos.
+        """
+
+        if operation_number:
+            return operation_number
+
+        operation_number = ''
+        for i in range(code_len):
+            operation_number += random.choice('ABCDEFGHJKLMNPQRSTUWXYZ23456789')
+        # Si en settings tenemos un prefijo del número de operación
+        # se lo añadimos delante, con carácter "-" entre medias
+        if self.operation_number_prefix:
+            operation_number = self.operation_number_prefix + "-" + operation_number
+            return operation_number[0:code_len]
+        return operation_number
+
+    ####################################################################
+    ## Paso 1.3. Obtiene los datos de pago
+    ## Este método será el que genere los campos del formulario de pago
+    ## que se rellenarán desde el cliente (por Javascript)
+    def getPaymentFormData(self):
+        data = {
+            # Identifica al comercio, será facilitado por la entidad
+            "MERCHANT_ID": self.merchant_id,
+            # Identifica al terminal, será facilitado por la entidad
+            "ACCOUNT": self.account,
+            # Identifica el número de pedido, factura, albarán, etc
+            "ORDER_ID": self.parent.operation.operation_number,
+            # Importe de la operación sin formatear. Siempre será entero con los dos últimos dígitos usados para los centimos
+            "AMOUNT": self.amount,
+            "CURRENCY": self.currency,
+            # Marca de tiempo de la transacción
+            "TIMESTAMP": self.timestamp,
+            # Cadena de caracteres calculada por el comercio
+            "SHA1HASH": self._post_signature(),
+            # No cargar el importe de forma automática (AUTO_SETTLE_FLAG=0). En el método charge() hay que hacer una
+            # llamada a un webservice XML con los datos apropiados para que el pago se haga efectivo.
+            "AUTO_SETTLE_FLAG": "0",
+            # URL de confirmación. Si se indica una, se sobrescribe el valor que tenga configurada la cuenta del TPV
+            "MERCHANT_RESPONSE_URL": self.merchant_response_url
+        }
+
+        form_data = {
+            "data": data,
+            "action": self.url['redirect'],
+            "enctype": "application/x-www-form-urlencoded",
+            "method": "post"
+        }
+
+        dlprint(u"Datos para formulario Santander Elavon: {0}".format(form_data))
+        return form_data
+
+    ####################################################################
+    ## Paso 3.1. Obtiene el número de operación y los datos que nos
+    ## envíe la pasarela de pago.
+    @staticmethod
+    def receiveConfirmation(request, **kwargs):
+        dlprint(u"receiveConfirmation. Encoding:{0}".format(request.encoding))
+
+        # Almacén de operaciones
+        try:
+            operation = VPOSPaymentOperation.objects.defer("confirmation_data").get(operation_number=request.POST.get("ORDER_ID"))
+            operation.set_confirmation_data({"GET": request.GET.dict(), "POST": request.POST.dict()})
+
+            # en charge() nos harán falta tanto el AUTHCODE PASREF, por eso se meten los dos en el campo
+            # operation.confirmation_code, separados por el carácter ":"
+            operation.confirmation_code = "{pasref}:{authcode}".format(
+                pasref=request.POST.get("PASREF"),
+                authcode=request.POST.get("AUTHCODE")
+            )
+            # Los datos se guardan una vez verificada la firma (ver VirtualPointOfSale.verifyConfirmation)
+            vpos = operation.virtual_point_of_sale
+        except VPOSPaymentOperation.DoesNotExist:
+            # Si no existe la operación, están intentando
+            # cargar una operación inexistente
+            return False
+
+        # Iniciamos el delegado y la operación, esto es fundamental
+        # para luego calcular la firma
+        vpos._init_delegated()
+        vpos.operation = operation
+
+        # Iniciamos los valores recibidos en el delegado, para el cálculo de la firma
+
+        # Marca de tiempo de la solicitud enviada a la pasarela
+        vpos.delegated.timestamp = request.POST.get("TIMESTAMP")
+        # Identifica al comercio
+        vpos.delegated.merchant_id = request.POST.get("MERCHANT_ID")
+        # Identifica el número de pedido, factura, albarán, etc
+        vpos.delegated.order_id = request.POST.get("ORDER_ID")
+        # Resultado de la operación
+        vpos.delegated.result = request.POST.get("RESULT")
+        # Mensaje textual del resultado de la operación
+        vpos.delegated.message = request.POST.get("MESSAGE", "")
+        dlprint("type(message): {0}".format(type(vpos.delegated.message)))
+        # Referencia asignada por el TPV
+        vpos.delegated.pasref = request.POST.get("PASREF")
+        # Código de autorización de la operación
+        vpos.delegated.authcode = request.POST.get("AUTHCODE")
+        # Firma enviada por la pasarela de pagos
+        vpos.delegated.sha1hash = request.POST.get("SHA1HASH")
+
+        # URLs para charge()
+        vpos.delegated.url = {
+            "redirect": VPOSSantanderElavon.REDIRECT_SERVICE_URL[vpos.environment],
+            "remote": VPOSSantanderElavon.REMOTE_SERVICE_URL[vpos.environment]
+        }
+
+        dlprint(u"Response Santander Elavon redirect: ")
+        dlprint(request.POST)
+        return vpos.delegated
+
+    ####################################################################
+    ## Paso 3.2. Verifica que los datos enviados desde
+    ## la pasarela de pago identifiquen a una operación de compra.
+    def verifyConfirmation(self):
+        # Comprobar firma de la respuesta
+        firma_calculada = self._verification_signature()
+        dlprint(u"Firma recibida " + self.sha1hash)
+        dlprint(u"Firma calculada " + firma_calculada)
+        if self.sha1hash != firma_calculada:
+            return False
+        self.notification_authenticated = True
+
+        # Comprobar código de la respuesta. Tódos los códigos que sean diferentes de 00
+        # indican que la pasarela no ha aceptado la operación.
+        #
+        # A continuación se detallan todos los códigos posibles de la respuesta
+        #
+        # Código Descripción
+        # ------ --------------------------------------------------------------------------------------------------
+        # 00     Operación realizada correctamente: La transacción se ha procesado y puedes continuar con la
+        #        venta.
+        #
+        # 1xx    Una transacción denegada. Puedes tratar cualquier código 1xx como una transacción denegada e
+        #        informar al cliente de que deberá intentar de nuevo el pago o probar con otro método distinto.
+        #        Si lo deseas, puedes proporcionar flujos alternativos basados en códigos específicos como los
+        #        que se indican a continuación:
+        #        101 Denegada por el banco: Normalmente, suele producirse por la falta de fondos o por una
+        #        fecha de caducidad incorrecta.
+        #        102 Referencia del banco (tratar como denegada en el sistema automático, por ejemplo, en
+        #        Internet)
+        #        103 Tarjeta perdida o robada
+        #        107 Las comprobaciones antifraude han bloqueado la transacción.
+        #        1xx Otro motivo poco frecuente. Tratar como denegada igual que el código 101.
+        #
+        # 2xx    Error con los sistemas bancarios: Normalmente, puedes pedirle al cliente que vuelva a intentarlo
+        #        de nuevo más tarde. El tiempo de resolución depende del problema.
+        #
+        # 3xx    Error con el sistema TPV Virtual de Santander Elavon: Normal mente, puedes pedirle al cliente
+        #        que vuelva a intentarlo de nuevo más tarde. El tiempo de resolución depende del problema.
+        #
+        # 5xx    Contenido o formación incorrectos de los mensajes XML. Se trata de errores de desarrollo,
+        #        errores de configuración o errores del cliente. A continuación, se incluye una lista completa, pero
+        #        a grandes rasgos:
+        #        508 Problema de desarrollo: Comprueba el mensaje y corrige tu integración.
+        #        509 Problema del cliente: Comprueba el mensaje y pide al cliente que confirme los detalles de
+        #        pago y que lo intente de nuevo.
+        #        5xx Problema de configuración: Comprueba el mensaje. Ponte en contacto con el equipo de soporte
+        #        de TPV Virtual de Santander Elavon para solucionar estos problemas.
+        #
+        # 666    Cliente desactivado: Tu cuenta de TPV Virtual de Santander Elavon se ha suspendido. Ponte en
+        #        contacto con el equipo de soporte de TPV Virtual de Santander Elavon para obtener más
+        #        información.
+
+        if self.result != u"00":
+            return False
+
+        return True
+
+    ####################################################################
+    ## Paso 3.3a. Realiza el cobro y genera la respuesta a la pasarela y
+    ## comunicamos con la pasarela de pago para que marque la operación
+    ## como pagada.
+    def charge(self):
+        import urllib2
+        from bs4 import BeautifulSoup
+        dlprint(u"responseOk")
+
+        if self.deferred_settlement:
+            # La autorización queda registrada y se liquida más adelante (ver djangovirtualpos.preauthorization),
+            # así el cliente no espera a la operación "settle"
+            dlprint(u"Autorización pendiente de liquidación diferida")
+            self.charged_status = "authorized"
+            return self._redirect_response(u"Operación realizada", u"Operación realizada con éxito",
+                                           self.parent.operation.url_ok)
+
+        # Enviar operación "settle" al TPV, mediante protocolo Santander Elavon "Remote"
+        dlprint(u"confirmation_code almacenado: {0}".format(self.parent.operation.confirmation_code))
+        self.pasref, self.authcode = self.parent.operation.confirmation_code.split(":", 1)
+
+        xml_string = self._remote_request_xml("settle", self.parent.operation, self.timestamp)
+
+        # Enviamos la petición HTTP POST
+        dlprint(u"Request SETTLE: {0}".format(xml_string))
+        request = urllib2.Request(self.url['remote'], xml_string, headers={"Content-Type": "application/xml"})
+
+        # Recogemos la respuesta dada, que vendrá en texto plano
+        response = urllib2.urlopen(request)
+        response_string = response.read().decode("utf8")
+        dlprint(u"Response SETTLE: {0}".format(response_string))
+
+        # Almacenar respuesta en el registro de comunicaciones de la operación
+        self.parent.operation.append_payload("settle_response", response_string)
+        dlprint(u"Operation {0} actualizada en charge()".format(self.parent.operation.operation_number))
+
+        # Comprobar que se ha hecho el cargo de forma correcta parseando el XML de la respuesta
+        try:
+            dlprint(u"Antes de parser BeautifulSoup")
+            soup = BeautifulSoup(response_string, "html.parser")
+            dlprint(u"Después de parser BeautifulSoup")
+            if soup.response.result.string != u"00":
+                dlprint(u"Response SETTLE operación no autorizada")
+                raise VPOSCantCharge(u"Cargo denegado (código TPV {0})".format(soup.response.result.string))
+            else:
+                dlprint(u"Response SETTLE operación autorizada")
+        except Exception as e:
+            dlprint(u"EXCEPCIÓN: {0}".format(e))
+            raise
+
+        return self._redirect_response(u"Operación realizada", u"Operación realizada con éxito",
+                                       self.parent.operation.url_ok)
+
+    ####################################################################
+    ## Página HTML de respuesta a la pasarela
+    @staticmethod
+    def _redirect_response(title, message, url):
+        # La pasarela de pagos Santander Elavon "Redirect" espera recibir una plantilla HTML que se le mostrará al
+        # cliente.
+        # Ya que dicho TPV no redirige al navegador del cliente a ninguna URL, se hace la redirección a la url
+        # indicada mediante Javascript.
+        return HttpResponse(u"""
+            <html>
+                <head>
+                    <title>{0}</title>
+                    <script type="text/javascript">
+                        window.location.assign("{2}");
+                    </script>
+                </head>
+                <body>
+                    <p><strong>{1}</strong></p>
+                    <p>Pulse <a href="{2}">este enlace</a> si su navegador no le redirige automáticamente</p>
+                </body>
+            </html>
+        """.format(title, message, url))
+
+    ####################################################################
+    ## Paso 3.3b. Si ha habido un error en el pago, se ha de dar una
+    ## respuesta negativa a la pasarela bancaria.
+    def responseNok(self, **kwargs):
+        import urllib2
+        # Sin operación (p.ej. desde staticResponseNok) no hay nada que anular en la pasarela
+        if getattr(getattr(self, "parent", None), "operation", None) is None:
+            dlprint(u"responseNok sin operación")
+            return HttpResponse(u"Operación cancelada")
+
+        # Enviar operación "void" mediante protocolo Santander Elavon "Remote"
+        dlprint(u"confirmation_code almacenado: {0}".format(self.parent.operation.confirmation_code))
+        self.pasref, self.authcode = self.parent.operation.confirmation_code.split(":", 1)
+
+        xml_string = self._remote_request_xml("void", self.parent.operation, self.timestamp)
+
+        # Enviamos la petición HTTP POST
+        dlprint(u"Request VOID: {0}".format(xml_string))
+        request = urllib2.Request(self.url['remote'], xml_string, headers={"Content-Type": "application/xml"})
+
+        # Recogemos la respuesta dada, que vendrá en texto plano
+        response = urllib2.urlopen(request)
+        response_string = response.read().decode("utf8")
+        dlprint(u"Response VOID: {0}".format(response_string))
+
+        # Almacenar respuesta en el registro de comunicaciones de la operación
+        self.parent.operation.append_payload("void_response", response_string)
+        dlprint(u"Operation {0} actualizada en responseNok()".format(self.parent.operation.operation_number))
+
+        # La pasarela de pagos Santander Elavon "Redirect" no espera recibir ningún valor especial.
+        dlprint(u"responseNok")
+
+        return self._redirect_response(u"Operación cancelada", u"Operación cancelada", self.parent.operation.url_nok)
+
+    ####################################################################
+    ## Paso R. (Refund) Configura el TPV en modo devolución
+    ## TODO: No implementado
+    def refund(self, operation_sale_code, refund_amount, description):
+        raise VPOSOperationNotImplemented(
+            u"No se ha implementado la operación de devolución particular para Santander-Elavon.")
+
+    ####################################################################
+    ## Paso R2.a. Respuesta positiva a confirmación asíncrona de refund
+    def refund_response_ok(self, extended_status=""):
+        raise VPOSOperationNotImplemented(
+            u"No se ha implementado la operación de devolución particular para Santader-Elavon.")
+
+    ####################################################################
+    ## Paso R2.b. Respuesta negativa a confirmación asíncrona de refund
+    def refund_response_nok(self, extended_status=""):
+        raise VPOSOperationNotImplemented(
+            u"No se ha implementado la operación de devolución particular para Santender-Elavon.")
+
+    ####################################################################
+    ## Paso Q1 (Query) Consulta el estado de operaciones en la pasarela
+    def query_status(self, operations):
+        raise VPOSOperationNotImplemented(
+            u"No se ha implementado la consulta de estado de operaciones para Santender-Elavon.")
+
+    ####################################################################
+    ## Liquidación (settle) o anulación (void) en bloque de autorizaciones diferidas
+    def settle_preauthorizations(self, operations, transaction_type, workers=None, rate_limiter=None):
+        """
+        Liquida ("settle") o anula ("void") varias autorizaciones de este TPV en paralelo, por la sesión HTTP
+        compartida. No modifica las operaciones, ver djangovirtualpos.preauthorization.
+        :param operations: lista de VPOSPaymentOperation autorizadas (estado "authorized").
+        :param transaction_type: PREAUTHORIZATION_CONFIRMATION_TRANSACTION_TYPE (settle)
+                                 o PREAUTHORIZATION_CANCELLATION_TRANSACTION_TYPE (void).
+        :param workers: número máximo de peticiones simultáneas.
+        :param rate_limiter: util.RateLimiter compartido para no superar un número de peticiones por segundo.
+        :return: dict id de operación -> True (aceptada), False (denegada, códigos 1xx)
+                 o None si no se ha podido enviar o la pasarela ha devuelto otro error (se reintentará).
+        """
+        import requests
+        from bs4 import BeautifulSoup
+        request_type = self.SETTLEMENT_REQUEST_TYPES[transaction_type]
+        url = self.REMOTE_SERVICE_URL[self.parent.environment]
+
+        def settle_operation(operation):
+            xml_string = self._remote_request_xml(request_type, operation, timezone.now().strftime("%Y%m%d%H%M%S"))
+            if rate_limiter is not None:
+                rate_limiter.wait()
+            try:
+                response = get_http_session().post(url, data=xml_string.encode("utf-8"),
+                                                   headers={"Content-Type": "application/xml"}, timeout=HTTP_TIMEOUT)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                dlprint(u"Error enviando {0} de la operación {1}: {2}".format(request_type, operation.operation_number,
+                                                                             e))
+                return None
+
+            soup = BeautifulSoup(response.text, "html.parser")
+            result = soup.response.result.string if soup.response and soup.response.result else None
+            dlprint(u"Response {0} {1}: {2}".format(request_type.upper(), operation.operation_number, result))
+            if result == u"00":
+                return True
+            if result and result.startswith(u"1"):
+                return False
+            return None
+
+        results = thread_map(settle_operation, operations, workers)
+        return dict(zip([operation.id for operation in operations], results))
+
+    ####################################################################
+    ## Generador de firma para el envío POST al servicio "Redirect"
+    def _post_signature(self):
+        """Calcula la firma a incorporar en el formulario de pago"""
+        self.__init_encryption_key__()
+        dlprint(u"Clave de cifrado es " + self.encryption_key)
+
+        amount = self.parent.operation.money.format_minor_units()
+
+        signature1 = u"{timestamp}.{merchant_id}.{order_id}.{amount}.{currency}".format(
+            merchant_id=self.merchant_id,
+            order_id=self.parent.operation.operation_number,
+            amount=amount,
+            currency=self.currency,
+            timestamp=self.timestamp
+        )
+
+        firma1 = hashlib.sha1(signature1).hexdigest()
+        dlprint(u"FIRMA1 datos: {0}".format(signature1))
+        dlprint(u"FIRMA1 hash:  {0}".format(firma1))
+
+        signature2 = u"{firma1}.{secret}".format(firma1=firma1, secret=self.encryption_key)
+        firma2 = hashlib.sha1(signature2).hexdigest()
+        dlprint(u"FIRMA2 datos: {0}".format(signature2))
+        dlprint(u"FIRMA2 hash:  {0}".format(firma2))
+
+        return firma2
+
+    ####################################################################
+    ## Petición XML "settle"/"void" (Protocolo "Remote") de una operación
+    def _remote_request_xml(self, request_type, operation, timestamp):
+        """
+        Genera la petición XML 'settle' o 'void' de una operación autorizada.
+        No modifica el estado del TPV, por lo que se puede usar desde varios hilos.
+        """
+        # El PASREF y el AUTHCODE de la autorización se guardan en confirmation_code separados por ":"
+        pasref, authcode = operation.confirmation_code.split(":", 1)
+        return u'<request timestamp="{timestamp}" type="{request_type}"><merchantid>{merchant_id}</merchantid><account>{account}</account><orderid>{order_id}</orderid><pasref>{pasref}</pasref><authcode>{authcode}</authcode><sha1hash>{sha1hash}</sha1hash></request>'.format(
+            timestamp=timestamp,
+            request_type=request_type,
+            merchant_id=self.merchant_id,
+            account=self.account,
+            order_id=operation.operation_number,
+            pasref=pasref,
+            authcode=authcode,
+            sha1hash=self._settle_void_signature(label=request_type.upper(), operation=operation, timestamp=timestamp)
+        )
+
+    ####################################################################
+    ## Generador de firma para el envío XML POST al servicio "settle"/"void" (Protocolo "Remote")
+    def _settle_void_signature(self, label=None, operation=None, timestamp=None):
+        """Calcula la firma a incorporar en el en la petición XML 'settle' o 'void'"""
+        self.__init_encryption_key__()
+        dlprint(u"Calcular firma para {0}. La clave de cifrado es {1}".format(label, self.encryption_key))
+
+        signature1 = u"{timestamp}.{merchant_id}.{order_id}...".format(
+            merchant_id=self.merchant_id,
+            order_id=(operation or self.parent.operation).operation_number,
+            timestamp=timestamp or self.timestamp
+        )
+
+        firma1 = hashlib.sha1(signature1).hexdigest()
+        dlprint(u"FIRMA1 datos: {0}".format(signature1))
+        dlprint(u"FIRMA1 hash:  {0}".format(firma1))
+
+        signature2 = u"{firma1}.{secret}".format(firma1=firma1, secret=self.encryption_key)
+        firma2 = hashlib.sha1(signature2).hexdigest()
+        dlprint(u"FIRMA2 datos: {0}".format(signature2))
+        dlprint(u"FIRMA2 hash:  {0}".format(firma2))
+
+        return firma2
+
+    ####################################################################
+    ## Generador de firma para el envío XML POST al servicio "settle" (Protocolo "Remote")
+    def _settle_signature(self):
+        """Calcula la firma a incorporar en el en la petición XML 'void'"""
+        return self._settle_void_signature(label="SETTLE")
+
+    ####################################################################
+    ## Generador de firma para el envío XML POST al servicio "void" (Protocolo "Remote")
+    def _void_signature(self):
+        """Calcula la firma a incorporar en el en la petición XML 'void'"""
+        return self._settle_void_signature(label="VOID")
+
+    ####################################################################
+    ## Generador de firma para la verificación
+    def _verification_signature(self):
+        """ Calcula la firma de verificación de una respuesta de la pasarela de pagos """
+        self.__init_encryption_key__()
+        dlprint(u"Clave de cifrado es " + self.encryption_key)
+
+        signature1 = u"{timestamp}.{merchant_id}.{order_id}.{result}.{message}.{pasref}.{authcode}".format(
+            timestamp=self.timestamp,
+            merchant_id=self.merchant_id,
+            order_id=self.parent.operation.operation_number,
+            result=self.result,
+            message=self.message,
+            pasref=self.pasref,
+            authcode=self.authcode
+        )
+
+        firma1 = hashlib.sha1(signature1.encode("utf-8")).hexdigest()
+        dlprint(u"FIRMA1 datos: {0}".format(signature1))
+        dlprint(u"FIRMA1 hash:  {0}".format(firma1))
+
+        signature2 = "{firma1}.{secret}".format(firma1=firma1, secret=self.encryption_key)
+        firma2 = hashlib.sha1(signature2).hexdigest()
+        dlprint(u"FIRMA2 datos: {0}".format(signature2))
+        dlprint(u"FIRMA2 hash:  {0}".format(firma2))
+
+        return firma2
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from decimal import Decimal, ROUND_HALF_UP
+
+########################################################################################################################
+########################################################################################################################
+################################################ Importes y monedas ####################################################
+########################################################################################################################
+########################################################################################################################
+
+## Monedas ISO 4217 admitidas: código alfabético -> (código numérico, número de decimales)
+CURRENCIES = {
+    "ARS": ("032", 2),
+    "AUD": ("036", 2),
+    "BGN": ("975", 2),
+    "BHD": ("048", 3),
+    "BRL": ("986", 2),
+    "CAD": ("124", 2),
+    "CHF": ("756", 2),
+    "CLP": ("152", 0),
+    "CNY": ("156", 2),
+    "COP": ("170", 2),
+    "CZK": ("203", 2),
+    "DKK": ("208", 2),
+    "EUR": ("978", 2),
+    "GBP": ("826", 2),
+    "HUF": ("348", 2),
+    "JPY": ("392", 0),
+    "KWD": ("414", 3),
+    "MAD": ("504", 2),
+    "MXN": ("484", 2),
+    "NOK": ("578", 2),
+    "PLN": ("985", 2),
+    "RON": ("946", 2),
+    "SEK": ("752", 2),
+    "USD": ("840", 2),
+}
+
+## Opciones para los campos de moneda de los TPVs
+CURRENCY_CHOICES = tuple((currency, currency) for currency in sorted(CURRENCIES))
+
+## Factor entre unidades y unidades mínimas (10^decimales) de cada moneda, precalculado
+MINOR_UNIT_FACTORS = dict((currency, 10 ** exponent) for currency, (_numeric_code, exponent) in CURRENCIES.items())
+
+_UNIT = Decimal(1)
+
+
+class Money(object):
+    """
+    Importe exacto: número entero de unidades mínimas de la moneda (p.ej. céntimos) y código ISO 4217.
+    Los TPVs firman y envían el importe en unidades mínimas, así que se calcula una sola vez,
+    sin pasar por float, y se reutiliza al configurar el pago, firmar y devolver.
+    """
+    __slots__ = ("minor_units", "currency")
+
+    def __init__(self, minor_units, currency="EUR"):
+        if currency not in CURRENCIES:
+            raise ValueError(u"Moneda {0} no admitida".format(currency))
+        self.minor_units = int(minor_units)
+        self.currency = currency
+
+    @classmethod
+    def from_amount(cls, amount, currency="EUR"):
+        """
+        Construye el importe a partir de una cantidad en unidades de la moneda (p.ej. euros).
+        :param amount: Decimal, int, float o str. Los float se convierten por su representación decimal más corta.
+        """
+        if isinstance(amount, Money):
+            return amount
+        if isinstance(amount, float):
+            amount = repr(amount)
+        factor = MINOR_UNIT_FACTORS.get(currency)
+        if factor is None:
+            raise ValueError(u"Moneda {0} no admitida".format(currency))
+        minor_units = (Decimal(amount) * factor).quantize(_UNIT, rounding=ROUND_HALF_UP)
+        return cls(minor_units, currency)
+
+    @property
+    def numeric_code(self):
+        """Código numérico ISO 4217 (p.ej. "978" para euros)."""
+        return CURRENCIES[self.currency][0]
+
+    @property
+    def exponent(self):
+        """Número de decimales de la moneda."""
+        return CURRENCIES[self.currency][1]
+
+    @property
+    def amount(self):
+        """Cantidad en unidades de la moneda como Decimal exacto."""
+        return Decimal(self.minor_units).scaleb(-self.exponent)
+
+    def format_minor_units(self):
+        """Importe como entero en unidades mínimas, sin separador decimal (p.ej. "1250" para 12,50 €)."""
+        return "{0}".format(self.minor_units)
+
+    def format_amount(self):
+        """Importe en unidades con todos sus decimales (p.ej. "12.50")."""
+        return "{0:.{1}f}".format(self.amount, self.exponent)
+
+    def __eq__(self, other):
+        return isinstance(other, Money) and self.minor_units == other.minor_units and self.currency == other.currency
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.minor_units, self.currency))
+
+    def __repr__(self):
+        return "Money({0}, {1!r})".format(self.minor_units, str(self.currency))
+
+    def __unicode__(self):
+        return "{0} {1}".format(self.format_amount(), self.currency)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import io
+import json
+import os
+import Queue
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSOutboxEvent
+from djangovirtualpos.util import get_http_session, HTTP_TIMEOUT
+
+########################################################################################################################
+########################################################################################################################
+####################################### Envío de los eventos del outbox ################################################
+########################################################################################################################
+########################################################################################################################
+
+# Destino de los eventos: alias de uno de los destinos incluidos ("file", "webhook", "queue")
+# o ruta (módulo.Clase) de una clase con el método send(events)
+OUTBOX_SINK = getattr(settings, "VPOS_OUTBOX_SINK", "file")
+
+# Parámetros con los que se construye el destino (p.ej. {"path": "/var/log/vpos-outbox.jsonl"})
+OUTBOX_SINK_OPTIONS = getattr(settings, "VPOS_OUTBOX_SINK_OPTIONS", {})
+
+# Número de eventos que se envían al destino en cada llamada
+OUTBOX_BATCH_SIZE = getattr(settings, "VPOS_OUTBOX_BATCH_SIZE", 500)
+
+# Días que se conservan los eventos ya enviados antes de eliminarlos (None para no eliminarlos nunca)
+OUTBOX_RETENTION_DAYS = getattr(settings, "VPOS_OUTBOX_RETENTION_DAYS", 30)
+
+
+####################################################################
+## Destinos de los eventos
+class FileSink(object):
+    """
+    Añade los eventos a un fichero, uno por línea en formato JSON.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or "vpos-outbox.jsonl"
+
+    def send(self, events):
+        with io.open(self.path, "a", encoding="utf-8") as outbox_file:
+            for event in events:
+                outbox_file.write(json.dumps(event, separators=(",", ":"), ensure_ascii=False) + "\n")
+            outbox_file.flush()
+            os.fsync(outbox_file.fileno())
+
+
+class WebhookSink(object):
+    """
+    Envía cada lote de eventos en una única petición POST con cuerpo JSON: {"events": [...]}.
+    Cualquier respuesta que no sea 2xx se considera un error y el lote se vuelve a enviar en la siguiente ejecución.
+    """
+
+    def __init__(self, url, headers=None, timeout=None):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout or HTTP_TIMEOUT
+
+    def send(self, events):
+        response = get_http_session().post(self.url, json={"events": events}, headers=self.headers,
+                                           timeout=self.timeout)
+        response.raise_for_status()
+
+
+# Cola local que usa QueueSink si no se le indica otra
+LOCAL_QUEUE = Queue.Queue()
+
+
+class QueueSink(object):
+    """
+    Deja los eventos en una cola del propio proceso.
+    Sustituye a una cola de mensajes real en desarrollo y en pruebas.
+    """
+
+    def __init__(self, queue=None):
+        self.queue = queue if queue is not None else LOCAL_QUEUE
+
+    def send(self, events):
+        for event in events:
+            self.queue.put(event)
+
+
+OUTBOX_SINKS = {
+    "file": FileSink,
+    "webhook": WebhookSink,
+    "queue": QueueSink,
+}
+
+
+def get_sink(sink=None, **options):
+    """
+    Construye el destino de los eventos.
+    :param sink: alias de OUTBOX_SINKS o ruta de la clase. Por defecto VPOS_OUTBOX_SINK.
+    :param options: parámetros del destino. Por defecto VPOS_OUTBOX_SINK_OPTIONS.
+    """
+    if sink is None:
+        sink = OUTBOX_SINK
+    if not options:
+        options = OUTBOX_SINK_OPTIONS
+    if sink in OUTBOX_SINKS:
+        sink_class = OUTBOX_SINKS[sink]
+    else:
+        sink_class = import_string(sink)
+    return sink_class(**options)
+
+
+####################################################################
+## Envío de los eventos pendientes
+def _relay_batch(sink, batch_size):
+    """
+    Envía un lote de eventos y los marca como enviados en la misma transacción.
+    Si el destino falla, la transacción se deshace y los eventos se vuelven a enviar en la siguiente ejecución
+    (la entrega es "al menos una vez": el destino debe descartar los eventos repetidos por su id).
+    :return: número de eventos enviados
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        events = list(VPOSOutboxEvent.objects.select_for_update(skip_locked=skip_locked)
+                      .filter(relayed=False).order_by("id")[:batch_size])
+        if not events:
+            return 0
+        sink.send([event.as_dict() for event in events])
+        VPOSOutboxEvent.objects.filter(id__in=[event.id for event in events])\
+            .update(relayed=True, relayed_datetime=timezone.now())
+    return len(events)
+
+
+def relay_events(sink=None, batch_size=None, limit=None):
+    """
+    Envía por lotes al destino los eventos del outbox que aún no se han enviado, en orden.
+    Varios procesos pueden enviar a la vez: cada uno bloquea su lote y salta los bloqueados por otros.
+    :param sink: destino (ver get_sink). Por defecto el configurado en VPOS_OUTBOX_SINK.
+    :param batch_size: eventos por lote. Por defecto VPOS_OUTBOX_BATCH_SIZE.
+    :param limit: número máximo de eventos a enviar en esta ejecución.
+    :return: número de eventos enviados
+    """
+    if sink is None:
+        sink = get_sink()
+    if batch_size is None:
+        batch_size = OUTBOX_BATCH_SIZE
+
+    relayed = 0
+    while limit is None or relayed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - relayed)
+        batch_relayed = _relay_batch(sink, size)
+        if not batch_relayed:
+            break
+        relayed += batch_relayed
+
+    if relayed:
+        dlprint(u"Enviados {0} eventos del outbox".format(relayed))
+    return relayed
+
+
+####################################################################
+## Retención de los eventos enviados
+def purge_relayed_events(retention_days=None):
+    """
+    Elimina los eventos enviados hace más de retention_days días (ver VPOSOutboxEvent.purge_relayed).
+    :param retention_days: por defecto VPOS_OUTBOX_RETENTION_DAYS. Con None no se elimina nada.
+    :return: número de eventos eliminados
+    """
+    if retention_days is None:
+        retention_days = OUTBOX_RETENTION_DAYS
+    if retention_days is None:
+        return 0
+    return VPOSOutboxEvent.purge_relayed(timezone.now() - datetime.timedelta(days=retention_days))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.fulfillment import run_fulfillment_jobs
+from djangovirtualpos.models import VirtualPointOfSale, VPOSPaymentOperation
+
+########################################################################################################################
+########################################################################################################################
+######################################## Consulta del estado de operaciones pendientes #################################
+########################################################################################################################
+########################################################################################################################
+
+# Tipos de TPV que permiten consultar el estado de una operación
+POLLABLE_VPOS_TYPES = ("redsys", "paypal", "paypalrest", "bitpay")
+
+# Sólo se consultan las operaciones pendientes con al menos estos minutos de antigüedad,
+# para no interferir con las notificaciones que están aún en camino
+POLL_AFTER_MINUTES = getattr(settings, "VPOS_POLL_AFTER_MINUTES", 30)
+
+# Número de operaciones de un mismo TPV que se consultan en cada lote
+POLL_BATCH_SIZE = getattr(settings, "VPOS_POLL_BATCH_SIZE", 100)
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+####################################################################
+## Actualización en bloque de los estados
+def _update_statuses(operation_ids_by_status, now, sale_model):
+    """
+    Actualiza el estado de las operaciones con un UPDATE por estado.
+    Sólo se modifican las que siguen pendientes (puede haber llegado la notificación mientras tanto).
+    En la misma transacción que las completa se crean los trabajos de confirmación de sus ventas.
+    :return: tupla (dict estado -> número de operaciones actualizadas, lista de ids de los trabajos creados)
+    """
+    updated = {}
+    job_ids = []
+    for status, operation_ids in operation_ids_by_status.items():
+        updated[status] = 0
+        for operation_ids_chunk in _chunks(operation_ids, POLL_BATCH_SIZE):
+            operations, jobs = VPOSPaymentOperation._bulk_update_status(operation_ids_chunk, "pending", status,
+                                                                        now=now, sale_model=sale_model)
+            updated[status] += len(operations)
+            job_ids += [job.id for job in jobs]
+    return updated, job_ids
+
+
+def _confirm_sales(job_ids):
+    """
+    Confirma (online_confirm) las ventas de las operaciones completadas ejecutando sus trabajos de confirmación.
+    Cada venta se confirma en su propia transacción: si una falla, su trabajo se reintenta más adelante
+    (comando vpos_run_fulfillment_jobs) y se sigue con las demás.
+    """
+    if job_ids:
+        return run_fulfillment_jobs(job_ids=job_ids)
+    return {"done": 0, "retried": 0, "failed": 0}
+
+
+####################################################################
+## Consulta del estado de las operaciones pendientes
+def query_pending_operations(sale_model, virtualpos_types=None, older_than=None, limit=None):
+    """
+    Consulta en la pasarela el estado de las operaciones pendientes (p.ej. porque no ha llegado la notificación)
+    y actualiza en bloque las que ya no lo están.
+    Las operaciones se agrupan por TPV y cada TPV las consulta en paralelo por lotes de POLL_BATCH_SIZE.
+    :param sale_model: modelo de venta de la aplicación. Las ventas de las operaciones completadas se confirman
+                       (online_confirm) con trabajos VPOSFulfillmentJob que se crean en la misma transacción
+                       que el cambio de estado y se ejecutan a continuación. Los que fallan se reintentan
+                       con el comando vpos_run_fulfillment_jobs.
+    :param virtualpos_types: tipos de TPV a consultar. Por defecto todos los que lo permiten.
+    :param older_than: datetime. Sólo se consultan las operaciones creadas antes. Por defecto hace POLL_AFTER_MINUTES.
+    :param limit: número máximo de operaciones a consultar.
+    :return: dict estado -> número de operaciones actualizadas
+    """
+    # Sin modelo de venta las operaciones se completarían sin confirmar nunca su venta
+    if sale_model is None:
+        raise ValueError(u"Hay que indicar el modelo de venta")
+    if virtualpos_types is None:
+        virtualpos_types = POLLABLE_VPOS_TYPES
+    now = timezone.now()
+    if older_than is None:
+        older_than = now - datetime.timedelta(minutes=POLL_AFTER_MINUTES)
+
+    pending_operations = VPOSPaymentOperation.objects.defer("confirmation_data").filter(
+        status="pending",
+        type__in=virtualpos_types,
+        creation_datetime__lt=older_than
+    ).order_by("creation_datetime")
+    if limit is not None:
+        pending_operations = pending_operations[:limit]
+
+    operations_by_vpos = {}
+    for operation in pending_operations:
+        operations_by_vpos.setdefault(operation.virtual_point_of_sale_id, []).append(operation)
+
+    operation_ids_by_status = {}
+    for vpos_id, operations in operations_by_vpos.items():
+        try:
+            vpos = VirtualPointOfSale.get(id=vpos_id)
+        except ValueError as e:
+            # El TPV no tiene configuración específica, no se puede consultar
+            dlprint(u"No se puede consultar el estado de las operaciones del TPV {0}: {1}".format(vpos_id, e))
+            continue
+        for operations_chunk in _chunks(operations, POLL_BATCH_SIZE):
+            statuses = vpos.query_status(operations_chunk)
+            for operation in operations_chunk:
+                status = statuses.get(operation.id)
+                if status is None:
+                    continue
+                operation_ids_by_status.setdefault(status, []).append(operation.id)
+
+    updated, job_ids = _update_statuses(operation_ids_by_status, now, sale_model)
+    dlprint(u"Estado de operaciones pendientes consultado: {0}".format(updated))
+
+    fulfilled = _confirm_sales(job_ids)
+    dlprint(u"Ventas confirmadas: {0}".format(fulfilled))
+
+    return updated
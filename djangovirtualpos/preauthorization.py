@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VirtualPointOfSale, VPOSPaymentOperation, \
+    PREAUTHORIZATION_CONFIRMATION_TRANSACTION_TYPE, PREAUTHORIZATION_CANCELLATION_TRANSACTION_TYPE
+from djangovirtualpos.util import RateLimiter
+
+########################################################################################################################
+########################################################################################################################
+############################### Confirmación y anulación en bloque de pre-autorizaciones ###############################
+########################################################################################################################
+########################################################################################################################
+
+# Tipos de TPV que dejan operaciones en estado "authorized" para confirmarlas o anularlas más adelante:
+# Redsys (pre-autorización diferida) y Santander Elavon (liquidación diferida)
+PREAUTHORIZATION_VPOS_TYPES = ("redsys", "santanderelavon")
+
+# Número máximo de peticiones simultáneas a la pasarela
+PREAUTHORIZATION_WORKERS = getattr(settings, "VPOS_PREAUTHORIZATION_WORKERS", 5)
+
+# Número máximo de peticiones por segundo a la pasarela (None para no limitar)
+PREAUTHORIZATION_RATE = getattr(settings, "VPOS_PREAUTHORIZATION_RATE", 10)
+
+# Número de operaciones que se envían antes de guardar sus resultados
+PREAUTHORIZATION_BATCH_SIZE = getattr(settings, "VPOS_PREAUTHORIZATION_BATCH_SIZE", 50)
+
+
+def _settle_preauthorizations(operations, transaction_type, accepted_status, workers, rate, batch_size):
+    """
+    Confirma o anula por lotes las pre-autorizaciones del queryset.
+    Tras cada lote se guardan los resultados con un UPDATE por estado:
+    - Aceptadas por la pasarela: pasan a accepted_status.
+    - Rechazadas por la pasarela: pasan a "failed".
+    - Sin respuesta válida (error de red, respuesta no reconocida): siguen en "authorized" y se reintentan
+      en la siguiente ejecución.
+    Como sólo se tratan operaciones en estado "authorized", si el proceso se interrumpe basta con volver
+    a lanzarlo: las operaciones de los lotes ya guardados no se vuelven a enviar.
+    :return: dict con el número de operaciones aceptadas ("accepted"), rechazadas ("rejected") y con error ("errors")
+    """
+    if workers is None:
+        workers = PREAUTHORIZATION_WORKERS
+    if rate is None:
+        rate = PREAUTHORIZATION_RATE
+    if batch_size is None:
+        batch_size = PREAUTHORIZATION_BATCH_SIZE
+
+    rate_limiter = RateLimiter(rate)
+    authorized_operations = operations.filter(status="authorized", type__in=PREAUTHORIZATION_VPOS_TYPES).defer("confirmation_data")
+    vpos_by_id = {}
+    result = {"accepted": 0, "rejected": 0, "errors": 0}
+
+    last_id = 0
+    while True:
+        operations_batch = list(authorized_operations.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not operations_batch:
+            break
+        last_id = operations_batch[-1].id
+
+        operations_by_vpos = {}
+        for operation in operations_batch:
+            operations_by_vpos.setdefault(operation.virtual_point_of_sale_id, []).append(operation)
+
+        accepted_ids = []
+        rejected_ids = []
+        for vpos_id, vpos_operations in operations_by_vpos.items():
+            if vpos_id not in vpos_by_id:
+                vpos_by_id[vpos_id] = VirtualPointOfSale.get(id=vpos_id)
+            settled = vpos_by_id[vpos_id].delegated.settle_preauthorizations(
+                vpos_operations, transaction_type, workers=workers, rate_limiter=rate_limiter)
+            for operation_id, accepted in settled.items():
+                if accepted is True:
+                    accepted_ids.append(operation_id)
+                elif accepted is False:
+                    rejected_ids.append(operation_id)
+                else:
+                    result["errors"] += 1
+
+        now = timezone.now()
+        if accepted_ids:
+            result["accepted"] += VPOSPaymentOperation.bulk_update_status(accepted_ids, "authorized",
+                                                                          accepted_status, now=now)
+        if rejected_ids:
+            result["rejected"] += VPOSPaymentOperation.bulk_update_status(rejected_ids, "authorized", "failed",
+                                                                          now=now)
+
+        dlprint(u"Lote de pre-autorizaciones hasta la operación {0}: {1}".format(last_id, result))
+
+    return result
+
+
+####################################################################
+## Confirmación (captura) de pre-autorizaciones
+def capture_preauthorizations(operations, workers=None, rate=None, batch_size=None):
+    """
+    Confirma (captura) en bloque las pre-autorizaciones retenidas (estado "authorized") del queryset.
+    En Santander Elavon se envía la operación "settle" de las autorizaciones con liquidación diferida.
+    Las operaciones capturadas pasan a estado "completed".
+    :param operations: queryset de VPOSPaymentOperation.
+    :param workers: número máximo de peticiones simultáneas. Por defecto VPOS_PREAUTHORIZATION_WORKERS.
+    :param rate: número máximo de peticiones por segundo. Por defecto VPOS_PREAUTHORIZATION_RATE.
+    :param batch_size: operaciones enviadas antes de guardar resultados. Por defecto VPOS_PREAUTHORIZATION_BATCH_SIZE.
+    :return: dict con el número de operaciones aceptadas, rechazadas y con error
+    """
+    return _settle_preauthorizations(operations, PREAUTHORIZATION_CONFIRMATION_TRANSACTION_TYPE, "completed",
+                                     workers, rate, batch_size)
+
+
+####################################################################
+## Anulación (liberación) de pre-autorizaciones
+def release_preauthorizations(operations, workers=None, rate=None, batch_size=None):
+    """
+    Anula (libera el importe retenido) en bloque las pre-autorizaciones (estado "authorized") del queryset.
+    En Santander Elavon se envía la operación "void". Las operaciones liberadas pasan a estado "released". Parámetros como en capture_preauthorizations.
+    """
+    return _settle_preauthorizations(operations, PREAUTHORIZATION_CANCELLATION_TRANSACTION_TYPE, "released",
+                                     workers, rate, batch_size)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VirtualPointOfSale
+from djangovirtualpos.util import get_form_data_cache, PREFETCH_VPOS_TYPES
+
+########################################################################################################################
+########################################################################################################################
+########################### Creación anticipada del número de operación (PayPal, Bitpay) ###############################
+########################################################################################################################
+########################################################################################################################
+
+# En PayPal (SetExpressCheckout) y Bitpay (creación del invoice) el número de operación lo da la pasarela,
+# y esa petición retrasa la respuesta al pulsar "Pagar". Con VPOS_PREFETCH_TYPES la aplicación puede pedirlo
+# al mostrar el carrito: se pide en segundo plano y se guarda en caché asociado a los datos del pago. Si el usuario
+# paga sin cambios, VirtualPointOfSale.setupPayment lo usa sin llamar a la pasarela. Los que no se usan
+# simplemente caducan en la caché (y en la pasarela), sin escribir nada en BD.
+
+# Segundos durante los que se puede usar un número de operación creado de antemano.
+# Nunca más que la caducidad del propio invoice de Bitpay.
+PREFETCH_TTL = getattr(settings, "VPOS_PREFETCH_TTL", 600)
+
+# Número máximo de peticiones simultáneas en segundo plano
+PREFETCH_WORKERS = getattr(settings, "VPOS_PREFETCH_WORKERS", 4)
+
+# Margen (en segundos) respecto a la caducidad del invoice para que el usuario tenga tiempo de pagar
+PREFETCH_EXPIRATION_MARGIN = 120
+
+_prefetch_pool = None
+_prefetch_pool_lock = threading.Lock()
+
+
+def _get_prefetch_pool():
+    """Pool de hilos compartido por todo el proceso para las peticiones en segundo plano."""
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        with _prefetch_pool_lock:
+            if _prefetch_pool is None:
+                _prefetch_pool = ThreadPool(processes=PREFETCH_WORKERS)
+    return _prefetch_pool
+
+
+def _create_operation_number(vpos, cache_key):
+    """
+    Pide a la pasarela el número de operación y lo guarda en caché. Se ejecuta en un hilo en segundo plano:
+    el TPV ya está configurado en memoria y no se accede a la BD.
+    """
+    cache = get_form_data_cache()
+    try:
+        operation_number = vpos.delegated.setupPayment()
+    except Exception as e:
+        dlprint(u"Error creando de antemano el número de operación de la venta {0}: {1}".format(
+            vpos.operation.sale_code, e))
+        cache.delete(cache_key + ":lock")
+        return
+
+    expiration_datetime = vpos.operation.expiration_datetime
+    timeout = PREFETCH_TTL
+    if expiration_datetime is not None:
+        timeout = min(timeout, int((expiration_datetime - timezone.now()).total_seconds()) - PREFETCH_EXPIRATION_MARGIN)
+    if timeout > 0:
+        cache.set(cache_key, (operation_number, expiration_datetime), timeout)
+    cache.delete(cache_key + ":lock")
+
+
+####################################################################
+## Creación anticipada del número de operación de un pago
+def prefetch_operation_number(vpos_id, amount, description, url_ok, url_nok, sale_code):
+    """
+    Empieza a crear en segundo plano el número de operación (token de la pasarela) del pago y vuelve sin esperar.
+    Se ha de llamar con los mismos datos que se pasarán después a configurePayment (ver views.prefetch_payment).
+    :return: True si se ha lanzado la petición, False si el tipo de TPV no está en VPOS_PREFETCH_TYPES
+             o ya hay un número de operación (o una petición en curso) para este pago.
+    """
+    cache = get_form_data_cache()
+    if cache is None:
+        return False
+    vpos = VirtualPointOfSale.get(id=vpos_id, is_erased=False)
+    if vpos.type not in PREFETCH_VPOS_TYPES or not vpos.delegated.prefetch_operation_number:
+        return False
+
+    vpos.configurePayment(amount=amount, description=description, url_ok=url_ok, url_nok=url_nok,
+                          sale_code=sale_code)
+    cache_key = vpos._prefetched_operation_number_cache_key()
+    if cache.get(cache_key) is not None or not cache.add(cache_key + ":lock", 1, PREFETCH_TTL):
+        return False
+
+    _get_prefetch_pool().apply_async(_create_operation_number, (vpos, cache_key))
+    return True
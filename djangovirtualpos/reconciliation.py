@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import csv
+import multiprocessing
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connections
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSPaymentOperation
+from djangovirtualpos.money import Money, MINOR_UNIT_FACTORS
+
+########################################################################################################################
+########################################################################################################################
+######################################## Conciliación de ficheros de liquidación #######################################
+########################################################################################################################
+########################################################################################################################
+
+# Número de líneas del fichero que se comprueban con una única consulta "IN"
+SETTLEMENT_BATCH_SIZE = getattr(settings, "VPOS_SETTLEMENT_BATCH_SIZE", 1000)
+
+# Estados de las operaciones que deberían aparecer en un fichero de liquidación del banco
+SETTLED_STATUSES = ("completed", "partially_refunded", "completely_refunded")
+
+## Formatos de los ficheros de liquidación (exportación CSV) de cada pasarela.
+## Las columnas se indican por su posición (empezando en 0) para no depender de
+## la codificación de las cabeceras. Se pueden sobrescribir con el setting VPOS_SETTLEMENT_FORMATS.
+SETTLEMENT_FORMATS = {
+    "redsys": {
+        "delimiter": ";",
+        "encoding": "latin-1",
+        "header_lines": 1,
+        # Número de pedido (Ds_Order)
+        "operation_number": 3,
+        # Código de autorización
+        "confirmation_code": 4,
+        # Importe con coma decimal: "12,50"
+        "amount": 5,
+        "decimal_separator": ",",
+        "amount_in_minor_units": False,
+    },
+    "ceca": {
+        "delimiter": ";",
+        "encoding": "latin-1",
+        "header_lines": 1,
+        # Num_operacion
+        "operation_number": 2,
+        # Referencia
+        "confirmation_code": 3,
+        # Importe en unidades mínimas de la moneda (céntimos), como en el formulario de pago
+        "amount": 4,
+        "decimal_separator": ",",
+        "amount_in_minor_units": True,
+    },
+}
+SETTLEMENT_FORMATS.update(getattr(settings, "VPOS_SETTLEMENT_FORMATS", {}))
+
+
+####################################################################
+## Resultado de la conciliación de uno o varios ficheros
+class ReconciliationReport(object):
+    """
+    Resultado de conciliar uno o varios ficheros de liquidación con las operaciones de pago.
+
+    - unmatched: líneas del fichero que no se corresponden con ninguna operación.
+    - amount_mismatches: líneas cuya operación existe pero con un importe distinto.
+    - duplicates: líneas de una operación que ya ha aparecido antes en el mismo fichero.
+    - missing: operaciones liquidables que no aparecen en ningún fichero.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.matched = 0
+        self.unmatched = []
+        self.amount_mismatches = []
+        self.duplicates = []
+        self.missing = []
+        # Números de operación encontrados, sólo se mantienen si se van a buscar las operaciones ausentes
+        self.matched_operation_numbers = set()
+
+    def merge(self, other):
+        self.lines += other.lines
+        self.matched += other.matched
+        self.unmatched.extend(other.unmatched)
+        self.amount_mismatches.extend(other.amount_mismatches)
+        self.duplicates.extend(other.duplicates)
+        self.missing.extend(other.missing)
+        self.matched_operation_numbers.update(other.matched_operation_numbers)
+        return self
+
+    @property
+    def is_clean(self):
+        return not self.unmatched and not self.amount_mismatches and not self.duplicates and not self.missing
+
+    def as_dict(self):
+        return {
+            "lines": self.lines,
+            "matched": self.matched,
+            "unmatched": self.unmatched,
+            "amount_mismatches": self.amount_mismatches,
+            "duplicates": self.duplicates,
+            "missing": self.missing,
+        }
+
+
+####################################################################
+## Lectura en streaming de un fichero de liquidación
+def _parse_amount(raw_amount, settlement_format):
+    """
+    Convierte el importe del fichero en un Decimal, tal cual (en unidades mínimas si el formato las usa).
+    Se pasa a la moneda de la operación al conciliar (ver _amount_minor_units).
+    :return: Decimal | None si el importe no es válido
+    """
+    raw_amount = raw_amount.strip().replace(" ", "")
+    separator = settlement_format["decimal_separator"]
+    if separator == ",":
+        raw_amount = raw_amount.replace(".", "").replace(",", ".")
+    else:
+        raw_amount = raw_amount.replace(",", "")
+    try:
+        amount = Decimal(raw_amount)
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return amount
+
+
+def _amount_minor_units(amount, currency, settlement_format):
+    """
+    Importe de una línea del fichero en unidades mínimas de la moneda de la operación (p.ej. 1.255 KWD -> 1255).
+    :return: int | None si el importe no es válido o tiene más decimales que la moneda
+    """
+    if amount is None:
+        return None
+    if not settlement_format["amount_in_minor_units"]:
+        amount = amount * MINOR_UNIT_FACTORS[currency]
+    if amount != amount.to_integral_value():
+        return None
+    return int(amount)
+
+
+def iter_settlement_lines(path, settlement_format):
+    """
+    Generador que lee el fichero línea a línea (nunca se carga entero en memoria).
+    Devuelve tuplas (número de línea, número de operación, código de confirmación, importe).
+    """
+    encoding = settlement_format["encoding"]
+    header_lines = settlement_format["header_lines"]
+    operation_number_column = settlement_format["operation_number"]
+    confirmation_code_column = settlement_format["confirmation_code"]
+    amount_column = settlement_format["amount"]
+
+    with open(path, "rb") as settlement_file:
+        reader = csv.reader(settlement_file, delimiter=str(settlement_format["delimiter"]))
+        for line_number, row in enumerate(reader, start=1):
+            if line_number <= header_lines or not row:
+                continue
+            try:
+                operation_number = row[operation_number_column].decode(encoding).strip()
+                confirmation_code = row[confirmation_code_column].decode(encoding).strip()
+                amount = _parse_amount(row[amount_column].decode(encoding), settlement_format)
+            except IndexError:
+                operation_number = confirmation_code = amount = None
+            yield line_number, operation_number, confirmation_code, amount
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+####################################################################
+## Conciliación de un fichero
+def reconcile_file(path, vpos_type, keep_matched=False):
+    """
+    Concilia un fichero de liquidación con las operaciones de pago.
+    Las líneas se comprueban por lotes de SETTLEMENT_BATCH_SIZE con una única consulta "IN" por lote
+    (nunca una consulta por línea).
+    :param path: ruta del fichero CSV.
+    :param vpos_type: tipo de TPV del fichero ("redsys", "ceca").
+    :param keep_matched: mantiene los números de operación encontrados (necesario para buscar operaciones ausentes).
+    :return: ReconciliationReport
+    """
+    try:
+        settlement_format = SETTLEMENT_FORMATS[vpos_type]
+    except KeyError:
+        raise ValueError(u"No existe formato de fichero de liquidación para el TPV {0}".format(vpos_type))
+
+    report = ReconciliationReport()
+    operations = VPOSPaymentOperation.objects.filter(type=vpos_type)
+    # Operaciones que ya han aparecido en el fichero, para señalar las líneas repetidas
+    seen_operation_numbers = set()
+
+    for chunk in _chunks(iter_settlement_lines(path, settlement_format), SETTLEMENT_BATCH_SIZE):
+        report.lines += len(chunk)
+
+        # Se busca por número de operación y, si la línea no lo trae, por código de confirmación
+        operation_numbers = [line[1] for line in chunk if line[1]]
+        confirmation_codes = [line[2] for line in chunk if not line[1] and line[2]]
+
+        by_operation_number = {}
+        by_confirmation_code = {}
+        if operation_numbers:
+            for operation_number, confirmation_code, amount_minor, currency in operations.filter(
+                    operation_number__in=operation_numbers).values_list("operation_number", "confirmation_code",
+                                                                        "amount_minor", "currency"):
+                by_operation_number[operation_number] = (operation_number, amount_minor, currency)
+        if confirmation_codes:
+            for operation_number, confirmation_code, amount_minor, currency in operations.filter(
+                    confirmation_code__in=confirmation_codes).values_list("operation_number", "confirmation_code",
+                                                                          "amount_minor", "currency"):
+                by_confirmation_code[confirmation_code] = (operation_number, amount_minor, currency)
+
+        for line_number, operation_number, confirmation_code, amount in chunk:
+            if operation_number:
+                stored = by_operation_number.get(operation_number)
+            else:
+                stored = by_confirmation_code.get(confirmation_code)
+
+            if stored is None:
+                report.unmatched.append((path, line_number, operation_number or confirmation_code))
+                continue
+
+            stored_operation_number, stored_amount_minor, currency = stored
+            if stored_operation_number in seen_operation_numbers:
+                report.duplicates.append((path, line_number, stored_operation_number))
+                continue
+            seen_operation_numbers.add(stored_operation_number)
+
+            # Los importes se comparan como enteros en unidades mínimas de la moneda de la operación
+            amount_minor = _amount_minor_units(amount, currency, settlement_format)
+            if amount_minor is None or amount_minor != stored_amount_minor:
+                file_amount = amount if amount_minor is None else Money(amount_minor, currency).amount
+                report.amount_mismatches.append((path, line_number, stored_operation_number, file_amount,
+                                                 Money(stored_amount_minor, currency).amount))
+            else:
+                report.matched += 1
+
+    if keep_matched:
+        report.matched_operation_numbers = seen_operation_numbers
+
+    dlprint(u"Fichero de liquidación {0} conciliado: {1} líneas, {2} correctas".format(
+        path, report.lines, report.matched))
+    return report
+
+
+####################################################################
+## Operaciones que no aparecen en los ficheros
+def find_missing_operations(report, vpos_type, date_from, date_to):
+    """
+    Recorre (con un único range scan) las operaciones liquidables del periodo y anota en el informe
+    las que no aparecen en ninguno de los ficheros conciliados.
+    """
+    settled_operations = VPOSPaymentOperation.objects.filter(
+        type=vpos_type,
+        status__in=SETTLED_STATUSES,
+        creation_datetime__gte=date_from,
+        creation_datetime__lt=date_to
+    ).values_list("operation_number", flat=True)
+
+    for operation_number in settled_operations.iterator():
+        if operation_number not in report.matched_operation_numbers:
+            report.missing.append(operation_number)
+
+    return report
+
+
+def _reconcile_file_worker(args):
+    path, vpos_type, keep_matched = args
+    try:
+        return reconcile_file(path, vpos_type, keep_matched=keep_matched)
+    finally:
+        connections.close_all()
+
+
+####################################################################
+## Conciliación de varios ficheros en paralelo
+def reconcile_files(paths, vpos_type, date_from=None, date_to=None, workers=None):
+    """
+    Concilia varios ficheros de liquidación en paralelo usando un pool de procesos.
+    Si se indica un periodo (date_from, date_to) también se informa de las operaciones ausentes.
+    :return: ReconciliationReport con el resultado conjunto de todos los ficheros.
+    """
+    keep_matched = date_from is not None and date_to is not None
+    tasks = [(path, vpos_type, keep_matched) for path in paths]
+
+    if workers is None:
+        workers = min(len(paths), multiprocessing.cpu_count())
+
+    if workers > 1 and len(paths) > 1:
+        # Las conexiones a BD no se pueden compartir entre procesos: se cierran antes de crear
+        # el pool para que cada proceso hijo abra la suya
+        connections.close_all()
+        pool = multiprocessing.Pool(processes=workers)
+        try:
+            reports = pool.map(_reconcile_file_worker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        reports = [reconcile_file(*task) for task in tasks]
+
+    report = ReconciliationReport()
+    for file_report in reports:
+        report.merge(file_report)
+
+    if keep_matched:
+        find_missing_operations(report, vpos_type, date_from, date_to)
+
+    return report
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSPaymentOperation, VPOSOutboxEvent
+from djangovirtualpos.models.redsys import AUTHORIZATION_TYPE, _normalize_terminal
+from djangovirtualpos.money import Money, CURRENCIES
+from djangovirtualpos.polling import _confirm_sales
+from djangovirtualpos.util import RateLimiter
+
+########################################################################################################################
+########################################################################################################################
+############################### Cobro en bloque de pagos por referencia de Redsys (MIT) ################################
+########################################################################################################################
+########################################################################################################################
+
+# Número máximo de peticiones simultáneas a Redsys
+REFERENCE_PAYMENT_WORKERS = getattr(settings, "VPOS_REFERENCE_PAYMENT_WORKERS", 5)
+
+# Número máximo de peticiones por segundo a Redsys desde cada terminal (None para no limitar)
+REFERENCE_PAYMENT_RATE = getattr(settings, "VPOS_REFERENCE_PAYMENT_RATE", 10)
+
+# Número de cobros que se crean y se envían antes de guardar sus resultados
+REFERENCE_PAYMENT_BATCH_SIZE = getattr(settings, "VPOS_REFERENCE_PAYMENT_BATCH_SIZE", 100)
+
+# (código de comercio, terminal, peticiones por segundo) -> RateLimiter.
+# Se comparten en todo el proceso, así varios TPVs configurados con el mismo terminal no suman sus límites.
+_terminal_rate_limiters = {}
+_terminal_rate_limiters_lock = threading.Lock()
+
+
+def get_terminal_rate_limiter(merchant_code, terminal_id, rate):
+    key = (merchant_code, _normalize_terminal(terminal_id), rate)
+    with _terminal_rate_limiters_lock:
+        if key not in _terminal_rate_limiters:
+            _terminal_rate_limiters[key] = RateLimiter(rate)
+        return _terminal_rate_limiters[key]
+
+
+####################################################################
+## Creación en bloque de las operaciones
+def _create_operations(vpos, items, now):
+    """
+    Crea con un único INSERT las operaciones pendientes de los cobros que aún no tienen operación en el TPV.
+    :param items: lista de tuplas (código de venta, referencia, importe, descripción).
+    :return: tupla (lista de tuplas (operación, referencia), lista de códigos de venta que ya tenían operación
+             o están repetidos)
+    """
+    sale_codes = [item[0] for item in items]
+    existing_sale_codes = set(VPOSPaymentOperation.objects.filter(
+        virtual_point_of_sale_id=vpos.id, sale_code__in=sale_codes).values_list("sale_code", flat=True))
+
+    currency = vpos.delegated.currency if vpos.delegated.currency in CURRENCIES else "EUR"
+    operations = []
+    references = {}
+    skipped_sale_codes = []
+    for sale_code, reference_number, amount, description in items:
+        if sale_code in existing_sale_codes or sale_code in references:
+            skipped_sale_codes.append(sale_code)
+            continue
+        money = Money.from_amount(amount, currency)
+        if money.minor_units <= 0:
+            raise ValueError(u"La cantidad del cobro {0} debe ser un número positivo".format(sale_code))
+        references[sale_code] = reference_number
+        operations.append(VPOSPaymentOperation(
+            amount=money.amount, amount_minor=money.minor_units, currency=currency,
+            description=description or sale_code, url_ok="", url_nok="", sale_code=sale_code, status="pending",
+            virtual_point_of_sale=vpos, type=vpos.type, environment=vpos.environment,
+            creation_datetime=now, last_update_datetime=now
+        ))
+    if not operations:
+        return [], skipped_sale_codes
+
+    # Números de operación únicos (también entre las operaciones archivadas),
+    # con una consulta por tabla e intento en vez de una por operación
+    pending_operations = operations
+    operation_numbers = set()
+    while pending_operations:
+        for operation in pending_operations:
+            operation.operation_number = vpos.delegated.setupPayment()
+        candidates = [operation.operation_number for operation in pending_operations]
+        taken = VPOSPaymentOperation.taken_operation_numbers(candidates)
+        accepted = []
+        for operation in pending_operations:
+            if operation.operation_number not in taken and operation.operation_number not in operation_numbers:
+                operation_numbers.add(operation.operation_number)
+                accepted.append(operation)
+        pending_operations = [operation for operation in pending_operations if operation not in accepted]
+
+    VPOSPaymentOperation.objects.bulk_create(operations)
+    # bulk_create sólo asigna los ids en PostgreSQL
+    operations = list(VPOSPaymentOperation.objects.defer("confirmation_data")
+                      .filter(operation_number__in=operation_numbers).order_by("id"))
+    VPOSOutboxEvent.objects.bulk_create([
+        VPOSOutboxEvent.build(operation, from_status=None, to_status="pending") for operation in operations
+    ])
+    return [(operation, references[operation.sale_code]) for operation in operations], skipped_sale_codes
+
+
+####################################################################
+## Guardado de los resultados de un lote
+def _save_results(operations_and_references, results, now, sale_model=None):
+    """
+    Guarda los datos de la respuesta de cada cobro y cambia el estado de las operaciones con un UPDATE por estado.
+    Las operaciones sin respuesta válida siguen pendientes. Si se indica el modelo de venta, se crean
+    los trabajos de confirmación de las ventas cobradas (ver VPOSPaymentOperation.bulk_update_status).
+    :return: tupla (dict estado -> lista de operaciones, lista de ids de los trabajos de confirmación creados)
+    """
+    operations_by_status = {"completed": [], "failed": [], "pending": []}
+    for operation, _reference_number in operations_and_references:
+        status, response_code, response_data = results[operation.id]
+        if response_data is not None:
+            VPOSPaymentOperation.objects.filter(id=operation.id).update(
+                confirmation_data=json.dumps(response_data, separators=(",", ":")),
+                confirmation_code=operation.operation_number, response_code=response_code, last_update_datetime=now)
+        operations_by_status[status or "pending"].append(operation)
+
+    job_ids = []
+    for status in ("completed", "failed"):
+        if operations_by_status[status]:
+            _operations, jobs = VPOSPaymentOperation._bulk_update_status(
+                [operation.id for operation in operations_by_status[status]], "pending", status, now=now,
+                sale_model=sale_model)
+            job_ids += [job.id for job in jobs]
+    return operations_by_status, job_ids
+
+
+####################################################################
+## Cobro en bloque de pagos por referencia
+def charge_references(vpos, items, sale_model=None, workers=None, rate=None, batch_size=None):
+    """
+    Cobra por lotes pagos por referencia (MIT, sin el titular presente) en un TPV Redsys.
+    En cada lote se crean las operaciones con un único INSERT, se envían los cobros en paralelo (respetando
+    el límite de peticiones por segundo del terminal) y se guardan los resultados antes de pasar al siguiente.
+    Los cobros que ya tienen operación en el TPV no se vuelven a enviar, así que si el proceso se interrumpe
+    basta con volver a lanzarlo con la misma lista. Las operaciones sin respuesta válida (error de red,
+    número de pedido repetido...) siguen pendientes y se resuelven con el comando vpos_query_status.
+    :param vpos: VirtualPointOfSale de tipo Redsys en modo autorización.
+    :param items: iterable de tuplas (código de venta, referencia, importe) o
+                  (código de venta, referencia, importe, descripción). Se consume por lotes.
+    :param sale_model: modelo de venta. Si se indica, se asigna el número de operación a las ventas
+                       y se confirman (online_confirm) las cobradas.
+    :param workers: número máximo de peticiones simultáneas. Por defecto VPOS_REFERENCE_PAYMENT_WORKERS.
+    :param rate: número máximo de peticiones por segundo del terminal. Por defecto VPOS_REFERENCE_PAYMENT_RATE.
+    :param batch_size: cobros por lote. Por defecto VPOS_REFERENCE_PAYMENT_BATCH_SIZE.
+    :return: generador de dicts con "sale_code", "operation_number" (None si no se ha creado la operación),
+             "status" ("completed", "failed", "pending" o "skipped" si ya tenía operación o está repetido)
+             y "response_code",
+             en cuanto se guarda cada lote.
+    """
+    if vpos.type != "redsys" or vpos.delegated.operative_type != AUTHORIZATION_TYPE:
+        raise ValueError(u"Los cobros por referencia en bloque sólo se admiten en TPVs Redsys en modo autorización")
+    if workers is None:
+        workers = REFERENCE_PAYMENT_WORKERS
+    if rate is None:
+        rate = REFERENCE_PAYMENT_RATE
+    if batch_size is None:
+        batch_size = REFERENCE_PAYMENT_BATCH_SIZE
+
+    rate_limiter = get_terminal_rate_limiter(vpos.delegated.merchant_code, vpos.delegated.terminal_id, rate)
+    items = iter(items)
+    totals = {"completed": 0, "failed": 0, "pending": 0, "skipped": 0}
+
+    while True:
+        batch = [tuple(item) + (None,) * (4 - len(item)) for item in itertools.islice(items, batch_size)]
+        if not batch:
+            break
+
+        with transaction.atomic():
+            operations_and_references, skipped_sale_codes = _create_operations(vpos, batch, timezone.now())
+            if sale_model is not None:
+                for operation, _reference_number in operations_and_references:
+                    sale_model.objects.filter(code=operation.sale_code, status="pending")\
+                        .update(operation_number=operation.operation_number)
+
+        results = {}
+        if operations_and_references:
+            results = vpos.delegated.charge_references(operations_and_references, workers=workers,
+                                                       rate_limiter=rate_limiter)
+
+        with transaction.atomic():
+            operations_by_status, job_ids = _save_results(operations_and_references, results, timezone.now(),
+                                                          sale_model=sale_model)
+        _confirm_sales(job_ids)
+
+        for sale_code in skipped_sale_codes:
+            totals["skipped"] += 1
+            yield {"sale_code": sale_code, "operation_number": None, "status": "skipped", "response_code": None}
+        for operation, _reference_number in operations_and_references:
+            status, response_code, _response_data = results[operation.id]
+            totals[status or "pending"] += 1
+            yield {"sale_code": operation.sale_code, "operation_number": operation.operation_number,
+                   "status": status or "pending", "response_code": response_code}
+
+        dlprint(u"Lote de pagos por referencia: {0}".format(totals))
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import multiprocessing
+import traceback
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.models import VPOSSpooledNotification, VPOSNotification, VPOSOperationAlreadyConfirmed, \
+    VPOSNotificationIgnored
+from djangovirtualpos.util import sniff_body_format
+
+########################################################################################################################
+########################################################################################################################
+########################################## Recepción diferida de notificaciones ########################################
+########################################################################################################################
+########################################################################################################################
+
+# Tipos de TPV cuyas notificaciones se guardan en VPOSSpooledNotification y se responden en el acto
+# (p.ej. ("redsys", "bitpay")). Por defecto se procesan todas en la propia petición.
+SPOOLED_NOTIFICATION_TYPES = getattr(settings, "VPOS_SPOOLED_NOTIFICATION_TYPES", ())
+
+# Número máximo de intentos de cada notificación antes de marcarla como fallida
+SPOOL_MAX_ATTEMPTS = getattr(settings, "VPOS_SPOOL_MAX_ATTEMPTS", 5)
+
+# Espera (en segundos) antes del primer reintento. Se duplica en cada intento.
+SPOOL_RETRY_DELAY = getattr(settings, "VPOS_SPOOL_RETRY_DELAY", 30)
+
+# Respuesta inmediata a la pasarela. Sólo se pueden diferir las notificaciones cuya respuesta no depende
+# del resultado: las HTTP POST de Redsys (respuesta vacía) y los IPN de Bitpay. Las notificaciones SOAP de Redsys
+# necesitan una respuesta firmada con el resultado, así que se siguen procesando en la propia petición.
+SPOOL_ACKNOWLEDGEMENTS = {
+    "redsys": ("form", ""),
+    "bitpay": ("json", "OK"),
+}
+
+
+####################################################################
+## Recepción
+def is_spooled(virtualpos_type, body):
+    """
+    Indica si la notificación se guarda para procesarla más tarde.
+    """
+    if virtualpos_type not in SPOOLED_NOTIFICATION_TYPES or virtualpos_type not in SPOOL_ACKNOWLEDGEMENTS:
+        return False
+    body_format, _response = SPOOL_ACKNOWLEDGEMENTS[virtualpos_type]
+    return sniff_body_format(body) == body_format
+
+
+def acknowledge(virtualpos_type):
+    """
+    Respuesta a la pasarela de una notificación guardada.
+    """
+    _body_format, response = SPOOL_ACKNOWLEDGEMENTS[virtualpos_type]
+    return HttpResponse(response)
+
+
+####################################################################
+## Procesamiento
+def _claim_notification(now):
+    """
+    Bloquea y devuelve la siguiente notificación pendiente, en orden de llegada. Las bloqueadas por otros procesos
+    se saltan (SKIP LOCKED) si la BD lo permite, así varios procesos pueden vaciar la cola a la vez.
+    Hay que llamarla dentro de una transacción.
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    return VPOSSpooledNotification.objects.select_for_update(skip_locked=skip_locked)\
+        .filter(status="pending", next_attempt_datetime__lte=now).order_by("next_attempt_datetime", "id").first()
+
+
+def _process_notification(spooled, now):
+    """
+    Procesa una notificación guardada igual que lo haría la vista confirm_payment, en su propio savepoint.
+    Si falla se deshacen sus cambios y se reintenta más adelante, esperando cada vez el doble.
+    """
+    # Importación local: la vista usa este módulo para guardar las notificaciones
+    from djangovirtualpos.views import _confirm_payment
+
+    spooled.attempts += 1
+    notification = {"operation_number": None, "verified": None}
+    try:
+        with transaction.atomic():
+            _confirm_payment(spooled.build_request(), spooled.type, apps.get_model(spooled.sale_model),
+                             notification)
+    except (VPOSOperationAlreadyConfirmed, VPOSNotificationIgnored):
+        # Duplicado de una notificación ya procesada o notificación irrelevante
+        spooled.status = "done"
+        spooled.last_error = None
+    except Exception:
+        spooled.last_error = traceback.format_exc()
+        if spooled.attempts >= SPOOL_MAX_ATTEMPTS:
+            spooled.status = "failed"
+        else:
+            delay = SPOOL_RETRY_DELAY * 2 ** (spooled.attempts - 1)
+            spooled.next_attempt_datetime = now + datetime.timedelta(seconds=delay)
+        dlprint(u"Error procesando la notificación {0} (intento {1}): {2}".format(
+            spooled.id, spooled.attempts, spooled.last_error))
+    else:
+        spooled.status = "done"
+        spooled.last_error = None
+
+    if spooled.status != "pending":
+        spooled.processed_datetime = timezone.now()
+    spooled.save(update_fields=("status", "attempts", "last_error", "next_attempt_datetime", "processed_datetime"))
+
+    # Igual que en la vista, cada intento queda en el registro de notificaciones
+    VPOSNotification.record(spooled.type, bytes(spooled.body), spooled.received_datetime,
+                            operation_number=notification["operation_number"],
+                            verified=notification["verified"], remote_address=spooled.remote_address)
+
+
+def process_spooled_notifications(limit=None):
+    """
+    Procesa las notificaciones guardadas pendientes, en orden de llegada.
+    Igual que los trabajos de confirmación (ver djangovirtualpos.fulfillment.run_fulfillment_jobs), cada notificación
+    se bloquea y se procesa en su propia transacción, que se confirma antes de pasar a la siguiente: el bloqueo
+    dura lo que dura su procesamiento y un fallo sólo afecta a esa notificación.
+    :param limit: número máximo de notificaciones a procesar.
+    :return: dict con el número de notificaciones procesadas ("done"), a reintentar ("retried") y fallidas ("failed")
+    """
+    result = {"done": 0, "retried": 0, "failed": 0}
+    while limit is None or sum(result.values()) < limit:
+        with transaction.atomic():
+            now = timezone.now()
+            spooled = _claim_notification(now)
+            if spooled is None:
+                break
+            _process_notification(spooled, now)
+        result[spooled.status if spooled.status != "pending" else "retried"] += 1
+
+    return result
+
+
+def _spool_worker(limit):
+    try:
+        return process_spooled_notifications(limit=limit)
+    finally:
+        connections.close_all()
+
+
+def drain_spool(workers=1, limit=None):
+    """
+    Vacía la cola de notificaciones con un pool de procesos.
+    :param workers: número de procesos.
+    :param limit: número máximo de notificaciones a procesar por cada proceso.
+    :return: dict con el resultado conjunto de todos los procesos (ver process_spooled_notifications)
+    """
+    if workers <= 1:
+        return process_spooled_notifications(limit=limit)
+
+    # Las conexiones a BD no se pueden compartir entre procesos: se cierran antes de crear
+    # el pool para que cada proceso hijo abra la suya
+    connections.close_all()
+    pool = multiprocessing.Pool(processes=workers)
+    try:
+        results = pool.map(_spool_worker, [limit] * workers)
+    finally:
+        pool.close()
+        pool.join()
+
+    result = {"done": 0, "retried": 0, "failed": 0}
+    for worker_result in results:
+        for key, value in worker_result.items():
+            result[key] += value
+    return result
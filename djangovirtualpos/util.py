@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import hashlib
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from django.conf import settings
+from django.core.cache import caches
 from django.utils import timezone
 import pytz
 
@@ -38,6 +43,222 @@ def localize_datetime_from_format(str_datetime, datetime_format="%Y-%m-%d %H:%M"
     return localize_datetime(_datetime)
 
 
+########################################################################
+########################################################################
+# Conexiones HTTP con las pasarelas
+
+# Número máximo de conexiones abiertas con cada pasarela
+HTTP_POOL_SIZE = getattr(settings, "VPOS_HTTP_POOL_SIZE", 10)
+
+# Tiempo máximo (en segundos) de espera de las peticiones a las pasarelas
+HTTP_TIMEOUT = getattr(settings, "VPOS_HTTP_TIMEOUT", 30)
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Sesión HTTP compartida por todo el proceso. Reutiliza las conexiones (keep-alive) con las pasarelas
+    y admite hasta HTTP_POOL_SIZE peticiones simultáneas a una misma pasarela.
+    """
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                # requests sólo se importa cuando se necesita la primera conexión con una pasarela
+                import requests
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+
+class RateLimiter(object):
+    """
+    Limita el número de llamadas por segundo a una pasarela. Se puede compartir entre varios hilos.
+    """
+
+    def __init__(self, rate):
+        """
+        :param rate: número máximo de llamadas por segundo. None o 0 para no limitar.
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self._next_call = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Espera hasta que se pueda hacer la siguiente llamada."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def thread_map(function, items, workers=None):
+    """
+    Aplica la función a cada elemento usando un pool de hilos (pensado para peticiones HTTP).
+    Los hilos no deben acceder a la BD.
+    :return: lista de resultados en el mismo orden que items
+    """
+    items = list(items)
+    if workers is None:
+        workers = HTTP_POOL_SIZE
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return [function(item) for item in items]
+    pool = ThreadPool(processes=workers)
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+########################################################################
+########################################################################
+# Caché de los formularios de pago firmados
+
+# Alias (de settings.CACHES) de la caché de los formularios de pago. None para no cachearlos.
+FORM_DATA_CACHE = getattr(settings, "VPOS_FORM_DATA_CACHE", "default")
+
+# Segundos que una petición repetida espera a que la primera genere el formulario
+FORM_DATA_CACHE_WAIT = getattr(settings, "VPOS_FORM_DATA_CACHE_WAIT", 5)
+
+
+def get_form_data_cache():
+    """Caché de los formularios de pago o None si no se usa."""
+    if FORM_DATA_CACHE is None:
+        return None
+    return caches[FORM_DATA_CACHE]
+
+
+# Referencias de tarjeta (parámetro reference_number de set_payment_attributes) cuyos formularios se cachean:
+# sin referencia y pidiendo una nueva. Los formularios que cobran una referencia guardada no se cachean.
+FORM_DATA_CACHE_REFERENCE_NUMBERS = (False, "request")
+
+
+def form_data_cache_key(vpos_id, payment_code, reference_number=False):
+    """
+    Clave del formulario de pago de una venta en un TPV.
+    El id del TPV se normaliza a entero ("7" y 7 son la misma clave) y el código de venta se resume
+    para que la clave sea válida en cualquier backend (p.ej. memcached).
+    :param reference_number: uno de FORM_DATA_CACHE_REFERENCE_NUMBERS.
+    """
+    payment_code_hash = hashlib.sha1(u"{0}".format(payment_code).encode("utf-8")).hexdigest()
+    return "djangovirtualpos:form_data:{0}:{1}:{2}".format(int(vpos_id), payment_code_hash,
+                                                           reference_number or "none")
+
+
+def invalidate_form_data(vpos_ids_and_payment_codes):
+    """
+    Elimina de la caché los formularios de pago de las ventas indicadas.
+    :param vpos_ids_and_payment_codes: lista de tuplas (id del TPV, código de venta).
+    """
+    cache = get_form_data_cache()
+    if cache is None or not vpos_ids_and_payment_codes:
+        return
+    cache.delete_many([form_data_cache_key(vpos_id, payment_code, reference_number)
+                       for vpos_id, payment_code in vpos_ids_and_payment_codes
+                       for reference_number in FORM_DATA_CACHE_REFERENCE_NUMBERS])
+
+
+# Tipos de TPV cuyo número de operación (token de la pasarela) se crea de antemano, p.ej. ("paypal", "bitpay").
+# Se guarda en la caché de los formularios de pago (VPOS_FORM_DATA_CACHE).
+PREFETCH_VPOS_TYPES = getattr(settings, "VPOS_PREFETCH_TYPES", ())
+
+
+def prefetched_operation_number_cache_key(vpos_id, payment_inputs):
+    """
+    Clave del número de operación (token de la pasarela) creado de antemano para un pago (ver djangovirtualpos.prefetch).
+    :param payment_inputs: lista con los datos del pago que se envían a la pasarela (importe, URLs...).
+                           Si cambia cualquiera de ellos, el token creado de antemano no se usa.
+    """
+    payment_inputs_hash = hashlib.sha1(u"|".join(u"{0}".format(value) for value in payment_inputs)
+                                       .encode("utf-8")).hexdigest()
+    return "djangovirtualpos:prefetched_operation_number:{0}:{1}".format(vpos_id, payment_inputs_hash)
+
+
+########################################################################
+# Caché de la última referencia válida de cada cliente (ver VPOSCardToken)
+
+# Alias (de settings.CACHES) de la caché de las referencias de tarjeta. None para no cachearlas.
+CARD_TOKEN_CACHE = getattr(settings, "VPOS_CARD_TOKEN_CACHE", "default")
+
+# Segundos durante los que se reutiliza la última referencia válida de un cliente
+CARD_TOKEN_CACHE_TTL = getattr(settings, "VPOS_CARD_TOKEN_CACHE_TTL", 300)
+
+
+def get_card_token_cache():
+    """Caché de las referencias de tarjeta o None si no se usa."""
+    if CARD_TOKEN_CACHE is None:
+        return None
+    return caches[CARD_TOKEN_CACHE]
+
+
+def card_token_cache_key(customer_code, vpos_id=None):
+    """
+    Clave de la última referencia válida de un cliente en un TPV (o en cualquiera si vpos_id es None).
+    """
+    customer_code_hash = hashlib.sha1(u"{0}".format(customer_code).encode("utf-8")).hexdigest()
+    return "djangovirtualpos:card_token:{0}:{1}".format(vpos_id or "all", customer_code_hash)
+
+
+########################################################################
+# Cuerpo de las notificaciones de las pasarelas
+
+# Tamaño máximo (en bytes) del cuerpo de las notificaciones, por tipo de TPV ("default" para el resto).
+# Las notificaciones reales ocupan unos pocos KB.
+CONFIRMATION_MAX_BODY_SIZE = {
+    "default": 64 * 1024,
+}
+CONFIRMATION_MAX_BODY_SIZE.update(getattr(settings, "VPOS_CONFIRMATION_MAX_BODY_SIZE", {}))
+
+
+def get_confirmation_max_body_size(virtualpos_type):
+    return CONFIRMATION_MAX_BODY_SIZE.get(virtualpos_type, CONFIRMATION_MAX_BODY_SIZE["default"])
+
+
+def get_content_length(request):
+    """
+    Longitud del cuerpo de la petición según la cabecera Content-Length, sin leerlo.
+    :return: int | None si la cabecera no es válida
+    """
+    try:
+        content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except (ValueError, TypeError):
+        return None
+    if content_length < 0:
+        return None
+    return content_length
+
+
+def sniff_body_format(body):
+    """
+    Formato del cuerpo de una notificación a partir de sus primeros bytes, sin analizarlo:
+    "xml" (SOAP), "json" o "form" (application/x-www-form-urlencoded).
+    """
+    start = body[:64].lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+    if start == b"<":
+        return "xml"
+    if start in (b"{", b"["):
+        return "json"
+    return "form"
+
+
+def xml_parser_options():
+    """
+    Opciones de lxml para analizar XML recibido de fuera: sin entidades externas, sin red y sin árboles enormes.
+    """
+    return {"resolve_entities": False, "no_network": True, "huge_tree": False, "remove_comments": True}
+
+
 ########################################################################
 ########################################################################
 
@@ -2,17 +2,35 @@
 
 from __future__ import unicode_literals
 
+import time
+
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
-from django.http import Http404, HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, HttpResponseForbidden, HttpResponse
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from djangovirtualpos.models import VirtualPointOfSale, VPOSCantCharge, VPOSRedsys
+from djangovirtualpos.models import VirtualPointOfSale, VPOSCantCharge, VPOSRedsys, VPOSNotification, \
+    VPOSFulfillmentJob, VPOSSpooledNotification, VPOSCardToken, VPOSNotificationIgnored, get_pending_ttl
+from djangovirtualpos.debug import dlprint
+from djangovirtualpos.ipfilter import is_allowed_source, get_remote_address
+from djangovirtualpos.spool import is_spooled, acknowledge
+from djangovirtualpos.prefetch import prefetch_operation_number
+from djangovirtualpos.util import get_form_data_cache, form_data_cache_key, FORM_DATA_CACHE_WAIT, \
+    FORM_DATA_CACHE_REFERENCE_NUMBERS, get_confirmation_max_body_size, get_content_length
 
 
 from django.http import JsonResponse
 
+# If True, confirm_payment answers the bank as soon as the payment is verified and charged,
+# and the sale online_confirm is run later by the vpos_run_fulfillment_jobs command.
+ASYNC_FULFILLMENT = getattr(settings, "VPOS_ASYNC_FULFILLMENT", False)
+
+# Attribute of the sale model that identifies the customer of the stored card references (VPOSCardToken)
+CARD_TOKEN_CUSTOMER_FIELD = getattr(settings, "VPOS_CARD_TOKEN_CUSTOMER_FIELD", "customer_code")
+
 
 def set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, reference_number=False):
     """
@@ -22,10 +40,81 @@ def set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, refer
     :param sale_ok_url: Name of the URL used to redirect client when sale is successful.
     :param sale_nok_url: Name of the URL used to redirect client when sale is not successful.
     :return: HttpResponse.
+
+    The signed form data is cached (VPOS_FORM_DATA_CACHE) while the payment operation is pending,
+    so repeated clicks get the same form without generating it again. Concurrent duplicate requests
+    wait for the first one to finish and return its cached form.
     """
     if request.method == 'GET':
         return JsonResponse({"message":u"Method not valid."})
 
+    cache = get_form_data_cache()
+    payment_code = request.POST.get("payment_code")
+    try:
+        vpos_id = int(request.POST.get("vpos_id"))
+    except (TypeError, ValueError):
+        vpos_id = None
+    # Forms that charge a stored card reference are not cached
+    if hasattr(reference_number, "lower") and reference_number.lower() == "request":
+        reference_number = "request"
+    cached_reference_number = reference_number or False
+    if cache is None or vpos_id is None or not payment_code or \
+            cached_reference_number not in FORM_DATA_CACHE_REFERENCE_NUMBERS:
+        return _set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, reference_number)
+
+    cache_key = form_data_cache_key(vpos_id, payment_code, cached_reference_number)
+    form_data = cache.get(cache_key)
+    if form_data is not None:
+        return JsonResponse(form_data)
+
+    # Only one request generates the form, the others wait for it
+    lock_key = cache_key + ":lock"
+    has_lock = cache.add(lock_key, 1, FORM_DATA_CACHE_WAIT)
+    if not has_lock:
+        deadline = time.time() + FORM_DATA_CACHE_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            form_data = cache.get(cache_key)
+            if form_data is not None:
+                return JsonResponse(form_data)
+    try:
+        return _set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, reference_number,
+                                       cache=cache, cache_key=cache_key)
+    finally:
+        if has_lock:
+            cache.delete(lock_key)
+
+
+def _payment_configuration(request, sale, sale_ok_url, sale_nok_url):
+    """
+    Parameters of VirtualPointOfSale.configurePayment for a sale.
+    """
+    return {
+        # Payment amount
+        "amount": sale.amount,
+        # Payment description
+        "description": sale.description,
+        # Sale code
+        "sale_code": sale.code,
+        # Return URLs
+        "url_ok": request.build_absolute_uri(reverse(sale_ok_url, kwargs={"sale_code": sale.code})),
+        "url_nok": request.build_absolute_uri(reverse(sale_nok_url, kwargs={"sale_code": sale.code})),
+    }
+
+
+def prefetch_payment(request, sale, vpos_id, sale_ok_url, sale_nok_url):
+    """
+    Start creating the PayPal token or Bitpay invoice of a sale in the background (VPOS_PREFETCH_TYPES),
+    so set_payment_attributes does not wait for the gateway when the user clicks the pay button.
+    Call it when the cart is rendered, with the same URL names that will be passed to set_payment_attributes.
+    :param sale: Sale object, with "amount", "description" and "code" attributes.
+    :return: True if the token is being created.
+    """
+    return prefetch_operation_number(vpos_id, **_payment_configuration(request, sale, sale_ok_url, sale_nok_url))
+
+
+def _set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, reference_number,
+                            cache=None, cache_key=None):
     # Getting the VPOS and the Sale
     try:
         # Getting the VirtualPointOfSale object
@@ -42,17 +131,7 @@ def set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, refer
     except VirtualPointOfSale.DoesNotExist:
         return JsonResponse({"message": u"VirtualPOS does NOT exist"}, status=404)
 
-    virtual_point_of_sale.configurePayment(
-        # Payment amount
-        amount=sale.amount,
-        # Payment description
-        description=sale.description,
-        # Sale code
-        sale_code=sale.code,
-        # Return URLs
-        url_ok=request.build_absolute_uri(reverse(sale_ok_url, kwargs={"sale_code": sale.code})),
-        url_nok=request.build_absolute_uri(reverse(sale_nok_url, kwargs={"sale_code": sale.code})),
-    )
+    virtual_point_of_sale.configurePayment(**_payment_configuration(request, sale, sale_ok_url, sale_nok_url))
 
     # Operation number assignment. This operation number depends on the
     # Virtual VPOS selected, it can be letters and numbers or numbers
@@ -78,6 +157,17 @@ def set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, refer
     # Debug message
     form_data["message"] = "Payment {0} updated. Returning payment attributes.".format(payment_code)
 
+    # The form is valid while the operation is pending: it is removed from the cache
+    # when the operation changes its status and it never outlives the pending operation TTL
+    if cache is not None:
+        operation = virtual_point_of_sale.operation
+        expiration_datetime = operation.creation_datetime + get_pending_ttl(virtual_point_of_sale.type)
+        if operation.expiration_datetime is not None:
+            expiration_datetime = min(expiration_datetime, operation.expiration_datetime)
+        timeout = int((expiration_datetime - timezone.now()).total_seconds())
+        if timeout > 0:
+            cache.set(cache_key, form_data, timeout)
+
     # Return JSON response
     return JsonResponse(form_data)
 
@@ -87,18 +177,70 @@ def set_payment_attributes(request, sale_model, sale_ok_url, sale_nok_url, refer
 def confirm_payment(request, virtualpos_type, sale_model):
     """
     This view will be called by the bank.
+    Every delivery from an allowed address is recorded in the VPOSNotification log.
     """
+    # Requests from outside the bank networks (VPOS_CONFIRMATION_ALLOWED_IPS) are rejected
+    # before reading the body or touching the database
+    if not is_allowed_source(request, virtualpos_type):
+        dlprint(u"{0} notification rejected: source {1} is not allowed".format(virtualpos_type,
+                                                                            get_remote_address(request)))
+        return HttpResponseForbidden()
+
+    # Oversized bodies (VPOS_CONFIRMATION_MAX_BODY_SIZE) are rejected from the Content-Length header,
+    # without reading them
+    content_length = get_content_length(request)
+    if content_length is None or content_length > get_confirmation_max_body_size(virtualpos_type):
+        dlprint(u"{0} notification rejected: body of {1} bytes is too large".format(
+            virtualpos_type, request.META.get("CONTENT_LENGTH")))
+        return HttpResponse(status=413)
+
+    received_datetime = timezone.now()
+    # The body is read before parsing the request so it can be logged afterwards
+    body = request.body
+    # Same address as the source check: X-Forwarded-For is only trusted from VPOS_TRUSTED_PROXIES
+    remote_address = get_remote_address(request)
+
+    # Spooled notifications (VPOS_SPOOLED_NOTIFICATION_TYPES) are stored as they came and acknowledged
+    # right away. They are verified and processed later by the vpos_process_spool command
+    if is_spooled(virtualpos_type, body):
+        VPOSSpooledNotification.spool(virtualpos_type, sale_model, request, received_datetime,
+                                      remote_address=remote_address)
+        return acknowledge(virtualpos_type)
+
+    notification = {"operation_number": None, "verified": None}
+    try:
+        return _confirm_payment(request, virtualpos_type, sale_model, notification)
+    finally:
+        VPOSNotification.record(virtualpos_type, body, received_datetime,
+                                operation_number=notification["operation_number"],
+                                verified=notification["verified"], remote_address=remote_address)
+
+
+def _confirm_payment(request, virtualpos_type, sale_model, notification):
     # Checking if the Point of Sale exists
-    virtual_pos = VirtualPointOfSale.receiveConfirmation(request, virtualpos_type=virtualpos_type)
+    try:
+        virtual_pos = VirtualPointOfSale.receiveConfirmation(request, virtualpos_type=virtualpos_type)
+    except VPOSNotificationIgnored as e:
+        # Duplicate, superseded or irrelevant notification: answered without touching the operations table
+        dlprint(u"{0} notification ignored: {1}".format(virtualpos_type, e))
+        return e.response
 
     if not virtual_pos:
-        # The VPOS does not exist, inform the bank with a cancel
-        # response if needed
+        # The VPOS or the operation does not exist, or the notification signature is not valid:
+        # inform the bank with a cancel response if needed. Nothing is written in the operations table
+        notification["verified"] = False
         return VirtualPointOfSale.staticResponseNok(virtualpos_type)
 
     # Verify if bank confirmation is indeed from the bank
     verified = virtual_pos.verifyConfirmation()
     operation_number = virtual_pos.operation.operation_number
+    notification["operation_number"] = operation_number
+    notification["verified"] = verified
+
+    if not verified and not virtual_pos.delegated.notification_authenticated:
+        # Forged or corrupted notification (the gateway did not sign it): answered like an unknown operation.
+        # The genuine operation is left untouched and nothing is sent to the bank on its behalf
+        return VirtualPointOfSale.staticResponseNok(virtualpos_type)
 
     with transaction.atomic():
         try:
@@ -124,6 +266,18 @@ def confirm_payment(request, virtualpos_type, sale_model):
                     reference_number = virtual_pos.delegated.ds_merchantparameters.get("Ds_Merchant_Identifier")
                     expiration_date = virtual_pos.delegated.ds_merchantparameters.get("Ds_ExpiryDate")
                 if reference_number:
+                    # The card reference is stored in the VPOSCardToken vault in this same transaction
+                    VPOSCardToken.store(virtual_pos, reference_number, expiration_date,
+                                        customer_code=getattr(payment, CARD_TOKEN_CUSTOMER_FIELD, None),
+                                        sale_code=virtual_pos.operation.sale_code, operation_number=operation_number)
+                if ASYNC_FULFILLMENT:
+                    # The sale is confirmed later, the job is stored in this same transaction
+                    online_confirm_parameters = {}
+                    if reference_number:
+                        online_confirm_parameters = {"reference": reference_number,
+                                                     "expiration_date": expiration_date}
+                    VPOSFulfillmentJob.enqueue(sale_model, operation_number, **online_confirm_parameters)
+                elif reference_number:
                     print(u"Online Confirm: Reference number")
                     print(reference_number)
                     payment.online_confirm(reference=reference_number, expiration_date=expiration_date)
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.db import models
+
+
+class Sale(models.Model):
+    """Venta de la aplicación, con la interfaz que espera djangovirtualpos."""
+    code = models.CharField(max_length=64, unique=True)
+    operation_number = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(max_length=16, default="pending")
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    description = models.CharField(max_length=255, default="")
+    # Si es True, online_confirm falla (p.ej. para comprobar los reintentos)
+    fails = models.BooleanField(default=False)
+
+    virtual_pos = None
+
+    def online_confirm(self, **kwargs):
+        if self.fails:
+            raise RuntimeError(u"online_confirm de prueba fallido")
+        self.status = "paid"
+        self.save()
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+# Configuración mínima para ejecutar los tests: python runtests.py
+
+SECRET_KEY = "djangovirtualpos-tests"
+DEBUG = False
+ALLOWED_HOSTS = ["testserver", "localhost"]
+# djangovirtualpos.debug lo incluye en sus mensajes
+DOMAIN = "testserver"
+INSTALLED_APPS = [
+    "django.contrib.contenttypes",
+    "django.contrib.auth",
+    "djangovirtualpos",
+    "tests",
+]
+DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}}
+CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+ROOT_URLCONF = "tests.urls"
+TIME_ZONE = "Europe/Madrid"
+USE_TZ = True
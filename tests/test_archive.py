@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from djangovirtualpos.archive import archive_batch, archive_operations, find_operation
+from djangovirtualpos.models import VPOSPaymentOperation, VPOSRefundOperation, VPOSPaymentPayload, \
+    VPOSArchivedOperation
+from djangovirtualpos.models.paypal import VPOSPaypal
+
+
+class ArchiveTest(TestCase):
+    """
+    Archivado de operaciones en estado final con sus devoluciones y mensajes de pasarela.
+    """
+
+    def setUp(self):
+        self.vpos = VPOSPaypal.objects.create(
+            name="PayPal", bank_name="PayPal", type="paypal", environment="testing",
+            API_username="user", API_password="password", API_signature="signature", Version="95")
+
+    def _operation(self, operation_number, status):
+        operation = VPOSPaymentOperation(
+            amount=Decimal("10.00"), description="Venta", url_ok="http://testserver/ok",
+            url_nok="http://testserver/nok", operation_number=operation_number, sale_code=operation_number,
+            status=status, type="paypal", virtual_point_of_sale_id=self.vpos.id, environment="testing")
+        operation.save()
+        return operation
+
+    def _refund(self, operation, status="completed"):
+        refund = VPOSRefundOperation(amount=Decimal("2.00"), description="Devolución",
+                                     operation_number="{0}-R".format(operation.operation_number),
+                                     status=status, payment=operation)
+        refund.save()
+        return refund
+
+    def test_operations_are_archived_with_their_refunds_and_payloads(self):
+        operation = self._operation("OP1", "completely_refunded")
+        self._refund(operation)
+        operation.append_payload("charge_response", "OK")
+
+        self.assertEqual(archive_batch([operation.id]), 1)
+
+        self.assertFalse(VPOSPaymentOperation.objects.filter(id=operation.id).exists())
+        self.assertFalse(VPOSRefundOperation.objects.exists())
+        self.assertFalse(VPOSPaymentPayload.objects.exists())
+        archived = find_operation(operation_number="OP1")
+        self.assertTrue(archived.is_archived)
+        self.assertEqual(archived.status, "completely_refunded")
+        self.assertEqual([refund.operation_number for refund in archived.archived_refunds], ["OP1-R"])
+        self.assertEqual([payload.kind for payload in archived.archived_payloads], ["charge_response"])
+
+        # Su número de operación no se vuelve a usar
+        self.assertEqual(VPOSPaymentOperation.taken_operation_numbers(["OP1", "OP2"]), {"OP1"})
+
+    def test_operations_that_are_no_longer_final_are_kept(self):
+        completed = self._operation("OP1", "completed")
+        refunded = self._operation("OP2", "completed")
+        operation_ids = [completed.id, refunded.id]
+
+        # Entre la selección del lote y su archivado, una de las operaciones recibe una devolución parcial
+        self._refund(refunded, status="pending")
+        VPOSPaymentOperation.objects.filter(id=refunded.id).update(status="partially_refunded")
+
+        self.assertEqual(archive_batch(operation_ids), 1)
+        self.assertEqual(list(VPOSArchivedOperation.objects.values_list("operation_number", flat=True)), ["OP1"])
+        self.assertEqual(VPOSPaymentOperation.objects.get(id=refunded.id).status, "partially_refunded")
+        self.assertEqual(VPOSRefundOperation.objects.get().payment_id, refunded.id)
+
+    def test_old_operations_are_archived_in_files(self):
+        archive_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_path)
+        for operation_number, status in (("OP1", "completed"), ("OP2", "failed"), ("OP3", "pending")):
+            self._operation(operation_number, status)
+        VPOSPaymentOperation.objects.update(creation_datetime=timezone.now() - datetime.timedelta(days=400))
+
+        self.assertEqual(archive_operations(batch_size=1, archive_path=archive_path), 2)
+
+        self.assertEqual(list(VPOSPaymentOperation.objects.values_list("operation_number", flat=True)), ["OP3"])
+        self.assertEqual(find_operation(sale_code="OP2").status, "failed")
+        self.assertTrue(VPOSArchivedOperation.objects.get(operation_number="OP2").file_path.startswith(archive_path))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.test import TransactionTestCase
+
+from djangovirtualpos.models import VPOSPaymentOperation
+from djangovirtualpos.models import bitpay
+from djangovirtualpos.models.bitpay import VPOSBitpay
+from tests.models import Sale
+
+
+class FakeInvoiceResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class FakeInvoiceSession(object):
+    """
+    Sesión HTTP que sustituye a djangovirtualpos.util.get_http_session: responde al API de invoices de Bitpay
+    con el estado guardado en statuses (id del invoice -> estado).
+    """
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        invoice_id = url.rsplit("/", 1)[-1]
+        self.calls.append(invoice_id)
+        return FakeInvoiceResponse({"data": {"id": invoice_id, "status": self.statuses[invoice_id]}})
+
+
+class BitpayIPNTest(TransactionTestCase):
+    """
+    IPN de Bitpay en la vista confirm_payment con el API de invoices simulado (FakeInvoiceSession).
+    """
+
+    def setUp(self):
+        vpos = VPOSBitpay.objects.create(
+            name="Bitpay", bank_name="Bitpay", type="bitpay", environment="testing",
+            testing_api_key="key", production_api_key="production-key",
+            notification_url="https://testserver/payment/confirm/bitpay")
+        VPOSPaymentOperation(
+            amount=Decimal("12.50"), description="Venta", url_ok="http://testserver/ok",
+            url_nok="http://testserver/nok", operation_number="INVOICE1", sale_code="SALE1", status="pending",
+            type="bitpay", virtual_point_of_sale_id=vpos.id, environment="testing").save()
+        Sale.objects.create(code="SALE1", operation_number="INVOICE1", amount=Decimal("12.50"))
+
+        caches["default"].clear()
+        self.session = FakeInvoiceSession({"INVOICE1": "new"})
+        self.original_get_http_session = bitpay.get_http_session
+        bitpay.get_http_session = lambda: self.session
+
+    def tearDown(self):
+        bitpay.get_http_session = self.original_get_http_session
+
+    def _ipn(self, status):
+        return self.client.post("/payment/confirm/bitpay", json.dumps({"id": "INVOICE1", "status": status}),
+                                content_type="application/json")
+
+    def _operation_status(self):
+        return VPOSPaymentOperation.objects.get(operation_number="INVOICE1").status
+
+    def test_forged_ipn_does_not_fail_the_operation(self):
+        # El invoice sigue abierto en Bitpay: la IPN "expired" es falsa
+        self._ipn("expired")
+        self.assertEqual(self._operation_status(), "pending")
+
+        # La IPN "paid" real se trata aunque llegue después
+        self.session.statuses["INVOICE1"] = "paid"
+        self.assertEqual(self._ipn("paid").content, b"OK")
+        self.assertEqual(self._operation_status(), "completed")
+        self.assertEqual(Sale.objects.get(code="SALE1").status, "paid")
+
+    def test_forged_paid_ipn_is_not_charged(self):
+        self.session.statuses["INVOICE1"] = "expired"
+        self._ipn("paid")
+        self.assertEqual(self._operation_status(), "failed. verification_error")
+        self.assertEqual(Sale.objects.get(code="SALE1").status, "pending")
+
+    def test_repeated_ipns_are_dropped(self):
+        self.session.statuses["INVOICE1"] = "paid"
+        self._ipn("paid")
+        self.assertEqual(self.session.calls, ["INVOICE1"])
+
+        # Las IPN siguientes del invoice se contestan sin consultar el API ni la BD
+        self.assertEqual(self._ipn("paid").content, b"OK")
+        self.assertEqual(self._ipn("expired").content, b"OK")
+        self.assertEqual(self.session.calls, ["INVOICE1"])
+        self.assertEqual(self._operation_status(), "completed")
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.cache import caches
+from django.test import TransactionTestCase
+
+from djangovirtualpos.models import VPOSCardToken
+from djangovirtualpos.models.paypal import VPOSPaypal
+
+
+class CardTokenCacheTest(TransactionTestCase):
+    """
+    Caché de la última referencia válida de cada cliente (VPOS_CARD_TOKEN_CACHE).
+    """
+
+    def setUp(self):
+        self.vpos = VPOSPaypal.objects.create(
+            name="PayPal", bank_name="PayPal", type="paypal", environment="testing",
+            API_username="user", API_password="password", API_signature="signature", Version="95")
+        caches["default"].clear()
+
+    def test_latest_valid_token_is_cached(self):
+        token = VPOSCardToken.store(self.vpos, "REF1", "2812", customer_code="CUSTOMER1")
+        self.assertEqual(VPOSCardToken.get_latest_valid("CUSTOMER1"), token)
+        self.assertEqual(VPOSCardToken.get_latest_valid("CUSTOMER1", self.vpos), token)
+
+        token.revoke()
+        self.assertIsNone(VPOSCardToken.get_latest_valid("CUSTOMER1"))
+        self.assertIsNone(VPOSCardToken.get_latest_valid("CUSTOMER1", self.vpos))
+
+    def test_moved_token_is_invalidated_for_both_customers(self):
+        VPOSCardToken.store(self.vpos, "REF1", "2812", customer_code="CUSTOMER1")
+        self.assertIsNotNone(VPOSCardToken.get_latest_valid("CUSTOMER1"))
+        self.assertIsNotNone(VPOSCardToken.get_latest_valid("CUSTOMER1", self.vpos))
+        self.assertIsNone(VPOSCardToken.get_latest_valid("CUSTOMER2"))
+
+        # La misma tarjeta se guarda en un pago de otro cliente
+        token = VPOSCardToken.store(self.vpos, "REF1", "2901", customer_code="CUSTOMER2")
+
+        self.assertIsNone(VPOSCardToken.get_latest_valid("CUSTOMER1"))
+        self.assertIsNone(VPOSCardToken.get_latest_valid("CUSTOMER1", self.vpos))
+        self.assertEqual(VPOSCardToken.get_latest_valid("CUSTOMER2"), token)
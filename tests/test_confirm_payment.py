@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import hashlib
+from decimal import Decimal
+
+from django.test import TestCase
+
+from djangovirtualpos.models import VPOSPaymentOperation, VPOSNotification, VPOSOutboxEvent
+from djangovirtualpos.models.ceca import VPOSCeca
+from tests.models import Sale
+
+
+class CecaConfirmPaymentTest(TestCase):
+    """
+    Notificaciones de CECA en la vista confirm_payment: sólo las firmadas por la pasarela escriben en la operación.
+    """
+
+    ENCRYPTION_KEY = "12345678"
+
+    def setUp(self):
+        vpos = VPOSCeca.objects.create(
+            name="CECA", bank_name="CECA", type="ceca", environment="testing",
+            merchant_id="123456789", acquirer_bin="0000554000", terminal_id="00000003",
+            encryption_key_testing=self.ENCRYPTION_KEY)
+        self.operation = VPOSPaymentOperation(
+            amount=Decimal("12.50"), description="Venta", url_ok="http://testserver/ok",
+            url_nok="http://testserver/nok", operation_number="OP1", sale_code="SALE1", status="pending",
+            type="ceca", virtual_point_of_sale_id=vpos.id, environment="testing")
+        self.operation.save()
+        Sale.objects.create(code="SALE1", operation_number="OP1", amount=Decimal("12.50"))
+
+    def _notification(self, signature=None):
+        data = {"MerchantID": "123456789", "AcquirerBIN": "0000554000", "TerminalID": "00000003",
+                "Num_operacion": "OP1", "Importe": "1250", "TipoMoneda": "978", "Exponente": "2",
+                "Referencia": "REF1", "Num_aut": "101000"}
+        if signature is None:
+            signature = hashlib.sha1("{0}{MerchantID}{AcquirerBIN}{TerminalID}{Num_operacion}{Importe}"
+                                     "{TipoMoneda}{Exponente}{Referencia}".format(self.ENCRYPTION_KEY, **data)
+                                     ).hexdigest()
+        data["Firma"] = signature
+        return self.client.post("/payment/confirm/ceca", data)
+
+    def test_forged_notification_writes_nothing(self):
+        before = VPOSPaymentOperation.objects.values().get(id=self.operation.id)
+        outbox_events = VPOSOutboxEvent.objects.count()
+
+        response = self._notification(signature="0" * 40)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(VPOSPaymentOperation.objects.values().get(id=self.operation.id), before)
+        self.assertFalse(self.operation.payloads.exists())
+        self.assertEqual(VPOSOutboxEvent.objects.count(), outbox_events)
+        self.assertEqual(Sale.objects.get(code="SALE1").status, "pending")
+        # La notificación queda en el registro, marcada como no verificada
+        self.assertFalse(VPOSNotification.objects.get().verified)
+
+    def test_signed_notification_charges(self):
+        response = self._notification()
+
+        self.assertEqual(response.content, b"$*$OKY$*$")
+        operation = VPOSPaymentOperation.objects.get(id=self.operation.id)
+        self.assertEqual(operation.status, "completed")
+        self.assertEqual(operation.confirmation_code, "REF1")
+        self.assertEqual(Sale.objects.get(code="SALE1").status, "paid")
+        self.assertTrue(VPOSNotification.objects.get().verified)
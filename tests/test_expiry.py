@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from djangovirtualpos.expiry import expire_pending_operations, EXPIRATION_GRACE
+from djangovirtualpos.models import VPOSPaymentOperation
+from djangovirtualpos.models.bitpay import VPOSBitpay
+
+
+class ExpirePendingOperationsTest(TestCase):
+    """
+    Caducidad de las operaciones pendientes de Bitpay, que tienen fecha de caducidad propia (la del invoice).
+    """
+
+    def setUp(self):
+        self.vpos = VPOSBitpay.objects.create(
+            name="Bitpay", bank_name="Bitpay", type="bitpay", environment="testing",
+            testing_api_key="key", production_api_key="production-key",
+            notification_url="https://testserver/payment/confirm/bitpay")
+        self.now = timezone.now()
+
+    def _operation(self, operation_number, expiration_datetime):
+        VPOSPaymentOperation(
+            amount=Decimal("10.00"), description="Venta", url_ok="http://testserver/ok",
+            url_nok="http://testserver/nok", operation_number=operation_number, sale_code=operation_number,
+            status="pending", type="bitpay", virtual_point_of_sale_id=self.vpos.id, environment="testing",
+            expiration_datetime=expiration_datetime).save()
+
+    def _status(self, operation_number):
+        return VPOSPaymentOperation.objects.get(operation_number=operation_number).status
+
+    def test_operations_expire_after_the_grace_period(self):
+        self._operation("JUST-EXPIRED", self.now - datetime.timedelta(minutes=1))
+        self._operation("EXPIRED", self.now - EXPIRATION_GRACE - datetime.timedelta(minutes=1))
+        self._operation("OPEN", self.now + datetime.timedelta(minutes=10))
+
+        self.assertEqual(expire_pending_operations(["bitpay"], now=self.now), {"bitpay": 1})
+
+        self.assertEqual(self._status("EXPIRED"), "expired")
+        # La IPN de un pago hecho justo antes de que caduque el invoice aún se puede tratar
+        self.assertEqual(self._status("JUST-EXPIRED"), "pending")
+        self.assertEqual(self._status("OPEN"), "pending")
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import json
+import threading
+import time
+import urlparse
+from decimal import Decimal
+
+import requests
+from django.core.cache import caches
+from django.test import TestCase, RequestFactory
+
+from djangovirtualpos.models import VirtualPointOfSale, VPOSPaymentOperation, VPOSCantCharge
+from djangovirtualpos.models import paypalrest
+from djangovirtualpos.models.paypalrest import VPOSPaypalRest
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(u"{0}".format(self.status_code))
+
+
+class FakeSession(object):
+    """
+    Sesión HTTP que sustituye a djangovirtualpos.util.get_http_session: guarda las peticiones
+    y las responde con handler(method, path, kwargs).
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        path = urlparse.urlparse(url).path
+        with self.lock:
+            self.calls.append((method, path, kwargs))
+        return self.handler(method, path, kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def paths(self, path):
+        return [call for call in self.calls if call[1] == path]
+
+
+class PaypalRestTest(TestCase):
+    """
+    Pasarela PayPal REST con la API de PayPal simulada (FakeSession).
+    """
+
+    TOKEN_PATH = "/v1/oauth2/token"
+
+    def setUp(self):
+        vpos = VPOSPaypalRest.objects.create(
+            name="PayPal REST", bank_name="PayPal", type="paypalrest", environment="testing",
+            testing_client_id="client", testing_client_secret="secret",
+            production_client_id="production-client", production_client_secret="production-secret",
+            return_url="https://testserver/payment/confirm/paypalrest",
+            has_total_refunds=True, has_partial_refunds=True)
+        self.vpos = VirtualPointOfSale.get(id=vpos.id)
+
+        paypalrest._oauth_tokens.clear()
+        caches["default"].clear()
+
+        self.issued_tokens = 0
+        self.token_delay = 0
+        self.rejected_tokens = set()
+        self.order_amount = "12.50"
+        self.capture_status = "COMPLETED"
+        self.session = FakeSession(self.handle_request)
+        self.original_get_http_session = paypalrest.get_http_session
+        paypalrest.get_http_session = lambda: self.session
+
+    def tearDown(self):
+        paypalrest.get_http_session = self.original_get_http_session
+
+    ####################################################################
+    ## API de PayPal simulada
+    def handle_request(self, method, path, kwargs):
+        if path == self.TOKEN_PATH:
+            time.sleep(self.token_delay)
+            with self.session.lock:
+                self.issued_tokens += 1
+                token = "token-{0}".format(self.issued_tokens)
+            return FakeResponse(200, {"access_token": token, "expires_in": 32400})
+
+        if kwargs["headers"]["Authorization"][len("Bearer "):] in self.rejected_tokens:
+            return FakeResponse(401, {"error": "invalid_token"})
+
+        if method == "POST" and path == "/v2/checkout/orders":
+            return FakeResponse(201, {"id": "ORDER1", "status": "CREATED"})
+        if method == "GET" and path == "/v2/checkout/orders/ORDER1":
+            return FakeResponse(200, {
+                "id": "ORDER1", "status": "APPROVED",
+                "purchase_units": [{"amount": {"currency_code": "EUR", "value": self.order_amount}}]
+            })
+        if method == "POST" and path == "/v2/checkout/orders/ORDER1/capture":
+            return FakeResponse(201, {
+                "id": "ORDER1", "status": self.capture_status,
+                "purchase_units": [{"payments": {"captures": [{"id": "CAPTURE1", "status": self.capture_status}]}}]
+            })
+        if method == "POST" and path == "/v2/payments/captures/CAPTURE1/refund":
+            return FakeResponse(201, {"id": "REFUND1", "status": "COMPLETED"})
+        return FakeResponse(404, {"name": "RESOURCE_NOT_FOUND"})
+
+    ####################################################################
+    ## Token OAuth
+    def test_oauth_token_is_reused(self):
+        delegated = self.vpos.delegated
+        self.assertEqual(delegated.get_oauth_token(), "token-1")
+        self.assertEqual(delegated.get_oauth_token(), "token-1")
+
+        # Otro proceso (sin el token en memoria) lo toma de la caché compartida
+        paypalrest._oauth_tokens.clear()
+        self.assertEqual(VirtualPointOfSale.get(id=self.vpos.id).delegated.get_oauth_token(), "token-1")
+        self.assertEqual(self.issued_tokens, 1)
+
+        # Con otras credenciales se pide otro token
+        delegated.testing_client_secret = "new-secret"
+        self.assertEqual(delegated.get_oauth_token(), "token-2")
+        token_request = self.session.paths(self.TOKEN_PATH)[-1][2]
+        self.assertEqual(token_request["auth"], ("client", "new-secret"))
+
+    def test_oauth_token_refresh_is_single_flight(self):
+        self.token_delay = 0.2
+        delegated = self.vpos.delegated
+        tokens = []
+
+        def get_token():
+            tokens.append(delegated.get_oauth_token())
+
+        threads = [threading.Thread(target=get_token) for _i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(tokens, ["token-1"] * 8)
+        self.assertEqual(self.issued_tokens, 1)
+
+    def test_oauth_token_waits_for_another_process(self):
+        delegated = self.vpos.delegated
+        cache = caches["default"]
+        key = delegated._oauth_token_cache_key()
+
+        # Otro proceso tiene el cerrojo de la caché y guarda el token nuevo un poco después
+        cache.add(key + ":lock", 1, 10)
+        timer = threading.Timer(0.3, lambda: cache.set(key, (time.time() + 3600, "token-other-process"), 3600))
+        timer.start()
+        try:
+            self.assertEqual(delegated.get_oauth_token(), "token-other-process")
+        finally:
+            timer.cancel()
+        self.assertEqual(self.issued_tokens, 0)
+
+    def test_rejected_oauth_token_is_renewed_once(self):
+        delegated = self.vpos.delegated
+        self.rejected_tokens.add(delegated.get_oauth_token())
+
+        response = delegated._api_request("GET", "/v2/checkout/orders/ORDER1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.issued_tokens, 2)
+        order_requests = self.session.paths("/v2/checkout/orders/ORDER1")
+        self.assertEqual([request[2]["headers"]["Authorization"] for request in order_requests],
+                         ["Bearer token-1", "Bearer token-2"])
+
+        # Si PayPal rechaza también el token renovado no se insiste más
+        self.rejected_tokens.update(("token-2", "token-3"))
+        self.assertEqual(delegated._api_request("GET", "/v2/checkout/orders/ORDER1").status_code, 401)
+        self.assertEqual(self.issued_tokens, 3)
+        self.assertEqual(len(self.session.paths("/v2/checkout/orders/ORDER1")), 4)
+
+    ####################################################################
+    ## Pago
+    def _create_order(self):
+        self.vpos.configurePayment(amount=Decimal("12.50"), description="Venta de prueba",
+                                   url_ok=str("https://testserver/ok"), url_nok=str("https://testserver/nok"),
+                                   sale_code="SALE1")
+        return self.vpos.setupPayment()
+
+    def _confirmation(self):
+        request = RequestFactory().get("/payment/confirm/paypalrest", {"token": "ORDER1", "PayerID": "PAYER1"})
+        return VirtualPointOfSale.receiveConfirmation(request, "paypalrest")
+
+    def test_order_is_created(self):
+        self.assertEqual(self._create_order(), "ORDER1")
+
+        order = self.session.paths("/v2/checkout/orders")[0][2]["json"]
+        self.assertEqual(order["intent"], "CAPTURE")
+        self.assertEqual(order["purchase_units"][0]["amount"], {"currency_code": "EUR", "value": "12.50"})
+        self.assertEqual(order["purchase_units"][0]["reference_id"], "SALE1")
+        self.assertEqual(order["application_context"]["return_url"], "https://testserver/payment/confirm/paypalrest")
+        self.assertEqual(VPOSPaymentOperation.objects.get(operation_number="ORDER1").status, "pending")
+
+        form_data = self.vpos.getPaymentFormData()
+        self.assertEqual(form_data["data"], {"token": "ORDER1"})
+
+    def test_order_is_verified_and_captured(self):
+        self._create_order()
+        vpos = self._confirmation()
+        self.assertTrue(vpos.verifyConfirmation())
+
+        response = vpos.charge()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "/payment/ok/SALE1")
+        capture_request = self.session.paths("/v2/checkout/orders/ORDER1/capture")[0][2]
+        self.assertEqual(capture_request["headers"]["PayPal-Request-Id"], "ORDER1")
+
+        operation = VPOSPaymentOperation.objects.get(operation_number="ORDER1")
+        self.assertEqual(operation.status, "completed")
+        self.assertEqual(operation.confirmation_code, "ORDER1")
+        self.assertIn("CAPTURE1", operation.payloads.get(kind="capture").data)
+
+    def test_order_with_another_amount_is_not_verified(self):
+        self._create_order()
+        self.order_amount = "1.00"
+        self.assertFalse(self._confirmation().verifyConfirmation())
+
+    def test_failed_capture_raises(self):
+        self._create_order()
+        self.capture_status = "DECLINED"
+        vpos = self._confirmation()
+        self.assertTrue(vpos.verifyConfirmation())
+        self.assertRaises(VPOSCantCharge, vpos.charge)
+
+    ####################################################################
+    ## Devolución
+    def test_capture_is_refunded(self):
+        self._create_order()
+        vpos = self._confirmation()
+        vpos.verifyConfirmation()
+        vpos.charge()
+
+        vpos = VirtualPointOfSale.get(id=self.vpos.id)
+        self.assertTrue(vpos.refund("SALE1", Decimal("5.00"), "Devolución parcial"))
+
+        refund_request = self.session.paths("/v2/payments/captures/CAPTURE1/refund")[0][2]
+        self.assertEqual(refund_request["json"]["amount"], {"currency_code": "EUR", "value": "5.00"})
+        self.assertEqual(refund_request["headers"]["PayPal-Request-Id"], "refund-{0}".format(vpos.operation.id))
+
+        payment = VPOSPaymentOperation.objects.get(operation_number="ORDER1")
+        self.assertEqual(payment.status, "partially_refunded")
+        self.assertEqual(payment.refund_operations.get().status, "completed")
+        self.assertEqual(json.loads(payment.payloads.get(kind="refund").data)["id"], "REFUND1")
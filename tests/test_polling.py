@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import datetime
+from decimal import Decimal
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from djangovirtualpos.models import VirtualPointOfSale, VPOSPaymentOperation, VPOSFulfillmentJob
+from djangovirtualpos.models.paypal import VPOSPaypal
+from djangovirtualpos.polling import query_pending_operations
+from tests.models import Sale
+
+
+class QueryPendingOperationsTest(TransactionTestCase):
+    """
+    Consulta de operaciones pendientes con la pasarela simulada: VPOSPaypal.query_status
+    se sustituye por una función que devuelve los estados de STATUSES.
+    """
+
+    # Número de operación -> estado devuelto por la pasarela (None: sigue pendiente)
+    STATUSES = {"OP-OK-1": "completed", "OP-OK-2": "completed", "OP-FAIL": "completed",
+                "OP-KO": "failed", "OP-PENDING": None}
+
+    def setUp(self):
+        self.vpos = VPOSPaypal.objects.create(
+            name="PayPal", bank_name="PayPal", type="paypal", environment="testing",
+            API_username="user", API_password="password", API_signature="signature", Version="95")
+
+        old = timezone.now() - datetime.timedelta(hours=1)
+        for operation_number in self.STATUSES:
+            VPOSPaymentOperation(
+                amount=Decimal("10.00"), description="Venta", url_ok="http://testserver/ok",
+                url_nok="http://testserver/nok", operation_number=operation_number, sale_code=operation_number,
+                status="pending", type="paypal", virtual_point_of_sale_id=self.vpos.id,
+                environment="testing").save()
+            Sale.objects.create(code=operation_number, operation_number=operation_number,
+                                amount=Decimal("10.00"), fails=operation_number == "OP-FAIL")
+        VPOSPaymentOperation.objects.update(creation_datetime=old)
+
+        self.queried = []
+
+        def query_status(vpos, operations):
+            self.queried += [operation.operation_number for operation in operations]
+            return {operation.id: self.STATUSES[operation.operation_number] for operation in operations}
+
+        self.original_query_status = VPOSPaypal.query_status
+        VPOSPaypal.query_status = query_status
+
+    def tearDown(self):
+        VPOSPaypal.query_status = self.original_query_status
+
+    def _operation_status(self, operation_number):
+        return VPOSPaymentOperation.objects.get(operation_number=operation_number).status
+
+    def test_sale_model_is_required(self):
+        self.assertRaises(ValueError, query_pending_operations, None)
+        self.assertEqual(self._operation_status("OP-OK-1"), "pending")
+
+    def test_completed_operations_confirm_their_sales(self):
+        updated = query_pending_operations(Sale)
+
+        self.assertEqual(sorted(self.queried), sorted(self.STATUSES))
+        self.assertEqual(updated, {"completed": 3, "failed": 1})
+        for operation_number, status in self.STATUSES.items():
+            self.assertEqual(self._operation_status(operation_number), status or "pending")
+
+        # Las ventas de las operaciones completadas se confirman, salvo la que falla
+        self.assertEqual(Sale.objects.get(code="OP-OK-1").status, "paid")
+        self.assertEqual(Sale.objects.get(code="OP-OK-2").status, "paid")
+        self.assertEqual(Sale.objects.get(code="OP-FAIL").status, "pending")
+        self.assertEqual(Sale.objects.get(code="OP-KO").status, "pending")
+        self.assertEqual(Sale.objects.get(code="OP-PENDING").status, "pending")
+
+        # Un trabajo por operación completada; el fallido queda pendiente de reintento
+        jobs = {job.operation_number: job for job in VPOSFulfillmentJob.objects.all()}
+        self.assertEqual(sorted(jobs), ["OP-FAIL", "OP-OK-1", "OP-OK-2"])
+        self.assertEqual(jobs["OP-OK-1"].status, "done")
+        self.assertEqual(jobs["OP-OK-2"].status, "done")
+        self.assertEqual(jobs["OP-FAIL"].status, "pending")
+        self.assertEqual(jobs["OP-FAIL"].attempts, 1)
+        self.assertIn("online_confirm de prueba fallido", jobs["OP-FAIL"].last_error)
+
+        # Una segunda consulta no vuelve a tocar las operaciones ya resueltas
+        self.queried = []
+        self.assertEqual(query_pending_operations(Sale), {})
+        self.assertEqual(self.queried, ["OP-PENDING"])
+
+    def test_sales_get_the_virtual_pos(self):
+        virtual_poses = []
+        original_online_confirm = Sale.online_confirm
+
+        def online_confirm(sale, **kwargs):
+            virtual_poses.append(sale.virtual_pos)
+            return original_online_confirm(sale, **kwargs)
+
+        Sale.online_confirm = online_confirm
+        try:
+            query_pending_operations(Sale)
+        finally:
+            Sale.online_confirm = original_online_confirm
+
+        # Como en la vista confirm_payment: el TPV padre, con su delegado y la operación pagada
+        self.assertEqual(len(virtual_poses), 3)
+        for virtual_pos in virtual_poses:
+            self.assertIs(type(virtual_pos), VirtualPointOfSale)
+            self.assertEqual(virtual_pos.id, self.vpos.id)
+            self.assertIsInstance(virtual_pos.delegated, VPOSPaypal)
+            self.assertEqual(virtual_pos.operation.status, "completed")
+        self.assertEqual(sorted(virtual_pos.operation.operation_number for virtual_pos in virtual_poses),
+                         ["OP-FAIL", "OP-OK-1", "OP-OK-2"])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from djangovirtualpos.models import VirtualPointOfSale, VPOSPaymentOperation
+from djangovirtualpos.models import base
+from djangovirtualpos.models.paypal import VPOSPaypal
+
+
+class PrefetchedOperationNumberTest(TestCase):
+    """
+    Uso de los números de operación de PayPal creados de antemano (ver djangovirtualpos.prefetch).
+    VPOSPaypal.setupPayment se sustituye para no llamar a PayPal.
+    """
+
+    def setUp(self):
+        self.vpos_id = VPOSPaypal.objects.create(
+            name="PayPal", bank_name="PayPal", type="paypal", environment="testing",
+            API_username="user", API_password="password", API_signature="signature", Version="95").id
+        caches["default"].clear()
+
+        self.original_prefetch_vpos_types = base.PREFETCH_VPOS_TYPES
+        base.PREFETCH_VPOS_TYPES = ("paypal",)
+        self.created_tokens = []
+        self.original_setup_payment = VPOSPaypal.setupPayment
+
+        def setup_payment(delegated, operation_number=None, code_len=12):
+            if operation_number:
+                return operation_number
+            token = "EC-NEW-{0}".format(len(self.created_tokens) + 1)
+            self.created_tokens.append(token)
+            return token
+
+        VPOSPaypal.setupPayment = setup_payment
+
+    def tearDown(self):
+        base.PREFETCH_VPOS_TYPES = self.original_prefetch_vpos_types
+        VPOSPaypal.setupPayment = self.original_setup_payment
+
+    def _configured_vpos(self):
+        vpos = VirtualPointOfSale.get(id=self.vpos_id)
+        vpos.configurePayment(amount=Decimal("10.00"), description="Venta", url_ok=str("http://testserver/ok"),
+                              url_nok=str("http://testserver/nok"), sale_code="SALE1")
+        return vpos
+
+    def _prefetch(self, operation_number):
+        vpos = self._configured_vpos()
+        caches["default"].set(vpos._prefetched_operation_number_cache_key(), (operation_number, None), 600)
+
+    def test_prefetched_operation_number_is_taken_once(self):
+        self._prefetch("EC-PREFETCHED")
+        first = self._configured_vpos()
+        second = self._configured_vpos()
+
+        # Dos peticiones simultáneas leen la misma entrada antes de que la primera la borre
+        cache = caches["default"]
+        cache.delete = lambda key, *args, **kwargs: None
+        try:
+            self.assertEqual(first._take_prefetched_operation_number(), ("EC-PREFETCHED", None))
+            self.assertIsNone(second._take_prefetched_operation_number())
+        finally:
+            del cache.delete
+
+    def test_taken_prefetched_operation_number_is_not_reused(self):
+        VPOSPaymentOperation(
+            amount=Decimal("10.00"), description="Venta", url_ok="http://testserver/ok",
+            url_nok="http://testserver/nok", operation_number="EC-PREFETCHED", sale_code="OTHER",
+            status="completed", type="paypal", virtual_point_of_sale_id=self.vpos_id, environment="testing").save()
+        self._prefetch("EC-PREFETCHED")
+
+        self.assertEqual(self._configured_vpos().setupPayment(), "EC-NEW-1")
+        self.assertEqual(VPOSPaymentOperation.objects.filter(operation_number="EC-PREFETCHED").count(), 1)
+
+    def test_prefetched_operation_number_is_used(self):
+        self._prefetch("EC-PREFETCHED")
+
+        self.assertEqual(self._configured_vpos().setupPayment(), "EC-PREFETCHED")
+        self.assertEqual(self.created_tokens, [])
+        # Una segunda venta igual no lo vuelve a usar
+        VPOSPaymentOperation.objects.update(status="completed")
+        self.assertEqual(self._configured_vpos().setupPayment(), "EC-NEW-1")
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+
+from django.test import TestCase
+
+from djangovirtualpos.models import VPOSPaymentOperation
+from djangovirtualpos.models.ceca import VPOSCeca
+from djangovirtualpos.reconciliation import reconcile_file
+
+
+class ReconcileFileTest(TestCase):
+    """
+    Conciliación de ficheros de liquidación con operaciones en monedas con 0, 2 y 3 decimales.
+    """
+
+    def setUp(self):
+        vpos = VPOSCeca.objects.create(
+            name="CECA", bank_name="CECA", type="ceca", environment="testing",
+            merchant_id="123456789", acquirer_bin="0000554000", terminal_id="00000003",
+            encryption_key_testing="12345678")
+        for operation_number, amount, currency in (("OP-EUR", "12.50", "EUR"), ("OP-JPY", "1500", "JPY"),
+                                                   ("OP-KWD", "1.255", "KWD")):
+            VPOSPaymentOperation(
+                amount=Decimal(amount), currency=currency, description="Venta", url_ok="http://testserver/ok",
+                url_nok="http://testserver/nok", operation_number=operation_number, sale_code=operation_number,
+                confirmation_code="REF-{0}".format(operation_number), status="completed", type="ceca",
+                virtual_point_of_sale_id=vpos.id, environment="testing").save()
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _settlement_file(self, lines):
+        path = os.path.join(self.directory, "settlement.csv")
+        with open(path, "wb") as settlement_file:
+            settlement_file.write(b"Fecha;Terminal;Num_operacion;Referencia;Importe\n")
+            for operation_number, amount in lines:
+                settlement_file.write("2018-05-01;00000003;{0};;{1}\n".format(operation_number, amount).encode("latin-1"))
+        return path
+
+    def test_minor_units_follow_the_operation_currency(self):
+        path = self._settlement_file([("OP-EUR", "1250"), ("OP-JPY", "1500"), ("OP-KWD", "1255")])
+
+        report = reconcile_file(path, "ceca")
+
+        self.assertEqual(report.matched, 3)
+        self.assertTrue(report.is_clean)
+
+    def test_amount_mismatches_are_exact(self):
+        path = self._settlement_file([("OP-EUR", "1251"), ("OP-KWD", "1260"), ("OP-JPY", "15,5")])
+
+        report = reconcile_file(path, "ceca")
+
+        self.assertEqual(report.matched, 0)
+        self.assertEqual([mismatch[2:] for mismatch in report.amount_mismatches], [
+            ("OP-EUR", Decimal("12.51"), Decimal("12.50")),
+            ("OP-KWD", Decimal("1.260"), Decimal("1.255")),
+            ("OP-JPY", Decimal("15.5"), Decimal("1500")),
+        ])
+
+    def test_repeated_lines_are_flagged(self):
+        path = self._settlement_file([("OP-EUR", "1250"), ("OP-EUR", "1250"), ("UNKNOWN", "100")])
+
+        report = reconcile_file(path, "ceca", keep_matched=True)
+
+        self.assertEqual(report.matched, 1)
+        self.assertEqual(report.duplicates, [(path, 3, "OP-EUR")])
+        self.assertEqual(report.unmatched, [(path, 4, "UNKNOWN")])
+        self.assertEqual(report.matched_operation_numbers, {"OP-EUR"})
+        self.assertFalse(report.is_clean)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import base64
+import json
+from decimal import Decimal
+
+from django.test import TransactionTestCase
+
+from djangovirtualpos.models import VirtualPointOfSale, VPOSPaymentOperation, VPOSFulfillmentJob
+from djangovirtualpos.models.redsys import VPOSRedsys, redsys_hmac_sha256_signature
+from djangovirtualpos.referencepayment import charge_references
+from tests.models import Sale
+
+
+class ChargeReferencesTest(TransactionTestCase):
+    """
+    Cobro en bloque de pagos por referencia de Redsys. VPOSRedsys.charge_references se sustituye por una función
+    que interpreta (con VPOSRedsys._reference_payment_result) la respuesta de Redsys indicada en RESPONSES.
+    """
+
+    ENCRYPTION_KEY = "sq7HjrUOBfKmC576ILgskD5srU870gJ7"
+
+    def setUp(self):
+        vpos = VPOSRedsys.objects.create(
+            name="Redsys", bank_name="Redsys", type="redsys", environment="testing", merchant_code="999008881",
+            merchant_response_url="https://testserver/payment/confirm/redsys", terminal_id="1",
+            encryption_key_testing_sha256=self.ENCRYPTION_KEY)
+        self.vpos = VirtualPointOfSale.get(id=vpos.id)
+
+        # Código de venta -> función que construye la respuesta de Redsys para su operación (None: error de red)
+        self.responses = {}
+        self.charged = []
+
+        def fake_charge_references(delegated, operations_and_references, workers=None, rate_limiter=None):
+            delegated.__init_encryption_key__()
+            results = {}
+            for operation, reference_number in operations_and_references:
+                self.charged.append((operation.sale_code, reference_number))
+                response = self.responses.get(operation.sale_code, self._signed("0000"))(operation)
+                if response is None:
+                    results[operation.id] = (None, None, None)
+                else:
+                    results[operation.id] = delegated._reference_payment_result(operation, response)
+            return results
+
+        self.original_charge_references = VPOSRedsys.charge_references
+        VPOSRedsys.charge_references = fake_charge_references
+
+    def tearDown(self):
+        VPOSRedsys.charge_references = self.original_charge_references
+
+    ####################################################################
+    ## Respuestas de Redsys
+    def _signed(self, ds_response, signing_order=None):
+        def response(operation):
+            merchant_parameters = base64.b64encode(json.dumps({
+                "Ds_Order": operation.operation_number, "Ds_Response": ds_response}))
+            signature = redsys_hmac_sha256_signature(self.ENCRYPTION_KEY,
+                                                     signing_order or operation.operation_number, merchant_parameters)
+            return {"Ds_SignatureVersion": "HMAC_SHA256_V1", "Ds_MerchantParameters": merchant_parameters,
+                    "Ds_Signature": signature}
+        return response
+
+    def _operation(self, sale_code, operation_number, status="completed"):
+        VPOSPaymentOperation(
+            amount=Decimal("10.00"), description="Venta", url_ok="", url_nok="", operation_number=operation_number,
+            sale_code=sale_code, status=status, type="redsys", virtual_point_of_sale_id=self.vpos.id,
+            environment="testing").save()
+
+    def _charge(self, items, **kwargs):
+        return {result["sale_code"]: result for result in charge_references(self.vpos, items, **kwargs)}
+
+    ####################################################################
+    ## Creación de las operaciones
+    def test_sales_with_an_operation_are_skipped(self):
+        self._operation("S1", "000011112222")
+        results = self._charge([("S1", "REF1", Decimal("10.00")), ("S2", "REF2", Decimal("20.00")),
+                                ("S2", "REF2-DUPLICATED", Decimal("20.00"))])
+
+        self.assertEqual(results["S1"]["status"], "skipped")
+        self.assertEqual(results["S2"]["status"], "completed")
+        # El cobro repetido en el lote no se envía
+        self.assertEqual(self.charged, [("S2", "REF2")])
+        operation = VPOSPaymentOperation.objects.get(sale_code="S2")
+        self.assertEqual(operation.amount_minor, 2000)
+        self.assertEqual(results["S2"]["operation_number"], operation.operation_number)
+
+    def test_interrupted_run_is_resumed_without_charging_twice(self):
+        items = [("S{0}".format(i), "REF{0}".format(i), Decimal("10.00")) for i in range(5)]
+
+        # Primera ejecución interrumpida después del primer lote
+        first_run = charge_references(self.vpos, items, batch_size=2)
+        self.assertEqual([next(first_run)["status"] for _i in range(2)], ["completed", "completed"])
+        first_run.close()
+
+        results = self._charge(items, batch_size=2)
+
+        self.assertEqual([results["S{0}".format(i)]["status"] for i in range(5)],
+                         ["skipped", "skipped", "completed", "completed", "completed"])
+        self.assertEqual(sorted(sale_code for sale_code, _reference in self.charged),
+                         ["S0", "S1", "S2", "S3", "S4"])
+        self.assertEqual(VPOSPaymentOperation.objects.filter(status="completed").count(), 5)
+
+    def test_taken_operation_numbers_are_regenerated(self):
+        self._operation("OTHER", "TAKEN")
+        operation_numbers = iter(["TAKEN", "DUP", "DUP", "NEW"])
+        original_setup_payment = VPOSRedsys.setupPayment
+        VPOSRedsys.setupPayment = lambda delegated, operation_number=None, code_len=12: next(operation_numbers)
+        try:
+            results = self._charge([("S1", "REF1", Decimal("10.00")), ("S2", "REF2", Decimal("10.00"))])
+        finally:
+            VPOSRedsys.setupPayment = original_setup_payment
+
+        # S1 obtiene primero un número ya usado y después el que acaba de tomar S2
+        self.assertEqual(results["S1"]["operation_number"], "NEW")
+        self.assertEqual(results["S2"]["operation_number"], "DUP")
+        self.assertEqual(VPOSPaymentOperation.objects.filter(operation_number="TAKEN").count(), 1)
+
+    ####################################################################
+    ## Resultados
+    def test_results_are_mapped_to_operation_statuses(self):
+        self.responses = {
+            "DENIED": self._signed("0190"),
+            "REPEATED": lambda operation: {"errorCode": "SIS0051"},
+            "UNSIGNED": lambda operation: {"Ds_MerchantParameters": self._signed("0000")(operation)[
+                "Ds_MerchantParameters"]},
+            "BAD-SIGNATURE": self._signed("0000", signing_order="999999999999"),
+            "NETWORK-ERROR": lambda operation: None,
+        }
+        sale_codes = ["PAID", "DENIED", "REPEATED", "UNSIGNED", "BAD-SIGNATURE", "NETWORK-ERROR"]
+        for sale_code in sale_codes:
+            Sale.objects.create(code=sale_code, amount=Decimal("10.00"))
+
+        results = self._charge([(sale_code, "REF", Decimal("10.00")) for sale_code in sale_codes], sale_model=Sale)
+
+        expected = {"PAID": "completed", "DENIED": "failed", "REPEATED": "pending", "UNSIGNED": "pending",
+                    "BAD-SIGNATURE": "pending", "NETWORK-ERROR": "pending"}
+        self.assertEqual({sale_code: result["status"] for sale_code, result in results.items()}, expected)
+        for sale_code, status in expected.items():
+            operation = VPOSPaymentOperation.objects.get(sale_code=sale_code)
+            self.assertEqual(operation.status, status)
+            self.assertEqual(Sale.objects.get(code=sale_code).operation_number, operation.operation_number)
+
+        # Sólo la venta cobrada se confirma
+        self.assertEqual(list(Sale.objects.filter(status="paid").values_list("code", flat=True)), ["PAID"])
+        self.assertEqual(list(VPOSFulfillmentJob.objects.values_list("operation_number", flat=True)),
+                         [results["PAID"]["operation_number"]])
+
+        # El pedido repetido guarda el error de Redsys para resolverlo después consultando su estado
+        repeated = VPOSPaymentOperation.objects.get(sale_code="REPEATED")
+        self.assertIn("SIS0051", repeated.response_code)
+        self.assertEqual(json.loads(repeated.confirmation_data), {"errorCode": "SIS0051"})
+        self.assertIsNone(VPOSPaymentOperation.objects.get(sale_code="NETWORK-ERROR").response_code)
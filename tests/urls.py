@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+from django.conf.urls import url
+from django.http import HttpResponse
+
+from djangovirtualpos.views import confirm_payment
+from tests.models import Sale
+
+urlpatterns = [
+    url(r"^payment/confirm/(?P<virtualpos_type>\w+)$", confirm_payment, {"sale_model": Sale}, name="confirm_payment"),
+    url(r"^payment/ok/(?P<sale_code>\w+)$", lambda request, sale_code: HttpResponse(), name="payment_ok_url"),
+    url(r"^payment/cancel/(?P<sale_code>\w+)$", lambda request, sale_code: HttpResponse(), name="payment_cancel_url"),
+]